@@ -1,10 +1,11 @@
+from typing import *
 import fastapi
 import routers
-from starlette.responses import RedirectResponse
+import sql
+from starlette.responses import RedirectResponse, PlainTextResponse
 
 # TODO
 """ 
-* implement logic for rate limit.
 * add proper error messages to all HTTPExceptions.
 * change token value function to query something else.
 * implement password reset. (very low prio)
@@ -38,3 +39,46 @@ app.include_router(
 async def docs_redirect():
     return RedirectResponse(f"{root_url}/docs")
 
+
+# the metrics endpoints need the metrics_token of the credentials file, see routers.auth.internal
+internal = [fastapi.Depends(routers.auth.internal)]
+
+
+@app.get(f"{root_url}/database/", tags=["Metrics"], dependencies=internal)
+async def database() -> Dict[str, Any]:
+    """
+    the state of the database connection pool and the token cache.
+    """
+    return {**sql.database.pool_status(), "token_cache": sql.tokens.cache.metrics()}
+
+
+@app.get(f"{root_url}/passwords/", tags=["Metrics"], dependencies=internal)
+async def passwords() -> Dict[str, Any]:
+    """
+    the state of the password hasher with histograms of the time spent waiting for and hashing passwords.
+    """
+    return sql.passwords.hasher.metrics()
+
+
+@app.get(f"{root_url}/rate-limits/", tags=["Metrics"], dependencies=internal)
+async def rate_limits() -> Dict[str, Any]:
+    """
+    the state of the rate limiter with the requests not yet written to the database.
+    """
+    return sql.rate_limit.limiter.metrics()
+
+
+@app.get("/metrics", include_in_schema=False, dependencies=internal)
+async def metrics() -> PlainTextResponse:
+    """
+    the metrics of the process server in the prometheus text format.
+    """
+    return PlainTextResponse(await routers.snippet.server.exposition(), media_type="text/plain; version=0.0.4")
+
+
+@app.on_event("shutdown")
+async def close_database() -> None:
+    # the requests taken since the last flush are written before the engine goes away
+    await sql.rate_limit.limiter.flush()
+    await sql.database.async_engine.dispose()
+    sql.passwords.hasher.close()
@@ -0,0 +1 @@
+__all__ = ["spawn", "communicator", "protocol", "login", "load"]
@@ -0,0 +1,73 @@
+"""
+benchmark of the communicators data transfer.
+
+sends blobs of data of different sizes over a local socket pair
+and measures the throughput of send_data and recv_data.
+
+usage: python -m benchmarks.communicator --sizes 1024 1048576 --buffer-sizes 4096 262144
+"""
+from typing import *
+import argparse
+import asyncio
+import logging
+import socket
+from time import perf_counter
+from ignition.common.communicator import Communicator
+from ignition.logger import get_logger
+
+
+logger = get_logger(__name__, logging.WARNING, stdout=True)
+
+default_sizes = [2 ** power for power in range(10, 27, 2)]
+
+
+def setup_sockets() -> Tuple[socket.socket, socket.socket]:
+    """
+    helper function for setting up a connected pair of non blocking sockets.
+    """
+    sender, receiver = socket.socketpair()
+    sender.setblocking(False)
+    receiver.setblocking(False)
+    return sender, receiver
+
+
+async def bench(size: int, buffer_size: int, repeat: int) -> float:
+    """
+    transfers size bytes repeat times and returns the best time for one transfer.
+    """
+    communicator = Communicator(logger, buffer_size=buffer_size)
+    sender, receiver = setup_sockets()
+    payload = bytes(size)
+    best = float("inf")
+    try:
+        for _ in range(repeat):
+            start = perf_counter()
+            _, blob = await asyncio.gather(
+                communicator.send_data(sender, payload),
+                communicator.recv_data(receiver)
+            )
+            best = min(best, perf_counter() - start)
+            assert len(blob) == size
+    finally:
+        sender.close()
+        receiver.close()
+    return best
+
+
+async def main(sizes: List[int], buffer_sizes: List[int], repeat: int) -> None:
+    print(f"{'size (B)':>10} {'buffer (B)':>10} {'time (ms)':>10} {'MB/s':>10}")
+    for size in sizes:
+        for buffer_size in buffer_sizes:
+            best = await bench(size, buffer_size, repeat)
+            print(f"{size:>10} {buffer_size:>10} {best * 1000:>10.3f} {size / best / 1e6:>10.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=default_sizes, help="payload sizes in bytes.")
+    parser.add_argument(
+        "--buffer-sizes", type=int, nargs="+", default=[Communicator.default_buffer_size],
+        help="receive chunk sizes in bytes.")
+    parser.add_argument("--repeat", type=int, default=5, help="transfers per size.")
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.buffer_sizes, args.repeat))
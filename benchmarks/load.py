@@ -0,0 +1,522 @@
+"""
+load test of the execution pipeline.
+
+drives a workload of programs through Server.process or the http api and records the latency percentiles,
+throughput and error rates to a json file. the results can be compared to a saved baseline to catch regressions.
+with the fake execution backend the server, communicator and client protocol are measured without docker.
+
+usage: python main.py bench --backend fake --requests 500 --concurrency 32 --output bench.json
+       python main.py bench --backend fake --rate 200 --baseline bench.json
+       python main.py bench --url http://localhost:8080/ignition/api --token TOKEN --languages python:3 c:1
+"""
+from typing import *
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import math
+import random
+import statistics
+import time
+from pathlib import Path
+from time import perf_counter
+from urllib.parse import urlsplit
+import ignition
+from ignition.common import protocol
+from ignition.common.languages import Languages
+from ignition.server.backends import LocalBackend, FakeBackend
+from ignition.server.scheduler import Overloaded
+from ignition.logger import get_logger
+
+
+logger = get_logger(__name__, logging.WARNING, stdout=True)
+
+# programs writing {size} bytes of output
+programs = {
+    "python": "import sys\nsys.stdout.write('x' * {size})\n",
+    "javascript": "process.stdout.write('x'.repeat({size}))\n",
+    "php": "<?php echo str_repeat('x', {size}); ?>",
+    "c": "#include <stdio.h>\nint main(){for(int i = 0; i < {size}; i++) putchar('x'); return 0;}\n",
+    "cpp": "#include <iostream>\n#include <string>\nint main(){std::cout << std::string({size}, 'x'); return 0;}\n",
+    "go": "package main\nimport (\"fmt\"; \"strings\")\nfunc main(){fmt.Print(strings.Repeat(\"x\", {size}))}\n",
+    "java": "class Main {public static void main(String[] args) {System.out.print(\"x\".repeat({size}));}}\n",
+    "cs": "class Main {static void Main(string[] args) {System.Console.Write(new string('x', {size}));}}\n"
+}
+
+# latency and throughput may be this much worse than the baseline, relative
+default_tolerance = 0.1
+# the error rate may be this much higher than the baseline, absolute
+error_margin = 0.01
+
+
+class Job(NamedTuple):
+    """
+    a request of a load test, a program in language writing size bytes.
+    """
+    language: str
+    size: int
+
+    def request(self) -> protocol.Request:
+        code = programs[self.language].replace("{size}", str(self.size))
+        return {"language": self.language, "code": code, "args": ""}
+
+
+class Sample(NamedTuple):
+    """
+    the outcome of a request, error is None if it succeeded.
+    """
+    language: str
+    latency: float
+    error: Optional[str]
+
+
+class Workload:
+    """
+    the requests of a load test.
+
+    languages maps a language to its weight in the mix and sizes are the output sizes in bytes of the programs,
+    every request picks a language by weight and a size at random.
+
+    with a rate the requests arrive at random at rate requests per second on average (open loop)
+    and at most concurrency of them are sent at once. the latency is measured from the arrival
+    so the time waiting for a free spot counts as well and a slow target can not hide its backlog.
+    without a rate concurrency workers send the requests back to back (closed loop).
+
+    warmup requests are sent before the measured requests and are not recorded.
+    the random choices are seeded so every run of the same workload sends the same requests.
+    """
+    languages: Dict[str, float]
+    sizes: List[int]
+    requests: int
+    concurrency: int
+    rate: Optional[float]
+    warmup: int
+    seed: int
+
+    def __init__(self, languages: Dict[str, float], sizes: List[int], requests: int = 200, concurrency: int = 16,
+                 rate: Optional[float] = None, warmup: int = 10, seed: int = 0) -> None:
+        self.languages = languages
+        self.sizes = sizes
+        self.requests = requests
+        self.concurrency = concurrency
+        self.rate = rate
+        self.warmup = warmup
+        self.seed = seed
+
+    def __repr__(self) -> str:
+        return f"<Workload requests: {self.requests} concurrency: {self.concurrency} rate: {self.rate}>"
+
+    def jobs(self) -> Tuple[List[Job], List[Job], List[float]]:
+        """
+        the warmup jobs, the measured jobs and the arrival time in seconds of every measured job.
+
+        the arrivals are all 0 without a rate.
+        """
+        generator = random.Random(self.seed)
+        languages, weights = zip(*self.languages.items())
+        jobs = [
+            Job(generator.choices(languages, weights)[0], generator.choice(self.sizes))
+            for _ in range(self.warmup + self.requests)
+        ]
+        arrivals = []
+        offset = 0.0
+        for _ in range(self.requests):
+            if self.rate:
+                offset += generator.expovariate(self.rate)
+            arrivals.append(offset)
+        return jobs[:self.warmup], jobs[self.warmup:], arrivals
+
+    def describe(self) -> Dict[str, Any]:
+        """
+        the workload as a json serializable dictionary.
+        """
+        return {
+            "languages": self.languages,
+            "sizes": self.sizes,
+            "requests": self.requests,
+            "concurrency": self.concurrency,
+            "rate": self.rate,
+            "warmup": self.warmup,
+            "seed": self.seed
+        }
+
+
+class Target:
+    """
+    what the requests of a load test are sent to.
+
+    run returns None if the request succeeded or the kind of error.
+    """
+    async def start(self, jobs: Set[Job]) -> None:
+        pass
+
+    async def run(self, job: Job) -> Optional[str]:
+        raise NotImplementedError
+
+    def describe(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def metrics(self) -> Dict[str, Any]:
+        return {}
+
+    async def close(self) -> None:
+        pass
+
+
+class ServerTarget(Target):
+    """
+    sends the requests to Server.process in this process.
+
+    settings are the options the server was created with, they are part of the description of the target.
+    the mean seconds of every phase of a request are taken from the metrics of the server, see Server.exposition.
+    """
+    server: ignition.Server
+    settings: Dict[str, Any]
+
+    def __init__(self, server: ignition.Server, settings: Dict[str, Any]) -> None:
+        self.server = server
+        self.settings = settings
+
+    async def run(self, job: Job) -> Optional[str]:
+        try:
+            status, _ = await self.server.process(job.request())
+        except Overloaded:
+            return "overloaded"
+        return None if status == protocol.Status.success else status.name
+
+    def describe(self) -> Dict[str, Any]:
+        return {"kind": "server", **self.settings}
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "phases": {phase: histogram.mean() for (phase,), histogram in self.server.phases.children.items()},
+            "scheduler": self.server.scheduler.metrics()
+        }
+
+    async def close(self) -> None:
+        self.server.pool.close()
+
+
+class Http:
+    """
+    minimal http/1.1 client for the json endpoints of the api.
+
+    connections are kept alive and reused by the next request. https and chunked responses are not supported.
+    """
+    host: str
+    port: int
+    root: str
+    token: str
+    idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]
+
+    def __init__(self, url: str, token: str) -> None:
+        parts = urlsplit(url)
+        if parts.scheme != "http":
+            raise ValueError(f"only http urls are supported, not '{url}'.")
+        self.host = parts.hostname
+        self.port = parts.port if parts.port else 80
+        self.root = parts.path.rstrip("/")
+        self.token = token
+        self.idle = []
+
+    async def post(self, path: str, body: Any) -> Tuple[int, Any]:
+        """
+        posts body as json to path below the root of the api and returns the status code and the decoded body.
+        """
+        reader, writer = self.idle.pop() if self.idle else await asyncio.open_connection(self.host, self.port)
+        data = json.dumps(body).encode("utf-8")
+        try:
+            writer.write((
+                f"POST {self.root}{path} HTTP/1.1\r\n"
+                f"Host: {self.host}:{self.port}\r\n"
+                f"Authorization: Bearer {self.token}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\n\r\n"
+            ).encode("latin-1") + data)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            payload = await reader.readexactly(int(headers.get("content-length", 0)))
+        except BaseException as e:
+            writer.close()
+            raise e
+        if headers.get("connection", "").lower() == "close":
+            writer.close()
+        else:
+            self.idle.append((reader, writer))
+        return status, json.loads(payload) if payload else None
+
+    def close(self) -> None:
+        for _, writer in self.idle:
+            writer.close()
+        self.idle.clear()
+
+
+class HttpTarget(Target):
+    """
+    sends the requests to the process endpoint of the http api.
+
+    a snippet is created for every distinct job before the load test, the requests then only process snippets.
+    a request fails with the http status code or the status of the process.
+    """
+    http: Http
+    url: str
+    snippets: Dict[Job, str]
+
+    def __init__(self, url: str, token: str) -> None:
+        self.http = Http(url, token)
+        self.url = url
+        self.snippets = {}
+
+    async def start(self, jobs: Set[Job]) -> None:
+        for job in jobs:
+            status, body = await self.http.post("/snippets/", {**job.request(), "deterministic": False})
+            if status != 200:
+                raise RuntimeError(f"creating a snippet failed with {status}: {body}")
+            self.snippets[job] = body["id"]
+
+    async def run(self, job: Job) -> Optional[str]:
+        status, body = await self.http.post("/snippets/process/", {"id": self.snippets[job]})
+        if status != 200:
+            return f"http_{status}"
+        return None if body["status"] == protocol.Status.success.value else protocol.Status(body["status"]).name
+
+    def describe(self) -> Dict[str, Any]:
+        return {"kind": "http", "url": self.url}
+
+    async def close(self) -> None:
+        self.http.close()
+
+
+def percentile(ordered: List[float], rank: float) -> float:
+    """
+    the nearest rank percentile of sorted values, 0 if there are none.
+    """
+    return ordered[max(math.ceil(rank * len(ordered)) - 1, 0)] if ordered else 0
+
+
+def summarize(samples: List[Sample], wall: float) -> Dict[str, Any]:
+    """
+    the latency percentiles in seconds, throughput and error rate of samples.
+
+    the latency and throughput only count successful requests
+    so fast failures like overloaded requests do not make a target look faster.
+    """
+    latencies = sorted(sample.latency for sample in samples if not sample.error)
+    errors = collections.Counter(sample.error for sample in samples if sample.error)
+    return {
+        "requests": len(samples),
+        "throughput": len(latencies) / wall if wall else 0,
+        "error_rate": sum(errors.values()) / len(samples) if samples else 0,
+        "errors": dict(errors),
+        "latency": {
+            "mean": statistics.mean(latencies) if latencies else 0,
+            "p50": percentile(latencies, 0.5),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else 0
+        }
+    }
+
+
+async def drive(workload: Workload, target: Target) -> Dict[str, Any]:
+    """
+    sends the requests of workload to target and summarizes the outcome, in total and per language.
+    """
+    warmup, jobs, arrivals = workload.jobs()
+    await target.start({*warmup, *jobs})
+    semaphore = asyncio.Semaphore(workload.concurrency)
+    samples: List[Sample] = []
+
+    async def send(job: Job, arrived: float, record: bool = True) -> None:
+        async with semaphore:
+            try:
+                error = await target.run(job)
+            except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+                error = type(e).__name__
+        if record:
+            samples.append(Sample(job.language, perf_counter() - arrived, error))
+
+    await asyncio.gather(*(send(job, perf_counter(), False) for job in warmup))
+    start = perf_counter()
+    if workload.rate:
+        tasks = []
+        for job, arrival in zip(jobs, arrivals):
+            await asyncio.sleep(max(start + arrival - perf_counter(), 0))
+            # measured from when the request was due so a late generator does not hide latency
+            tasks.append(asyncio.create_task(send(job, start + arrival)))
+        await asyncio.gather(*tasks)
+    else:
+        queue = iter(jobs)
+
+        async def worker() -> None:
+            for job in queue:
+                await send(job, perf_counter())
+
+        await asyncio.gather(*(worker() for _ in range(workload.concurrency)))
+    wall = perf_counter() - start
+    return {
+        "wall": wall,
+        "total": summarize(samples, wall),
+        "languages": {
+            language: summarize([sample for sample in samples if sample.language == language], wall)
+            for language in sorted({sample.language for sample in samples})
+        }
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any],
+            tolerance: float = default_tolerance) -> List[Tuple[str, float, float, bool]]:
+    """
+    compares the totals of results to those of a baseline.
+
+    returns (metric, baseline, result, regressed) rows. a latency regressed if it is more than tolerance
+    slower, the throughput if it is more than tolerance lower and the error rate if it is more than
+    error_margin higher than in the baseline.
+    """
+    rows = []
+    for name in ("p50", "p95", "p99"):
+        before, after = baseline["total"]["latency"][name], results["total"]["latency"][name]
+        rows.append((f"latency {name} (ms)", before * 1e3, after * 1e3, after > before * (1 + tolerance)))
+    before, after = baseline["total"]["throughput"], results["total"]["throughput"]
+    rows.append(("throughput (req/s)", before, after, after < before * (1 - tolerance)))
+    before, after = baseline["total"]["error_rate"], results["total"]["error_rate"]
+    rows.append(("error rate (%)", before * 100, after * 100, after > before + error_margin))
+    return rows
+
+
+def report(results: Dict[str, Any]) -> None:
+    """
+    prints the summaries of a load test.
+    """
+    print(f"{'language':>12} {'requests':>9} {'req/s':>9} {'errors':>7} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9}")
+    for language, summary in [*results["languages"].items(), ("total", results["total"])]:
+        latency = summary["latency"]
+        print(
+            f"{language:>12} {summary['requests']:>9} {summary['throughput']:>9.1f} "
+            f"{summary['error_rate'] * 100:>6.1f}% {latency['p50'] * 1e3:>9.1f} "
+            f"{latency['p95'] * 1e3:>9.1f} {latency['p99'] * 1e3:>9.1f}"
+        )
+    if errors := results["total"]["errors"]:
+        print("errors", ", ".join(f"{error}: {count}" for error, count in errors.items()))
+
+
+def create_target(args: argparse.Namespace, loop: asyncio.AbstractEventLoop) -> Target:
+    """
+    the target of the arguments, the http api if a url is given otherwise a server with the chosen backend.
+    """
+    if args.url:
+        return HttpTarget(args.url, args.token)
+    backends = {
+        "docker": lambda: None,
+        "local": lambda: LocalBackend(logger=logger, loop=loop),
+        "fake": lambda: FakeBackend(
+            launch_latency=args.launch_latency, run_latency=args.run_latency, logger=logger, loop=loop
+        )
+    }
+    settings = {"backend": args.backend, "queue_size": args.queue_size, "pool_size": args.pool_size}
+    if args.backend == "fake":
+        settings.update(launch_latency=args.launch_latency, run_latency=args.run_latency)
+    # a fixed amount of slots so runs on different hosts or under different load are comparable
+    return ServerTarget(ignition.Server(
+        args.queue_size, logger=logger, loop=loop, pool_min_size=args.pool_size,
+        backend=backends[args.backend](), adaptive=False
+    ), settings)
+
+
+async def main(args: argparse.Namespace) -> bool:
+    """
+    runs the load test and writes the results to the output file.
+
+    returns False if the results regressed compared to the baseline.
+    """
+    workload = Workload(
+        dict(args.languages), args.sizes, requests=args.requests, concurrency=args.concurrency,
+        rate=args.rate, warmup=args.warmup, seed=args.seed
+    )
+    target = create_target(args, asyncio.get_running_loop())
+    try:
+        results = {
+            "created": time.time(),
+            "workload": workload.describe(),
+            "target": target.describe(),
+            **await drive(workload, target),
+            "metrics": target.metrics()
+        }
+    finally:
+        await target.close()
+    report(results)
+    args.output.write_text(json.dumps(results, indent=2))
+    print(f"results written to '{args.output}'.")
+    if not args.baseline:
+        return True
+    baseline = json.loads(args.baseline.read_text())
+    if baseline["workload"] != results["workload"] or baseline["target"] != results["target"]:
+        print("warning: the baseline was recorded with a different workload or target.")
+    print(f"{'compared to ' + str(args.baseline):>32} {'baseline':>10} {'result':>10} {'change':>8}")
+    regressed = False
+    for name, before, after, worse in compare(results, baseline, args.tolerance):
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "-"
+        print(f"{name:>32} {before:>10.2f} {after:>10.2f} {change:>8}{'  REGRESSION' if worse else ''}")
+        regressed = regressed or worse
+    return not regressed
+
+
+def language_weight(value: str) -> Tuple[str, float]:
+    """
+    parses a language:weight argument, the weight defaults to 1.
+    """
+    language, _, weight = value.partition(":")
+    if language not in programs or language not in Languages:
+        raise argparse.ArgumentTypeError(f"no benchmark program for '{language}'.")
+    return language, float(weight) if weight else 1.0
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    adds the arguments of a load test to parser.
+    """
+    parser.add_argument(
+        "--languages", type=language_weight, nargs="+", default=[("python", 1.0)],
+        help="languages of the requests as language:weight.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[16], help="output sizes in bytes of the programs.")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests.")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests sent at once.")
+    parser.add_argument(
+        "--rate", type=float, help="mean arrivals per second, requests are sent back to back without a rate.")
+    parser.add_argument("--warmup", type=int, default=10, help="requests sent before measuring.")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random requests and arrivals.")
+    parser.add_argument(
+        "--backend", type=str, choices=["docker", "local", "fake"], default="fake",
+        help="execution backend of the server.")
+    parser.add_argument("--queue-size", type=int, default=8, help="requests the server runs at once.")
+    parser.add_argument("--pool-size", type=int, default=4, help="containers the server keeps started.")
+    parser.add_argument(
+        "--launch-latency", type=float, default=0.05, help="seconds a fake container takes to start.")
+    parser.add_argument("--run-latency", type=float, default=0.01, help="seconds a fake request takes to run.")
+    parser.add_argument("--url", type=str, help="root url of the http api to test instead of a server.")
+    parser.add_argument("--token", type=str, help="access token for the http api.")
+    parser.add_argument("--output", type=Path, default=Path("bench.json"), help="file the results are written to.")
+    parser.add_argument("--baseline", type=Path, help="results of an earlier run to compare to.")
+    parser.add_argument(
+        "--tolerance", type=float, default=default_tolerance,
+        help="how much slower than the baseline the results may be before they count as a regression.")
+
+
+def run(args: argparse.Namespace) -> int:
+    """
+    runs a load test from parsed arguments and returns the exit code, 1 if it regressed.
+    """
+    if args.url and not args.token:
+        raise SystemExit("--token is required with --url.")
+    return 0 if asyncio.run(main(args)) else 1
+
+
+if __name__ == '__main__':
+    argument_parser = argparse.ArgumentParser()
+    add_arguments(argument_parser)
+    raise SystemExit(run(argument_parser.parse_args()))
@@ -0,0 +1,77 @@
+"""
+benchmark of login throughput under concurrent load.
+
+verifies passwords for concurrent logins either inline on the event loop, like the routers used to,
+or through the bounded thread pool of the hasher. besides the logins per second it measures the lag of
+a ticker on the event loop which is how long every other request, like a container handshake, is stalled.
+
+usage: python -m benchmarks.login --logins 64 --concurrency 1 8 32 --workers 4
+"""
+from typing import *
+import argparse
+import asyncio
+import statistics
+from time import perf_counter
+from sql.passwords import Hasher
+
+
+async def ticker(lags: List[float], interval: float = 0.001) -> None:
+    """
+    sleeps for interval over and over and records how late it wakes up.
+    """
+    while True:
+        start = perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(perf_counter() - start - interval)
+
+
+async def bench(hasher: Hasher, inline: bool, logins: int, concurrency: int) -> Dict[str, float]:
+    """
+    runs logins password verifications with at most concurrency at once.
+    """
+    password_hash = hasher.parameters.hash("password")
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def login() -> None:
+        async with semaphore:
+            start = perf_counter()
+            if inline:
+                hasher.parameters.verify(password_hash, "password")
+            else:
+                await hasher.verify(password_hash, "password")
+            latencies.append(perf_counter() - start)
+
+    lags = []
+    task = asyncio.create_task(ticker(lags))
+    start = perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    wall = perf_counter() - start
+    task.cancel()
+    return {
+        "throughput": logins / wall,
+        "p50": statistics.median(latencies),
+        "lag": max(lags, default=wall),
+    }
+
+
+async def main(logins: int, concurrency: List[int], workers: int) -> None:
+    hasher = Hasher(max_workers=workers, max_pending=logins)
+    print(f"{'mode':>8} {'concurrency':>12} {'logins/s':>10} {'p50 (ms)':>10} {'max lag (ms)':>13}")
+    for count in concurrency:
+        for mode in ("inline", "pool"):
+            result = await bench(hasher, mode == "inline", logins, count)
+            print(
+                f"{mode:>8} {count:>12} {result['throughput']:>10.2f} "
+                f"{result['p50'] * 1e3:>10.1f} {result['lag'] * 1e3:>13.1f}"
+            )
+    hasher.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=64, help="logins per run.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="concurrent logins per run.")
+    parser.add_argument("--workers", type=int, default=4, help="hasher threads.")
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.concurrency, args.workers))
@@ -0,0 +1,69 @@
+"""
+benchmark of the wire formats.
+
+compares the encode and decode cost and the bytes on the wire of
+protocol version 1 (json) and version 2 (binary) for responses of different sizes.
+
+usage: python -m benchmarks.protocol --sizes 16 65536 1048576
+"""
+from typing import *
+import argparse
+import timeit
+from ignition.common import codec, protocol
+from ignition.common.communicator import Communicator
+
+
+def v1_result(status: protocol.Status, response: protocol.Response) -> Tuple[bytes, bytes]:
+    """
+    the frames sent by version 1: the status followed by the json response.
+    """
+    return (
+        status.value.to_bytes(Communicator.default_int_size, "big", signed=False),
+        codec.encode_response_v1(response)
+    )
+
+
+def v2_result(status: protocol.Status, response: protocol.Response) -> bytes:
+    """
+    the frame sent by version 2: a single binary frame.
+    """
+    return codec.encode_result(status, response)
+
+
+def bench(size: int, number: int) -> Dict[str, Tuple[float, float, int]]:
+    """
+    measures encode time, decode time and bytes on the wire for a response with size bytes of stdout.
+    """
+    response: protocol.Response = {"stdout": b"x" * size, "stderr": None, "ns": 123456789}
+    status = protocol.Status.success
+    v1 = v1_result(status, response)
+    v2 = v2_result(status, response)
+    return {
+        "json": (
+            timeit.timeit(lambda: v1_result(status, response), number=number) / number,
+            timeit.timeit(lambda: codec.decode_response_v1(v1[1]), number=number) / number,
+            # the status is sent as is and the response is prefixed with its size
+            len(v1[0]) + Communicator.default_int_size + len(v1[1])
+        ),
+        "binary": (
+            timeit.timeit(lambda: v2_result(status, response), number=number) / number,
+            timeit.timeit(lambda: codec.decode_result(v2), number=number) / number,
+            Communicator.default_int_size + len(v2)
+        )
+    }
+
+
+def main(sizes: List[int], number: int) -> None:
+    print(f"{'size (B)':>10} {'format':>8} {'encode (us)':>12} {'decode (us)':>12} {'wire (B)':>10}")
+    for size in sizes:
+        for name, (encode, decode, wire) in bench(size, number).items():
+            print(f"{size:>10} {name:>8} {encode * 1e6:>12.2f} {decode * 1e6:>12.2f} {wire:>10}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[16, 1024, 65536, 1048576, 16777216], help="stdout sizes in bytes.")
+    parser.add_argument("--number", type=int, default=20, help="repetitions per measurement.")
+    args = parser.parse_args()
+    main(args.sizes, args.number)
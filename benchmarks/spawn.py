@@ -0,0 +1,60 @@
+"""
+benchmark of concurrent container launches.
+
+launches the same amount of containers with different amounts of launcher workers
+to show how concurrent spawns scale.
+
+usage: python -m benchmarks.spawn --containers 16 --workers 1 2 4 8 16
+"""
+from typing import *
+import argparse
+import asyncio
+import logging
+import statistics
+from time import perf_counter
+import docker
+from ignition.server.launcher import ContainerLauncher
+from ignition.logger import get_logger
+
+
+logger = get_logger(__name__, logging.WARNING, stdout=True)
+
+
+async def bench(containers: int, workers: int) -> Dict[str, float]:
+    """
+    launches containers with a launcher using workers threads.
+
+    the containers only run a noop so the time measured is the docker round trip.
+    """
+    launcher = ContainerLauncher(docker.from_env(), max_workers=workers, logger=logger)
+    start = perf_counter()
+    await asyncio.gather(*(
+        launcher.launch(command=["python", "-c", "pass"]) for _ in range(containers)
+    ))
+    wall = perf_counter() - start
+    launcher.close()
+    latencies = [latency for _, latency in launcher.latencies]
+    return {
+        "wall": wall,
+        "throughput": containers / wall,
+        "p50": statistics.median(latencies),
+        "max": max(latencies),
+    }
+
+
+async def main(containers: int, workers: List[int]) -> None:
+    print(f"{'workers':>8} {'wall (s)':>10} {'spawns/s':>10} {'p50 (s)':>10} {'max (s)':>10}")
+    for count in workers:
+        result = await bench(containers, count)
+        print(
+            f"{count:>8} {result['wall']:>10.3f} {result['throughput']:>10.2f} "
+            f"{result['p50']:>10.3f} {result['max']:>10.3f}"
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--containers", type=int, default=16, help="containers launched per run.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="launcher workers per run.")
+    args = parser.parse_args()
+    asyncio.run(main(args.containers, args.workers))
@@ -1,5 +1,7 @@
 from .client.client import Client
+from .agent.agent import Agent
 from .server.server import Server
+from .server.ipc import RemoteServer
 from .logger import get_logger
 
-__all__ = ["client", "server", "common", "get_logger"]
+__all__ = ["client", "server", "agent", "common", "get_logger"]
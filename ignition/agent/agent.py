@@ -0,0 +1,113 @@
+from typing import *
+import os
+import socket
+import asyncio
+import logging
+from ..common.communicator import Communicator
+from ..common import protocol
+from .executors import Executor
+from ..logger import get_logger
+
+
+def setup_socket() -> socket.socket:
+    """
+    helper function for setting up the tcp socket.
+    """
+    sock = socket.socket()
+    sock.setblocking(False)
+    return sock
+
+
+class Agent:
+    """
+    runs requests for a server on another machine.
+
+    the agent opens one connection to the server per slot and runs one request at a time on each.
+    every connection starts with a hello naming the node and the languages it can run.
+    the amount of slots is the amount of requests the node advertises it can run at once.
+
+    a connection that is lost is reconnected after retry_interval seconds
+    so a restarted server gets the node back on its own.
+
+    secret is sent in every hello and has to match the node_secret of the server.
+    the agent runs whatever the server sends so it should only connect to a server it trusts.
+    """
+    executor: Executor
+    communicator: Communicator
+    loop: asyncio.AbstractEventLoop
+    logger: logging.Logger
+
+    host: str
+    port: int
+    name: str
+    slots: int
+    warm: List[str]
+    secret: Optional[str]
+    retry_interval: float
+
+    def __init__(self, executor: Executor,
+                 host: str,
+                 port: int = 6091,
+                 name: Optional[str] = None,
+                 slots: int = 4,
+                 warm: Optional[List[str]] = None,
+                 secret: Optional[str] = None,
+                 retry_interval: float = 1,
+                 logger: Optional[logging.Logger] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self.executor = executor
+        self.loop = loop if loop else asyncio.get_event_loop()
+        self.logger = logger if logger else get_logger(__name__, logging.WARNING, stdout=True)
+        self.communicator = Communicator(self.logger, self.loop)
+
+        self.host = host
+        self.port = port
+        # several agents can run on one machine while testing
+        self.name = name if name else f"{socket.gethostname()}-{os.getpid()}"
+        self.slots = slots
+        self.warm = warm if warm else []
+        self.secret = secret
+        self.retry_interval = retry_interval
+
+    async def run(self) -> None:
+        """
+        connects all slots to the server and serves requests until cancelled.
+        """
+        self.logger.info(f"agent '{self.name}' serving {self.slots} slots for {self.host}:{self.port}...")
+        await asyncio.gather(*(self._slot(index) for index in range(self.slots)))
+
+    async def _slot(self, index: int) -> None:
+        """
+        keeps a slot connected to the server.
+        """
+        while True:
+            connection = setup_socket()
+            try:
+                await self.loop.sock_connect(connection, (self.host, self.port))
+                await self.communicator.send_hello(connection, {
+                    "node": self.name, "languages": self.executor.languages,
+                    "warm": self.warm, "version": protocol.version, "secret": self.secret
+                })
+                self.logger.debug(f"slot {index} connected.")
+                await self._serve(connection)
+            except (ConnectionError, OSError, ValueError) as e:
+                self.logger.warning(f"slot {index} lost its connection ({e}). reconnecting...")
+            finally:
+                connection.close()
+            await asyncio.sleep(self.retry_interval)
+
+    async def _serve(self, connection: socket.socket) -> None:
+        """
+        runs the requests received on a connection one at a time.
+
+        a streamed request has its output sent in chunks as it is produced.
+        """
+        while True:
+            request, version = await self.communicator.recv_request(connection)
+
+            async def output(stream: protocol.Stream, data: bytes) -> None:
+                await self.communicator.send_chunk(connection, stream, data, version)
+
+            streaming = request.get("stream") and version >= 2
+            status, response = await self.executor.run(request, output if streaming else None)
+            await self.communicator.send_result(connection, status, response, version)
@@ -0,0 +1,99 @@
+from typing import *
+import asyncio
+import tempfile
+from pathlib import Path
+from uuid import uuid4
+from ..common import protocol
+from ..common.languages import Languages, Capture, Output, execute, execute_cases, execute_benchmark, watch_usage
+from ..server.scheduler import Overloaded
+if TYPE_CHECKING:
+    from ..server.server import Server
+
+
+Result = Tuple[protocol.Status, Optional[protocol.Response]]
+
+
+class Executor:
+    """
+    runs the requests an agent receives.
+
+    output is given if the request is streamed and is called with the output as it is produced.
+    """
+    languages: List[str] = list(Languages.languages)
+
+    async def run(self, request: protocol.Request, output: Optional[Output] = None) -> Result:
+        raise NotImplementedError
+
+
+class ServerExecutor(Executor):
+    """
+    runs requests in containers through a server on the node.
+    """
+    server: "Server"
+
+    def __init__(self, server: "Server") -> None:
+        self.server = server
+
+    async def run(self, request: protocol.Request, output: Optional[Output] = None) -> Result:
+        """
+        runs a request in a container.
+
+        a request rejected by the overloaded server gets the status service_unavailable.
+        """
+        try:
+            if not output:
+                return await self.server.process(request)
+            async for item in self.server.stream(request):
+                if isinstance(item[0], protocol.Status):
+                    return item
+                await output(*item)
+        except Overloaded:
+            return protocol.Status.service_unavailable, None
+        return protocol.Status.internal_server_error, None
+
+
+class LocalExecutor(Executor):
+    """
+    runs requests directly on the node without containers.
+
+    programs are not isolated in any way so this is only meant as a stand in
+    for running several agents on a single machine while testing.
+    the resource usage of the programs is measured like in the client.
+    """
+    timeout: float
+
+    def __init__(self, timeout: float = 30) -> None:
+        self.timeout = timeout
+        watch_usage()
+
+    async def run(self, request: protocol.Request, output: Optional[Output] = None) -> Result:
+        """
+        builds and runs a request in a temporary directory.
+
+        a request with cases or a benchmark is built once and run repeatedly within the same timeout.
+        """
+        if (language := request["language"]) not in Languages:
+            return protocol.Status.not_implemented, None
+        with tempfile.TemporaryDirectory() as tempdir:
+            script_path = Path(tempdir).joinpath(f"{uuid4()}.{language}")
+            script_path.write_text(request["code"])
+            build_path = Path(tempdir).joinpath("build")
+            build_path.mkdir()
+            try:
+                if request.get("cases"):
+                    return protocol.Status.success, await execute_cases(
+                        Languages[language](script_path, build_path), request["cases"],
+                        request.get("limits"), self.timeout
+                    )
+                if request.get("benchmark"):
+                    return protocol.Status.success, await execute_benchmark(
+                        Languages[language](script_path, build_path), request["args"], request["benchmark"],
+                        request.get("limits"), self.timeout
+                    )
+                response = await asyncio.wait_for(execute(
+                    Languages[language](script_path, build_path), request["args"],
+                    Capture(output, request.get("limits"))
+                ), self.timeout)
+            except asyncio.TimeoutError:
+                return protocol.Status.timeout, None
+        return protocol.Status.success, response
@@ -2,10 +2,21 @@ import logging
 from typing import *
 from ..common.communicator import Communicator
 from ..common import protocol
-from ..common.languages import Languages
+from ..common.languages import (
+    Languages, Capture, process, execute, execute_cases, execute_benchmark, warmups, watch_usage
+)
+from .standby import Standby
 import socket
+import os
+import io
 import asyncio
+import shutil
+import signal
+import ctypes
+import time
+import tarfile
 from pathlib import Path
+from time import perf_counter_ns
 import tempfile
 from uuid import uuid4
 from ..logger import get_logger
@@ -23,6 +34,56 @@ def setup_socket() -> socket.socket:
     return sock
 
 
+PR_SET_CHILD_SUBREAPER = 36
+
+
+def become_subreaper() -> bool:
+    """
+    makes the orphaned descendants of this process its children instead of children of init.
+
+    a program that daemonizes can then still be found among the descendants of the client.
+    only supported on linux, returns False elsewhere. in a container the client is init anyway.
+    """
+    try:
+        return ctypes.CDLL(None, use_errno=True).prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0) == 0
+    except (OSError, AttributeError):
+        return False
+
+
+def descendants(pid: int) -> Set[int]:
+    """
+    the pids of every process descending from the process pid, read from /proc.
+    """
+    children: Dict[int, List[int]] = {}
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = entry.joinpath("stat").read_text()
+        except OSError:
+            continue
+        # the command name in parentheses can contain spaces, the parent pid is the second field after it
+        children.setdefault(int(stat[stat.rindex(")") + 2:].split()[1]), []).append(int(entry.name))
+    found: Set[int] = set()
+    pending = [pid]
+    while pending:
+        for child in children.get(pending.pop(), ()):
+            if child not in found:
+                found.add(child)
+                pending.append(child)
+    return found
+
+
+def snapshot(directory: Path) -> Dict[Path, bytes]:
+    """
+    the content of every file in a directory by its path relative to the directory.
+    """
+    return {
+        path.relative_to(directory): path.read_bytes()
+        for path in directory.rglob("*") if path.is_file() and not path.is_symlink()
+    }
+
+
 class Client:
     """
     ignition execution client.
@@ -32,49 +93,286 @@ class Client:
 
     the request is then process and a response is sent back.
 
+    the container might be started ahead of time by the servers container pool.
+    while waiting for a request the client warms up the language given in the
+    IGNITION_LANGUAGE environment variable.
+
+    the server gives every container a token in the IGNITION_TOKEN environment variable
+    which is sent back in the hello so the server knows which container connected.
+
+    if IGNITION_STANDBY is set the interpreter of an interpreted language is started
+    during the warmup and the program is run in it instead of in a new interpreter.
+
+    the client connects to the server at IGNITION_HOST and IGNITION_PORT, by default the docker host,
+    and looks for cached artifacts in IGNITION_CACHE so it can run outside of docker as well.
+
+    the subprocesses of the client are reaped by the usage watcher so the response has their resource usage.
+
+    a container can run several requests of a batch so everything a request leaves behind is removed
+    before the next request, see reset.
+
     after the client dies so should the process and docker container.
     """
     loop: asyncio.AbstractEventLoop
     communicator: Communicator
     sock: socket.socket
     connected: bool
+    language: Optional[str]
+    token: Optional[str]
+    host: str
+    port: int
+    cache_directory: Path
+    directory: Path
+    standby: Optional[Standby]
+    standby_started: Optional["asyncio.Task[None]"]
+    projects: Dict[Path, Dict[Path, bytes]]
+    prepared: Tuple[Path, ...] = (Path("/cs"),)
+    reset_attempts = 50
     process_timeout = 30
+    case_timeout = 10
+    max_artifact_size = 16 * 1024 * 1024
+    default_limits: protocol.Limits = {"stdout": 1024 * 1024, "stderr": 1024 * 1024, "kill": True}
 
     def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
         self.loop = loop if loop else asyncio.get_event_loop()
         self.communicator = Communicator(logger, self.loop)
         self.sock = setup_socket()
         self.connected = False
+        self.language = os.environ.get("IGNITION_LANGUAGE")
+        self.token = os.environ.get("IGNITION_TOKEN")
+        # domain name set by docker. will error if run outside of docker without IGNITION_HOST.
+        self.host = os.environ.get("IGNITION_HOST", "host.docker.internal")
+        self.port = int(os.environ.get("IGNITION_PORT", 6090))
+        self.cache_directory = Path(os.environ.get("IGNITION_CACHE", "/cache"))
+        self.directory = Path(tempfile.mkdtemp(prefix="ignition-"))
+        self.standby = Standby(self.language) if (
+            os.environ.get("IGNITION_STANDBY") and Standby.supports(self.language)
+        ) else None
+        self.standby_started = None
+        self.projects = {path: snapshot(path) for path in self.prepared if path.is_dir()}
+        become_subreaper()
+        watch_usage()
+
+    async def warmup(self) -> None:
+        """
+        warms up the toolchain of the language the container was started for.
+
+        failures are ignored since warming up is only an optimization.
+
+        the standby interpreter is started instead if the client has one.
+        """
+        if self.standby:
+            logger.info(f"starting standby interpreter for '{self.language}'...")
+            self.standby_started = self.loop.create_task(self.standby.start())
+            return
+        if self.language not in warmups:
+            return
+        try:
+            logger.info(f"warming up '{self.language}'...")
+            await process(warmups[self.language])
+        except OSError as e:
+            logger.warning(f"warming up '{self.language}' failed: {e}")
 
     async def handle_connection(self, connection: socket.socket) -> None:
         """
         processing of requests.
 
-        receives a reqeust from the server to process.
+        receives a request from the server and processes it.
+        from protocol version 3 the server can send another request of the same batch after the result
+        so requests are processed until the server closes the connection.
+        the container is reset before every request but the first.
+        """
+        handled = 0
+        while True:
+            try:
+                request, version = await self.communicator.recv_request(connection)
+            except ConnectionError as e:
+                if not handled:
+                    raise e
+                logger.info(f"connection closed after {handled} requests.")
+                return
+            if handled:
+                await self.reset()
+            await self.handle_request(connection, request, version)
+            handled += 1
+            if version < 3:
+                return
+
+    async def handle_request(self, connection: socket.socket, request: protocol.Request, version: int) -> None:
+        """
+        processes a single request.
+
         the requests' language is checked against the supported languages.
         if its supported the source is written to a file and passed down to the Language process method.
 
         a failed request will only send a status back to the server.
         a successful request will send a status followed by a response.
+        the result is sent with the same protocol version the request was received with.
+
+        a request asking for streaming has its output sent in chunks as it is produced
+        and the response is sent without any output.
+
+        the output is limited by the limits in the request or default_limits if the request has none.
+
+        a request with an artifact key for a compiled language is cached by the server.
+        if the artifact is cached it is extracted from the read only cache directory and the build is skipped.
+        otherwise the build directory is sent back as a gzipped tar after a successful build.
+
+        a program in the language of the standby interpreter is run in the standby interpreter.
+
+        a request with cases is built once and run for every case, see execute_cases.
+        the build and the cases together have process_timeout seconds and a case case_timeout seconds
+        unless it has a shorter timeout.
+
+        a request with a benchmark is built once and run repeatedly within process_timeout seconds,
+        see execute_benchmark. the time left after the build bounds how many iterations are run.
+
+        the response has the time spent in each phase, see protocol.Response.
         """
-        request = await self.communicator.recv_request(connection)
+        async def output(stream: protocol.Stream, data: bytes) -> None:
+            await self.communicator.send_chunk(connection, stream, data, version)
+
+        streaming = request.get("stream") and version >= 2
         if (language := request["language"]) in Languages:
-            with tempfile.TemporaryDirectory() as tempdir:
+            start = perf_counter_ns()
+            with tempfile.TemporaryDirectory(dir=self.directory) as tempdir:
                 script_path = Path(tempdir).joinpath(f"{str(uuid4())}.{language}")
                 with open(script_path, "w") as script:
                     script.write(request["code"])
+                build_path = Path(tempdir).joinpath("build")
+                build_path.mkdir()
+                procedure = Languages[language](script_path, build_path)
+                artifact = request.get("artifact") if procedure.build else None
+
+                async def on_built() -> None:
+                    if artifact and not request.get("cached") and version >= 2:
+                        data = await self.loop.run_in_executor(None, self.pack, build_path)
+                        if len(data) <= self.max_artifact_size:
+                            await self.communicator.send_chunk(connection, protocol.Stream.artifact, data, version)
+
                 try:
-                    response: protocol.Response = await asyncio.wait_for(
-                        Languages[language](script_path, request["args"]),
-                        self.process_timeout
-                    )
-                    await self.communicator.send_status(connection, protocol.Status.success)
-                    await self.communicator.send_response(connection, response)
+                    built = bool(artifact and request.get("cached") and await self.loop.run_in_executor(
+                        None, self.unpack, self.cache_directory.joinpath(f"{artifact}.tar.gz"), build_path
+                    ))
+                    limits = {**self.default_limits, **request.get("limits", {})}
+                    setup = perf_counter_ns() - start
+                    if request.get("cases"):
+                        response = await execute_cases(
+                            procedure, request["cases"], limits,
+                            self.process_timeout, self.case_timeout, built, on_built
+                        )
+                    elif request.get("benchmark"):
+                        response = await execute_benchmark(
+                            procedure, request["args"], request["benchmark"], limits,
+                            self.process_timeout, built, on_built
+                        )
+                    else:
+                        capture = Capture(output if streaming else None, limits)
+                        response: protocol.Response = await asyncio.wait_for(
+                            self.standby.run(script_path, request["args"], capture)
+                            if await self.standby_ready(language) else
+                            execute(procedure, request["args"], capture, built, on_built),
+                            self.process_timeout
+                        )
+                    response["phases"] = {"setup": setup, **response.get("phases", {})}
+                    await self.communicator.send_result(connection, protocol.Status.success, response, version)
 
                 except asyncio.TimeoutError:
-                    await self.communicator.send_status(connection, protocol.Status.timeout)
+                    await self.communicator.send_result(connection, protocol.Status.timeout, None, version)
         else:
-            await self.communicator.send_status(connection, protocol.Status.not_implemented)
+            await self.communicator.send_result(connection, protocol.Status.not_implemented, None, version)
+
+    async def reset(self) -> None:
+        """
+        removes everything the earlier requests of a connection left behind.
+
+        the standby interpreter is stopped since an earlier program could have tampered with it.
+        see clean for the rest.
+        """
+        if self.standby_started:
+            started, self.standby_started = self.standby_started, None
+            started.cancel()
+            await asyncio.gather(started, return_exceptions=True)
+        if self.standby:
+            self.standby.close()
+        await self.loop.run_in_executor(None, self.clean)
+
+    def clean(self) -> None:
+        """
+        kills every descendant of the client, empties the working directory
+        and restores the prepared projects to how they were when the client started.
+
+        the client is the subreaper of its descendants so daemons are killed and reaped as well.
+        """
+        for _ in range(self.reset_attempts):
+            if not (leftover := descendants(os.getpid())):
+                break
+            for pid in leftover:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except (ProcessLookupError, PermissionError):
+                    pass
+            time.sleep(0.01)
+            for pid in leftover:
+                try:
+                    os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    # not a child yet or reaped by the usage watcher
+                    pass
+        else:
+            logger.warning(f"processes {sorted(leftover)} survived the reset.")
+        for path in self.directory.iterdir():
+            if path.is_dir() and not path.is_symlink():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink()
+        for directory, files in self.projects.items():
+            shutil.rmtree(directory, ignore_errors=True)
+            for path, content in files.items():
+                directory.joinpath(path).parent.mkdir(parents=True, exist_ok=True)
+                directory.joinpath(path).write_bytes(content)
+
+    async def standby_ready(self, language: str) -> bool:
+        """
+        checks if the program can be run in the standby interpreter.
+
+        waits for the standby interpreter to finish starting. an interpreter that failed to start is not used.
+        the interpreter runs a single program so only the first request of a connection can use it.
+        """
+        if not self.standby or self.standby.language != language or not self.standby_started:
+            return False
+        started, self.standby_started = self.standby_started, None
+        try:
+            await started
+            return True
+        except OSError as e:
+            logger.warning(f"standby interpreter for '{language}' failed to start: {e}")
+            return False
+
+    @staticmethod
+    def pack(directory: Path) -> bytes:
+        """
+        packs the content of a directory into a gzipped tar.
+        """
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+            archive.add(directory, arcname=".")
+        return buffer.getvalue()
+
+    @staticmethod
+    def unpack(artifact: Path, directory: Path) -> bool:
+        """
+        extracts a cached artifact into a directory.
+
+        returns False if the artifact could not be extracted, the program then has to be built.
+        """
+        try:
+            with tarfile.open(artifact, mode="r:gz") as archive:
+                archive.extractall(directory)
+            return True
+        except (OSError, tarfile.TarError) as e:
+            logger.warning(f"failed to extract artifact '{artifact}': {e}")
+            return False
 
     async def run(self) -> None:
         """
@@ -83,18 +381,22 @@ class Client:
         attempts to connect to the server. if any error occurs the error is logged.
         the errors if they occur should mostly be about connection errors.
 
-        passes the connection to the handle function
+        sends a hello to let the server know which container connected and which language it is warmed up for
+        and passes the connection to the handle function while the language is warming up.
         """
         logger.info("client running...")
         try:
             connection = setup_socket()
-            # domain name set by docker. will error if run outside of docker.
-            hostname = "host.docker.internal"
-            port = 6090
-            logger.info(f"attempting to connect to {hostname}:{port}")
-            await self.loop.sock_connect(connection, (hostname, port))
-            await self.handle_connection(connection)
+            logger.info(f"attempting to connect to {self.host}:{self.port}")
+            await self.loop.sock_connect(connection, (self.host, self.port))
+            await self.communicator.send_hello(connection, {
+                "token": self.token, "language": self.language, "version": protocol.version
+            })
+            await asyncio.gather(self.warmup(), self.handle_connection(connection))
         except Exception as e:
             logger.critical(e)
         finally:
+            if self.standby:
+                self.standby.close()
+            shutil.rmtree(self.directory, ignore_errors=True)
             self.sock.close()
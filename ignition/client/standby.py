@@ -0,0 +1,131 @@
+from typing import *
+import os
+import json
+import asyncio
+from pathlib import Path
+from time import perf_counter_ns
+from ..common.protocol import Response
+from ..common.languages import Capture, collect, create_result, create_step, spawn, watcher
+
+
+# every bootstrap reads the program and its arguments as a json list from the control file descriptor
+# and runs the program the same way the interpreters own command line would.
+# the frames of the bootstrap and runpy are left out of uncaught tracebacks
+# so they start in the program just like when it is run as a script.
+python = """
+import os, sys, json, runpy
+job = json.loads(os.fdopen(int(sys.argv.pop()), "r").read())
+sys.argv = job
+sys.path[0] = os.path.dirname(job[0])
+def excepthook(kind, value, tb):
+    while tb is not None and tb.tb_frame.f_code.co_filename != job[0]:
+        tb = tb.tb_next
+    sys.__excepthook__(kind, value.with_traceback(tb), tb)
+sys.excepthook = excepthook
+runpy.run_path(job[0], run_name="__main__")
+"""
+
+javascript = """
+const job = JSON.parse(require("fs").readFileSync(Number(process.argv.pop()), "utf-8"));
+process.argv.splice(1, process.argv.length, ...job);
+require("module").runMain();
+"""
+
+
+def commands(language: str, control: int) -> Optional[List[str]]:
+    """
+    the command starting a standby interpreter for language.
+    """
+    if language == "python":
+        return ["python3", "-c", python, str(control)]
+    if language == "javascript":
+        return ["node", "-e", javascript, str(control)]
+    return None
+
+
+class Standby:
+    """
+    an interpreter started ahead of time waiting for a program to run.
+
+    every request runs in a fresh container so the interpreter is started while the client waits
+    for its request and pays the startup cost of the interpreter before the request arrives.
+    the interpreter blocks on a control pipe until it is sent the path and arguments of the program.
+
+    the output is captured the same way as in shell and only the program itself is timed.
+    a standby interpreter runs one program.
+
+    only languages that can run a program as their main program from a bootstrap are supported.
+    php includes the program in the bootstrap which shows in its stack traces and $_SERVER
+    and deno imports it as a module where import.meta.main is false, so they are run by shell instead.
+
+    the run is reported as a single step named after the interpreter and the program.
+    its resource usage includes starting the interpreter since that is the same process.
+    """
+    language: str
+    interpreter: Optional[str]
+    subprocess: Optional[asyncio.subprocess.Process]
+    control: Optional[int]
+
+    def __init__(self, language: str) -> None:
+        self.language = language
+        self.interpreter = None
+        self.subprocess = None
+        self.control = None
+
+    @staticmethod
+    def supports(language: Optional[str]) -> bool:
+        """
+        checks if language can be run in a standby interpreter.
+        """
+        return language in ("python", "javascript")
+
+    async def start(self) -> None:
+        """
+        starts the interpreter.
+        """
+        read, self.control = os.pipe()
+        try:
+            command = commands(self.language, read)
+            self.interpreter = command[0]
+            self.subprocess = await spawn(
+                *command,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, pass_fds=(read,)
+            )
+        except BaseException as e:
+            os.close(self.control)
+            self.control = None
+            raise e
+        finally:
+            os.close(read)
+
+    async def run(self, file: Path, sys_args: str, capture: Optional[Capture] = None) -> Response:
+        """
+        runs a program in the interpreter.
+
+        the arguments are split on whitespace just like the commands in shell.
+        """
+        if not self.subprocess or self.control is None:
+            raise RuntimeError(f"standby interpreter for '{self.language}' is not running.")
+        start = perf_counter_ns()
+        os.write(self.control, json.dumps([str(file), *sys_args.split()]).encode("utf-8"))
+        os.close(self.control)
+        self.control = None
+        captured = await collect(self.subprocess, capture)
+        end = perf_counter_ns()
+        return {
+            **create_result(captured, end - start, capture),
+            "phases": {"compile": 0, "run": end - start},
+            "steps": [create_step(f"{self.interpreter} {file} {sys_args}", captured, end - start)]
+        }
+
+    def close(self) -> None:
+        """
+        stops the interpreter if it did not run a program.
+        """
+        if self.control is not None:
+            os.close(self.control)
+            self.control = None
+        if self.subprocess and self.subprocess.returncode is None:
+            self.subprocess.kill()
+            # drops the usage report of the interpreter
+            watcher.take(self.subprocess.pid)
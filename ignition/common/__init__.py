@@ -1 +1 @@
-__all__ = ["communicator", "protocol", "languages"]
+__all__ = ["communicator", "protocol", "languages", "codec", "metrics"]
@@ -0,0 +1,241 @@
+from typing import *
+import json
+import struct
+from . import protocol
+
+
+class Kind:
+    """
+    the kind of message a binary frame holds.
+    """
+    request = 1
+    result = 2
+    chunk = 3
+
+
+class Flags:
+    """
+    bit flags of a binary result frame.
+    """
+    response = 1
+
+
+# version, kind, language size, args size, code size, extra size
+request_header = struct.Struct("!BBHIII")
+# version, kind, flags, status, ns, stdout size, stderr size, extra size
+# a stream size of -1 means the stream is None
+result_header = struct.Struct("!BBBHQqqI")
+# version, kind, stream
+chunk_header = struct.Struct("!BBB")
+
+request_fields = ("language", "args", "code")
+response_fields = ("stdout", "stderr", "ns")
+
+
+class DecodeError(ValueError):
+    """
+    raised when a frame can not be decoded.
+    """
+
+
+def version_of(blob: Union[bytes, bytearray]) -> int:
+    """
+    detects the protocol version of a frame.
+
+    version 1 frames are json objects and always start with '{'.
+    binary frames start with their version number.
+    """
+    if not blob:
+        raise DecodeError("empty frame.")
+    return 1 if blob[0] == ord("{") else blob[0]
+
+
+def kind_of(blob: Union[bytes, bytearray]) -> int:
+    """
+    the kind of message a binary frame holds.
+    """
+    if version_of(blob) < 2:
+        raise DecodeError("version 1 frames have no kind.")
+    return blob[1]
+
+
+def encode_extra(message: Mapping[str, Any], fields: Tuple[str, ...]) -> bytes:
+    """
+    json encodes every key in message that does not have a dedicated binary field.
+    """
+    extra = {key: value for key, value in message.items() if key not in fields}
+    return json.dumps(extra).encode("utf-8") if extra else b""
+
+
+def encode_cases(cases: List[protocol.CaseResult]) -> Tuple[List[Dict[str, Any]], bytes]:
+    """
+    separates the output of case results from the rest of the results.
+
+    the output of all cases is joined as raw bytes and every result gets the size of each of its streams
+    instead, -1 if the stream is None.
+    """
+    results = []
+    blobs = []
+    for case in cases:
+        result = {key: value for key, value in case.items() if key not in ("stdout", "stderr")}
+        for stream in ("stdout", "stderr"):
+            result[f"{stream}_size"] = len(case[stream]) if case[stream] is not None else -1
+            blobs.append(case[stream] if case[stream] else b"")
+        results.append(result)
+    return results, b"".join(blobs)
+
+
+def decode_cases(results: List[Dict[str, Any]], view: memoryview) -> List[protocol.CaseResult]:
+    """
+    puts the output encoded with encode_cases back into the case results.
+    """
+    offset = 0
+    for result in results:
+        for stream in ("stdout", "stderr"):
+            size = result.pop(f"{stream}_size")
+            result[stream] = bytes(view[offset:offset + size]) if size >= 0 else None
+            offset += max(size, 0)
+    return results
+
+
+def encode_request(request: protocol.Request, version: int = protocol.version) -> bytes:
+    """
+    encodes a request.
+
+    version 1 is a json object.
+    version 2 is a header followed by the language, args and code as utf-8
+    and a json object with any other keys.
+    """
+    if version == 1:
+        return json.dumps(request).encode("utf-8")
+    language = request["language"].encode("utf-8")
+    args = request["args"].encode("utf-8")
+    code = request["code"].encode("utf-8")
+    extra = encode_extra(request, request_fields)
+    return b"".join((
+        request_header.pack(version, Kind.request, len(language), len(args), len(code), len(extra)),
+        language, args, code, extra
+    ))
+
+
+def decode_request(blob: Union[bytes, bytearray]) -> Tuple[protocol.Request, int]:
+    """
+    decodes a request of any supported version.
+
+    returns the request and the version it was encoded with.
+    """
+    if (version := version_of(blob)) == 1:
+        return json.loads(blob), version
+    if version > protocol.version:
+        raise DecodeError(f"unsupported protocol version {version}.")
+    _, kind, *sizes = request_header.unpack_from(blob)
+    if kind != Kind.request:
+        raise DecodeError(f"expected a request frame but got kind {kind}.")
+    view = memoryview(blob)
+    offset = request_header.size
+    values = []
+    for size in sizes:
+        values.append(str(view[offset:offset + size], "utf-8"))
+        offset += size
+    language, args, code, extra = values
+    request: protocol.Request = json.loads(extra) if extra else {}
+    request.update({"language": language, "args": args, "code": code})
+    return request, version
+
+
+def encode_result(status: protocol.Status, response: Optional[protocol.Response],
+                  version: int = protocol.version) -> bytes:
+    """
+    encodes the status and response of a processed request in a single frame.
+
+    only used from version 2. stdout and stderr are sent as raw bytes.
+    from version 4 the output of the cases is sent as raw bytes after the extra, see encode_cases.
+    """
+    if not response:
+        return result_header.pack(version, Kind.result, 0, status.value, 0, -1, -1, 0)
+    stdout = response["stdout"]
+    stderr = response["stderr"]
+    cases = b""
+    if response.get("cases") is not None:
+        results, cases = encode_cases(response["cases"])
+        response = {**response, "cases": results}
+    extra = encode_extra(response, response_fields)
+    return b"".join((
+        result_header.pack(
+            version, Kind.result, Flags.response, status.value, response["ns"],
+            len(stdout) if stdout is not None else -1,
+            len(stderr) if stderr is not None else -1,
+            len(extra)
+        ),
+        stdout if stdout else b"", stderr if stderr else b"", extra, cases
+    ))
+
+
+def decode_result(blob: Union[bytes, bytearray]) -> Tuple[protocol.Status, Optional[protocol.Response]]:
+    """
+    decodes a frame encoded with encode_result.
+    """
+    if (version := version_of(blob)) < 2 or version > protocol.version:
+        raise DecodeError(f"unsupported protocol version {version} for a result.")
+    _, kind, flags, status, ns, stdout_size, stderr_size, extra_size = result_header.unpack_from(blob)
+    if kind != Kind.result:
+        raise DecodeError(f"expected a result frame but got kind {kind}.")
+    if not flags & Flags.response:
+        return protocol.Status(status), None
+    view = memoryview(blob)
+    offset = result_header.size
+    streams = []
+    for size in (stdout_size, stderr_size):
+        streams.append(bytes(view[offset:offset + size]) if size >= 0 else None)
+        offset += max(size, 0)
+    stdout, stderr = streams
+    response: protocol.Response = json.loads(view[offset:offset + extra_size].tobytes()) if extra_size else {}
+    if response.get("cases") is not None:
+        response["cases"] = decode_cases(response["cases"], view[offset + extra_size:])
+    response.update({"stdout": stdout, "stderr": stderr, "ns": ns})
+    return protocol.Status(status), response
+
+
+def encode_chunk(stream: protocol.Stream, data: bytes, version: int = protocol.version) -> bytes:
+    """
+    encodes a chunk of streamed output.
+
+    only used from version 2. the data is sent as raw bytes after the header.
+    """
+    return chunk_header.pack(version, Kind.chunk, stream.value) + data
+
+
+def decode_chunk(blob: Union[bytes, bytearray]) -> Tuple[protocol.Stream, bytes]:
+    """
+    decodes a frame encoded with encode_chunk.
+    """
+    _, kind, stream = chunk_header.unpack_from(blob)
+    if kind != Kind.chunk:
+        raise DecodeError(f"expected a chunk frame but got kind {kind}.")
+    return protocol.Stream(stream), bytes(memoryview(blob)[chunk_header.size:])
+
+
+def encode_response_v1(response: protocol.Response) -> bytes:
+    """
+    encodes a response as a version 1 json object.
+
+    stdout and stderr are decoded to text, bytes that are not valid utf-8 are replaced.
+    """
+    return json.dumps({
+        **response,
+        "stdout": response["stdout"].decode("utf-8", "replace") if response["stdout"] is not None else None,
+        "stderr": response["stderr"].decode("utf-8", "replace") if response["stderr"] is not None else None,
+    }).encode("utf-8")
+
+
+def decode_response_v1(blob: Union[bytes, bytearray]) -> protocol.Response:
+    """
+    decodes a version 1 json response.
+
+    stdout and stderr are encoded to bytes to match the later versions.
+    """
+    response = json.loads(blob)
+    for stream in ("stdout", "stderr"):
+        if response[stream] is not None:
+            response[stream] = response[stream].encode("utf-8")
+    return response
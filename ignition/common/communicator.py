@@ -3,25 +3,75 @@ from typing import *
 import socket
 import asyncio
 from . import protocol
+from . import codec
+from .metrics import Histogram
 import json
 from ..logger import get_logger
 
 
+class FrameTooLarge(ValueError):
+    """
+    raised when the sender announces a blob of data larger than the receivers max_frame_size.
+    """
+    size: int
+    max_frame_size: int
+
+    def __init__(self, size: int, max_frame_size: int) -> None:
+        super().__init__(f"frame of {size} bytes exceeds the max frame size of {max_frame_size} bytes.")
+        self.size = size
+        self.max_frame_size = max_frame_size
+
+
 class Communicator:
     """
     Communicator class.
 
     Allows communication over a tcp connection.
+
+    data is received straight into a preallocated buffer of the exact size of the data
+    in chunks of at most buffer_size bytes.
+    data larger than max_frame_size is refused.
+
+    the sizes of the frames sent and received are observed in the sent and received histograms.
     """
     default_int_size = 8
-    default_buffer_size = 128
+    default_buffer_size = 256 * 1024
+    default_max_frame_size = 128 * 1024 * 1024
 
     loop: asyncio.AbstractEventLoop
     logger: logging.Logger
+    buffer_size: int
+    max_frame_size: int
+    sent: Histogram
+    received: Histogram
+    frame_buckets = (64, 256, 1024, 4 * 1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024,
+                     16 * 1024 * 1024)
 
-    def __init__(self, logger: Optional[logging.Logger], loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+    def __init__(self, logger: Optional[logging.Logger], loop: Optional[asyncio.AbstractEventLoop] = None,
+                 buffer_size: Optional[int] = None, max_frame_size: Optional[int] = None) -> None:
         self.loop = loop if loop else asyncio.get_event_loop()
         self.logger = logger if logger else get_logger(__name__, logging.WARNING, stdout=True)
+        self.buffer_size = buffer_size if buffer_size else self.default_buffer_size
+        self.max_frame_size = max_frame_size if max_frame_size else self.default_max_frame_size
+        self.sent = Histogram(self.frame_buckets)
+        self.received = Histogram(self.frame_buckets)
+
+    async def recv_exactly(self, connection: socket.socket, size: int) -> bytearray:
+        """
+        receives exactly size bytes from the sender.
+
+        the bytes are received into a preallocated buffer without copying.
+        raises a ConnectionError if the sender closes the connection before all bytes are received.
+        """
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            count = await self.loop.sock_recv_into(connection, view[received:received + self.buffer_size])
+            if not count:
+                raise ConnectionError(f"connection closed after {received} of {size} bytes.")
+            received += count
+        return buffer
 
     async def recv_int(self, connection: socket.socket) -> int:
         """
@@ -30,7 +80,7 @@ class Communicator:
         receives a 64bit big endian unsigned integer from the sender.
         """
         self.logger.debug("waiting to receive int...")
-        integer = int.from_bytes((await self.loop.sock_recv(connection, self.default_int_size)), "big", signed=False)
+        integer = int.from_bytes(await self.recv_exactly(connection, self.default_int_size), "big", signed=False)
         self.logger.debug(f"received int: {integer}")
         return integer
 
@@ -63,24 +113,22 @@ class Communicator:
         self.logger.debug(f"sending status: {status}")
         await self.send_int(connection, status.value)
 
-    async def recv_data(self, connection: socket.socket) -> bytes:
+    async def recv_data(self, connection: socket.socket) -> bytearray:
         """
         receives a larger blob of data from the sender.
 
         first receives a 64bit integer from the sender indicating the size of the data.
         the entire size is then downloaded from the sender.
+        raises FrameTooLarge if the size exceeds max_frame_size.
         """
         self.logger.debug("waiting to receive data size...")
         size = await self.recv_int(connection)
+        if size > self.max_frame_size:
+            raise FrameTooLarge(size, self.max_frame_size)
         self.logger.debug(f"data size is expected to be {size} bytes.")
-        blob = b""
-        for _ in range(int(size / self.default_buffer_size)):
-            self.logger.debug(f"waiting to receive {self.default_buffer_size} bytes...")
-            blob += await self.loop.sock_recv(connection, self.default_buffer_size)
-            self.logger.debug(f"received {self.default_buffer_size} bytes.")
-        self.logger.debug(f"waiting to receive the last {size % self.default_buffer_size} bytes...")
-        blob += await self.loop.sock_recv(connection, (size % self.default_buffer_size))
-        self.logger.debug(f"received the last {size % self.default_buffer_size} bytes.")
+        blob = await self.recv_exactly(connection, size)
+        self.received.observe(size)
+        self.logger.debug(f"received {size} bytes.")
         return blob
 
     async def send_data(self, connection: socket.socket, payload: bytes) -> None:
@@ -94,28 +142,54 @@ class Communicator:
         await self.send_int(connection, len(payload))
         self.logger.debug(f"sending the payload of size {len(payload)}.")
         await self.loop.sock_sendall(connection, payload)
+        self.sent.observe(len(payload))
+
+    async def recv_hello(self, connection: socket.socket) -> protocol.Hello:
+        """
+        receives a hello from the sender.
+
+        receives a blob of data from the sender.
+        the data is then deserialized to a python dictionary with the protocol.Hello format.
+        """
+        self.logger.debug(f"waiting to receive a hello...")
+        hello = json.loads(await self.recv_data(connection))
+        self.logger.debug(f"received hello: {hello}.")
+        return hello
+
+    async def send_hello(self, connection: socket.socket, hello: protocol.Hello) -> None:
+        """
+        sends a hello to the recipient.
+
+        sends a protocol.Hello formed dictionary to the recipient.
+        the dictionary is first serialized to bytes which is then sent to the recipient.
+        """
+        self.logger.debug(f"sending hello: {hello}.")
+        await self.send_data(connection, json.dumps(hello).encode("utf-8"))
 
-    async def recv_request(self, connection: socket.socket) -> protocol.Request:
+    async def recv_request(self, connection: socket.socket) -> Tuple[protocol.Request, int]:
         """
         receives a request from the sender.
 
         receives a blob of data from the sender.
         the data is then deserialized to a python dictionary with the protocol.Request format.
+        the protocol version is detected from the data and returned with the request.
         """
         self.logger.debug(f"waiting to receive a request...")
-        request = json.loads(await self.recv_data(connection))
-        self.logger.debug(f"received request: {request}.")
-        return request
+        request, version = codec.decode_request(await self.recv_data(connection))
+        self.logger.debug(f"received request for '{request['language']}' with protocol version {version}.")
+        return request, version
 
-    async def send_request(self, connection: socket.socket, request: protocol.Request) -> None:
+    async def send_request(self, connection: socket.socket, request: protocol.Request,
+                           version: int = protocol.version) -> None:
         """
         sends a request to the recipient.
 
         sends a protocol.Request formed dictionary to the recipient.
-        the dictionary is first serialized to bytes which is then sent to the recipient.
+        the dictionary is first serialized to bytes with the given protocol version
+        which is then sent to the recipient.
         """
-        self.logger.debug(f"sending request: {request}.")
-        await self.send_data(connection, json.dumps(request).encode("utf-8"))
+        self.logger.debug(f"sending request for '{request['language']}' with protocol version {version}.")
+        await self.send_data(connection, codec.encode_request(request, version))
 
     async def recv_response(self, connection: socket.socket) -> protocol.Response:
         """
@@ -123,10 +197,11 @@ class Communicator:
 
         receives a blob of data from the sender.
         the data is the deserialized to a python dictionary with the protocol.Response format.
+        only used by protocol version 1.
         """
         self.logger.debug(f"waiting to receive a response...")
-        response = json.loads(await self.recv_data(connection))
-        self.logger.debug(f"received response: {response}.")
+        response = codec.decode_response_v1(await self.recv_data(connection))
+        self.logger.debug(f"received response.")
         return response
 
     async def send_response(self, connection: socket.socket, response: protocol.Response) -> None:
@@ -135,6 +210,68 @@ class Communicator:
 
         sends a protocol.Response formed dictionary to the recipient.
         the dictionary is first serialized to bytes which is then sent to the recipient.
+        only used by protocol version 1.
+        """
+        self.logger.debug(f"sending response.")
+        await self.send_data(connection, codec.encode_response_v1(response))
+
+    async def recv_result(self, connection: socket.socket,
+                          version: int = protocol.version) -> Tuple[protocol.Status, Optional[protocol.Response]]:
+        """
+        receives the status and response of a processed request from the sender.
+
+        protocol version 1 receives the status and then the response if the status is success.
+        later versions receive both in a single frame.
+        """
+        if version == 1:
+            status = await self.recv_status(connection)
+            return status, await self.recv_response(connection) if status == protocol.Status.success else None
+        self.logger.debug(f"waiting to receive a result...")
+        status, response = codec.decode_result(await self.recv_data(connection))
+        self.logger.debug(f"received result with status: {status}.")
+        return status, response
+
+    async def send_result(self, connection: socket.socket, status: protocol.Status,
+                          response: Optional[protocol.Response], version: int = protocol.version) -> None:
+        """
+        sends the status and response of a processed request to the recipient.
+
+        protocol version 1 sends the status and then the response if there is one.
+        later versions send both in a single frame.
+        """
+        if version == 1:
+            await self.send_status(connection, status)
+            if response is not None:
+                await self.send_response(connection, response)
+            return
+        self.logger.debug(f"sending result with status: {status}.")
+        await self.send_data(connection, codec.encode_result(status, response, version))
+
+    async def send_chunk(self, connection: socket.socket, stream: protocol.Stream, data: bytes,
+                         version: int = protocol.version) -> None:
+        """
+        sends a chunk of streamed output to the recipient.
+
+        only supported from protocol version 2.
+        """
+        self.logger.debug(f"sending {len(data)} bytes of {stream}.")
+        await self.send_data(connection, codec.encode_chunk(stream, data, version))
+
+    async def recv_stream(self, connection: socket.socket) -> AsyncIterator[
+            Union[Tuple[protocol.Stream, bytes], Tuple[protocol.Status, Optional[protocol.Response]]]]:
+        """
+        receives streamed output from the sender.
+
+        yields (stream, data) tuples for every chunk of output
+        and finally the (status, response) tuple of the result.
+        only supported from protocol version 2.
         """
-        self.logger.debug(f"sending response: {response}.")
-        await self.send_data(connection, json.dumps(response).encode("utf-8"))
+        while True:
+            blob = await self.recv_data(connection)
+            if codec.kind_of(blob) == codec.Kind.chunk:
+                yield codec.decode_chunk(blob)
+                continue
+            status, response = codec.decode_result(blob)
+            self.logger.debug(f"received streamed result with status: {status}.")
+            yield status, response
+            return
@@ -1,49 +1,552 @@
 from typing import *
 import asyncio
+import math
+import os
+import re
+import shutil
+import statistics
+import threading
 from pathlib import Path
-from uuid import uuid4
-from .protocol import Response
+from .protocol import Response, Stream, Limits, Status, Case, CaseResult, Step, Benchmark, BenchmarkResult
 from time import perf_counter_ns
 
 
-async def process(stdin: str) -> Tuple[bytes, bytes]:
+# called with every chunk of output as it is produced.
+# the process is not read any further until the callback returns.
+Output = Callable[[Stream, bytes], Awaitable[None]]
+
+chunk_size = 64 * 1024
+
+# the helper running a command as its child to measure the peak memory of the command itself, see rusage.c.
+# max_rss is not measured if it is not installed.
+rusage = shutil.which("ignition-rusage")
+
+
+class Capture:
+    """
+    describes how the output of a process is captured.
+
+    output is called with every chunk of output as it is produced instead of collecting it.
+    at most limits[stream] bytes are kept or passed to output per stream, the rest is dropped.
+    if limits["kill"] is set the process is killed as soon as a stream exceeds its limit.
+    a missing limit means the stream is unlimited.
+    """
+    output: Optional[Output]
+    limits: Limits
+
+    def __init__(self, output: Optional[Output] = None, limits: Optional[Limits] = None) -> None:
+        self.output = output
+        self.limits = limits if limits else {}
+
+
+class Usage(NamedTuple):
+    """
+    the resources used by a process.
+
+    user_ns and sys_ns are the cpu time spent in user and kernel mode and max_rss the peak resident memory in bytes,
+    None unless the process was started through the rusage helper.
+    """
+    user_ns: int
+    sys_ns: int
+    max_rss: Optional[int]
+
+
+class Captured(NamedTuple):
+    """
+    the output of a process.
+
+    stdout and stderr hold the kept output.
+    stdout_bytes and stderr_bytes are the amount of bytes the process actually wrote.
+    returncode is the exit code of the process.
+    usage is the resource usage of the process, None unless the UsageWatcher reaped it.
+    """
+    stdout: bytes
+    stderr: bytes
+    stdout_bytes: int
+    stderr_bytes: int
+    returncode: int
+    usage: Optional[Usage] = None
+
+
+class UsageWatcher(getattr(asyncio, "AbstractChildWatcher", object)):
+    """
+    child watcher reaping subprocesses with os.wait4 to keep their resource usage.
+
+    works like the threaded child watcher asyncio uses by default, every subprocess is waited for in its own thread.
+    the usage of a subprocess is kept until it is taken after the subprocess exited.
+
+    ru_maxrss of a forked subprocess includes the memory of the parent it was forked from,
+    so the peak memory is only taken from the report of the rusage helper if the subprocess was started by spawn.
+    """
+    usages: Dict[int, Usage]
+    reports: Dict[int, int]
+
+    def __init__(self) -> None:
+        self.usages = {}
+        self.reports = {}
+
+    def __enter__(self) -> "UsageWatcher":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        pass
+
+    def add_child_handler(self, pid: int, callback: Callable[..., None], *args: Any) -> None:
+        loop = asyncio.get_running_loop()
+        threading.Thread(target=self._wait, args=(loop, pid, callback, args), daemon=True).start()
+
+    def remove_child_handler(self, pid: int) -> bool:
+        return True
+
+    def attach_loop(self, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        pass
+
+    def is_active(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
+    def take(self, pid: int) -> Optional[Usage]:
+        """
+        the usage of an exited subprocess, None if it was not reaped by this watcher.
+        """
+        usage = self.usages.pop(pid, None)
+        if (report := self.reports.pop(pid, None)) is None:
+            return usage
+        try:
+            # the helper wrote the report before it exited, nothing is left to wait for
+            os.set_blocking(report, False)
+            max_rss = int(os.read(report, 64) or b"0") or None
+        except (BlockingIOError, ValueError):
+            max_rss = None
+        finally:
+            os.close(report)
+        return usage._replace(max_rss=max_rss) if usage else None
+
+    def _wait(self, loop: asyncio.AbstractEventLoop, pid: int, callback: Callable[..., None], args: Tuple) -> None:
+        try:
+            _, status, usage = os.wait4(pid, 0)
+        except ChildProcessError:
+            # reaped by someone else, the same exit code as asyncio reports
+            returncode = 255
+        else:
+            returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+            self.usages[pid] = Usage(int(usage.ru_utime * 1e9), int(usage.ru_stime * 1e9), None)
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(callback, pid, returncode, *args)
+
+
+watcher = UsageWatcher()
+
+
+def watch_usage() -> bool:
+    """
+    makes asyncio reap subprocesses with the usage watcher so their resource usage is measured.
+
+    returns False if this version of python has no child watchers, the usage is then never measured.
+    """
+    if not hasattr(asyncio, "AbstractChildWatcher"):
+        return False
+    asyncio.set_child_watcher(watcher)
+    return True
+
+
+async def spawn(*args: str, **kwargs: Any) -> asyncio.subprocess.Process:
+    """
+    starts a subprocess just like asyncio.create_subprocess_exec.
+
+    the command is run through the rusage helper if it is installed so the peak memory of the command is measured.
+    commands that can not be found are started directly so they fail the same way with or without the helper.
+    """
+    if not rusage or not shutil.which(args[0]):
+        return await asyncio.create_subprocess_exec(*args, **kwargs)
+    report, write = os.pipe()
+    try:
+        subprocess = await asyncio.create_subprocess_exec(
+            rusage, str(write), *args, **{**kwargs, "pass_fds": (*kwargs.get("pass_fds", ()), write)}
+        )
+    except BaseException as e:
+        os.close(report)
+        raise e
+    finally:
+        os.close(write)
+    watcher.reports[subprocess.pid] = report
+    return subprocess
+
+
+async def read(reader: asyncio.StreamReader, stream: Stream, capture: Capture,
+               kill: Callable[[], None]) -> Tuple[bytes, int]:
+    """
+    reads a pipe of a subprocess until it closes.
+
+    the chunks are passed to the captures output as they are read if it has one
+    otherwise they are collected and returned.
+    output past the limit of the stream is read and counted but dropped.
+
+    returns the kept output and the amount of bytes read.
+    """
+    limit = capture.limits.get(stream.name)
+    chunks = []
+    total = 0
+    while chunk := await reader.read(chunk_size):
+        total += len(chunk)
+        if limit is not None and total > limit:
+            if capture.limits.get("kill"):
+                kill()
+            if not (chunk := chunk[:max(limit - (total - len(chunk)), 0)]):
+                continue
+        if capture.output:
+            await capture.output(stream, chunk)
+        else:
+            chunks.append(chunk)
+    return b"".join(chunks), total
+
+
+async def write(writer: asyncio.StreamWriter, data: bytes) -> None:
+    """
+    writes data to the stdin of a subprocess and closes it.
+
+    a program that exits without reading all of its input is not an error.
+    """
+    try:
+        writer.write(data)
+        await writer.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+
+async def process(stdin: str, capture: Optional[Capture] = None, input: Optional[bytes] = None) -> Captured:
     """
     helper method to easily use a string as parameter for the subprocess.
+
+    stdout and stderr are read as they are produced according to the capture.
+    if input is given it is written to the stdin of the subprocess.
+    the subprocess is killed if the coroutine is cancelled.
+    """
+    subprocess = await spawn(
+        *stdin.split(), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        stdin=asyncio.subprocess.PIPE if input is not None else None
+    )
+    return await collect(subprocess, capture, input)
+
+
+async def collect(subprocess: asyncio.subprocess.Process, capture: Optional[Capture] = None,
+                  input: Optional[bytes] = None) -> Captured:
+    """
+    reads the output of a started subprocess until it exits.
+
+    stdout and stderr are read as they are produced according to the capture
+    while input is written to the stdin of the subprocess if given.
+    the subprocess is killed if the coroutine is cancelled.
     """
-    return await (await asyncio.create_subprocess_exec(
-        *stdin.split(), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-    )).communicate()
+    capture = capture if capture else Capture()
+
+    def kill() -> None:
+        if subprocess.returncode is None:
+            subprocess.kill()
 
+    try:
+        (stdout, stdout_bytes), (stderr, stderr_bytes), *_ = await asyncio.gather(
+            read(subprocess.stdout, Stream.stdout, capture, kill),
+            read(subprocess.stderr, Stream.stderr, capture, kill),
+            *([write(subprocess.stdin, input)] if input is not None else [])
+        )
+        await subprocess.wait()
+    except BaseException as e:
+        kill()
+        raise e
+    return Captured(stdout, stderr, stdout_bytes, stderr_bytes, subprocess.returncode, watcher.take(subprocess.pid))
 
-async def shell(commands: List[str]) -> Response:
+
+async def shell(commands: List[str], capture: Optional[Capture] = None, input: Optional[bytes] = None) -> Response:
     """
     runs a list of shell commands.
 
     runs all commands in the given list of commands.
     the last command is timed and stdout and stderr is captured
-    to be returned as a protocol.Response object
+    to be returned as a protocol.Response object.
+
+    the output of the last command is captured according to capture and input is written to its stdin.
+    the output of the other commands is dropped.
+    every command is timed and listed in the steps of the response, see protocol.Step.
     """
+    steps = []
     while commands and len(commands) > 1:
-        await process(commands.pop(0))
+        steps.append(await run_step(commands.pop(0)))
+    command = commands.pop(0)
     start = perf_counter_ns()
-    stdout, stderr = await process(commands.pop(0))
+    captured = await process(command, capture, input)
     end = perf_counter_ns()
-    return create_result(stdout, stderr, end - start)
+    steps.append(create_step(command, captured, end - start))
+    return {**create_result(captured, end - start, capture), "steps": steps}
+
+
+async def run_step(command: str) -> Step:
+    """
+    runs a command without keeping its output and times it.
+    """
+    start = perf_counter_ns()
+    captured = await process(command, Capture(limits={"stdout": 0, "stderr": 0}))
+    return create_step(command, captured, perf_counter_ns() - start)
+
+
+def create_step(command: str, captured: Captured, time: int) -> Step:
+    """
+    helper method to convert a command, its captured output and time to a protocol.Step.
+    """
+    return {"command": command, "ns": time, "returncode": captured.returncode, **usage_of(captured)}
+
+
+def usage_of(captured: Captured) -> Dict[str, Optional[int]]:
+    """
+    the resource usage fields of a Response or Step, None if the usage was not measured.
+    """
+    usage = captured.usage
+    return {
+        "user_ns": usage.user_ns if usage else None,
+        "sys_ns": usage.sys_ns if usage else None,
+        "max_rss": usage.max_rss if usage else None
+    }
 
 
-def create_result(stdout: Optional[bytes], stderr: Optional[bytes], time: int) -> Response:
+def create_result(captured: Captured, time: int, capture: Optional[Capture] = None) -> Response:
     """
     helper method to easily convert parameters to a Response.
 
-    used to convert tuples with stdout, stderr and time to a protocol.Response formed dictionary.
+    used to convert the captured output and time to a protocol.Response formed dictionary.
+    the output is kept as raw bytes since programs are free to write output that is not valid utf-8.
+    a stream is truncated if the process wrote more than its limit.
+    """
+    limits = capture.limits if capture else {}
+    return {
+        "stdout": captured.stdout if captured.stdout else None,
+        "stderr": captured.stderr if captured.stderr else None,
+        "ns": time,
+        "stdout_bytes": captured.stdout_bytes,
+        "stderr_bytes": captured.stderr_bytes,
+        "stdout_truncated": "stdout" in limits and captured.stdout_bytes > limits["stdout"],
+        "stderr_truncated": "stderr" in limits and captured.stderr_bytes > limits["stderr"],
+        "returncode": captured.returncode,
+        **usage_of(captured)
+    }
+
+
+class Procedure(NamedTuple):
+    """
+    how a program in a language is built and run.
+
+    build is the list of commands building the program, empty if the language is interpreted.
+    run is the command running the program, the programs arguments are appended to it.
+    """
+    build: List[str]
+    run: str
+
+
+async def execute(procedure: Procedure, sys_args: str,
+                  capture: Optional[Capture] = None,
+                  built: bool = False,
+                  on_built: Optional[Callable[[], Awaitable[None]]] = None) -> Response:
+    """
+    builds and runs a program.
+
+    the build commands are skipped if the program is already built.
+    the program is run even if the build failed just like the commands in shell.
+    the time spent compiling and running is added to the phases of the response
+    and the build commands that were run to its steps.
+    """
+    start = perf_counter_ns()
+    steps = await build(procedure, on_built) if not built else []
+    compiled = perf_counter_ns()
+    response = await shell([f"{procedure.run} {sys_args}"], capture)
+    response["phases"] = {"compile": compiled - start, "run": perf_counter_ns() - compiled}
+    response["steps"] = [*steps, *response["steps"]]
+    return response
+
+
+async def build(procedure: Procedure, on_built: Optional[Callable[[], Awaitable[None]]] = None) -> List[Step]:
+    """
+    runs the build commands of a program.
+
+    the commands after a failed command are skipped.
+    on_built is called after a successful build, a build is successful when every build command exits with 0.
+    returns the steps of the commands that were run.
+    """
+    steps = []
+    for command in procedure.build:
+        steps.append(step := await run_step(command))
+        if step["returncode"] != 0:
+            return steps
+    if procedure.build and on_built:
+        await on_built()
+    return steps
+
+
+async def execute_cases(procedure: Procedure, cases: List[Case],
+                        limits: Optional[Limits] = None,
+                        timeout: float = 30,
+                        case_timeout: float = 10,
+                        built: bool = False,
+                        on_built: Optional[Callable[[], Awaitable[None]]] = None) -> Response:
+    """
+    builds a program once and runs it for every case.
+
+    every case runs with its own args and stdin for at most its own timeout, by default case_timeout seconds.
+    a case without stdin gets an empty stdin so a program reading it does not wait for input.
+    the build and all cases together have timeout seconds. a case that runs out of time has the status timeout
+    and so do the cases left when the time is up, they are not run.
+    a case with expected output passes if its stdout is the expected output, trailing whitespace is ignored.
+
+    the limits apply to the output of all cases together so the response stays as large as a single run.
+    the streams of the response are empty and its time, cpu time and byte counts are the totals of the cases.
+    raises asyncio.TimeoutError if the build does not finish in time.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    building = perf_counter_ns()
+    steps = await asyncio.wait_for(build(procedure, on_built), timeout) if not built else []
+    compiled = perf_counter_ns()
+    left = dict(limits) if limits else {}
+    results: List[CaseResult] = []
+    for case in cases:
+        capture = Capture(limits=left)
+        start = perf_counter_ns()
+        try:
+            if (remaining := deadline - loop.time()) <= 0:
+                raise asyncio.TimeoutError()
+            result = await asyncio.wait_for(shell(
+                [f"{procedure.run} {case.get('args', '')}"], capture,
+                case.get("stdin", "").encode("utf-8")
+            ), min(case.get("timeout", case_timeout), remaining))
+            status = Status.success
+        except asyncio.TimeoutError:
+            result = create_result(Captured(b"", b"", 0, 0, -1), perf_counter_ns() - start)
+            status = Status.timeout
+        for stream in ("stdout", "stderr"):
+            if stream in left:
+                left[stream] = max(left[stream] - len(result[stream] or b""), 0)
+        result.pop("steps", None)
+        results.append({
+            **result, "status": status.value, "passed": None if case.get("expected") is None else (
+                status == Status.success and not result["stdout_truncated"] and
+                (result["stdout"] or b"").rstrip() == case["expected"].encode("utf-8").rstrip()
+            )
+        })
+    return {
+        "stdout": None,
+        "stderr": None,
+        "ns": sum(result["ns"] for result in results),
+        "stdout_bytes": sum(result["stdout_bytes"] for result in results),
+        "stderr_bytes": sum(result["stderr_bytes"] for result in results),
+        "stdout_truncated": any(result["stdout_truncated"] for result in results),
+        "stderr_truncated": any(result["stderr_truncated"] for result in results),
+        "user_ns": measured(sum, (result["user_ns"] for result in results)),
+        "sys_ns": measured(sum, (result["sys_ns"] for result in results)),
+        "max_rss": measured(max, (result["max_rss"] for result in results)),
+        "cases": results,
+        "phases": {"compile": compiled - building, "run": perf_counter_ns() - compiled},
+        "steps": steps
+    }
+
+
+async def execute_benchmark(procedure: Procedure, sys_args: str, benchmark: Benchmark,
+                            limits: Optional[Limits] = None,
+                            timeout: float = 30,
+                            built: bool = False,
+                            on_built: Optional[Callable[[], Awaitable[None]]] = None) -> Response:
+    """
+    builds a program once and runs it repeatedly to time it.
+
+    the program is run the warmup amount of times without being timed and then up to iterations times while timed.
+    the build and all runs together have timeout seconds. a run is not started when the time left is shorter
+    than the slowest run so far, the benchmark then has fewer iterations than requested.
+    the benchmark also stops after a run that exits with an error since the program is broken.
+
+    every run gets an empty stdin and its output is limited by limits, the output of the first timed run is returned.
+    raises asyncio.TimeoutError if the build or warmup does not finish in time or no timed run finished.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    building = perf_counter_ns()
+    steps = await asyncio.wait_for(build(procedure, on_built), timeout) if not built else []
+    compiled = perf_counter_ns()
+    command = f"{procedure.run} {sys_args}"
+    for _ in range(benchmark.get("warmup", 0)):
+        await asyncio.wait_for(shell([command], Capture(limits=limits), b""), deadline - loop.time())
+    results: List[Response] = []
+    slowest = 0
+    while len(results) < benchmark.get("iterations", 1) and deadline - loop.time() > slowest:
+        try:
+            result = await asyncio.wait_for(shell([command], Capture(limits=limits), b""), deadline - loop.time())
+        except asyncio.TimeoutError:
+            break
+        results.append(result)
+        slowest = max(slowest, result["ns"] / 1e9)
+        if result["returncode"] != 0:
+            break
+    if not results:
+        raise asyncio.TimeoutError()
+    summary = summarize([result["ns"] for result in results], results, benchmark.get("warmup", 0))
+    first = results[0]
+    first.pop("steps", None)
+    return {
+        **first,
+        "ns": summary["median_ns"],
+        "user_ns": summary["user_ns"],
+        "sys_ns": summary["sys_ns"],
+        "max_rss": measured(max, (result["max_rss"] for result in results)),
+        "benchmark": summary,
+        "phases": {"compile": compiled - building, "run": perf_counter_ns() - compiled},
+        "steps": steps
+    }
+
+
+def summarize(samples: List[int], results: List[Response], warmup: int) -> BenchmarkResult:
     """
+    the statistics of the times of the timed runs of a benchmark and the mean cpu time of their results.
+    """
+    ordered = sorted(samples)
+    user = measured(sum, (result.get("user_ns") for result in results))
+    system = measured(sum, (result.get("sys_ns") for result in results))
     return {
-        "stdout": stdout.decode("utf-8") if stdout else None,
-        "stderr": stderr.decode("utf-8") if stderr else None,
-        "ns": time
+        "iterations": len(samples),
+        "warmup": warmup,
+        "min_ns": ordered[0],
+        "median_ns": int(statistics.median(ordered)),
+        "p95_ns": ordered[math.ceil(0.95 * len(ordered)) - 1],
+        "mean_ns": int(statistics.mean(ordered)),
+        "stddev_ns": int(statistics.stdev(ordered)) if len(ordered) > 1 else 0,
+        "user_ns": user // len(results) if user is not None else None,
+        "sys_ns": system // len(results) if system is not None else None,
+        "samples": samples
     }
 
 
+def measured(function: Callable[[List[int]], int], values: Iterable[Optional[int]]) -> Optional[int]:
+    """
+    applies function to the values that were measured, None if none of them were.
+
+    cases that timed out are killed before their usage is measured.
+    """
+    values = [value for value in values if value is not None]
+    return function(values) if values else None
+
+
+def main_class(file: Path) -> str:
+    """
+    the name of the first top level class in a java source file.
+
+    this is the class the java source launcher would run.
+    defaults to Main if the file does not exist or has no class.
+    """
+    try:
+        return match.group(1) if (match := re.search(r"\bclass\s+(\w+)", file.read_text())) else "Main"
+    except OSError:
+        return "Main"
+
+
 class LanguageMeta(type):
     """
     metaclass for the Language class bellow.
@@ -71,7 +574,7 @@ class LanguageMeta(type):
         """
         return item in cls.languages
 
-    def __getitem__(cls, language) -> Callable[[Path, str], Response]:
+    def __getitem__(cls, language) -> Callable[[Path, Path], "Procedure"]:
         """
         implements __getitem__ on a class level.
 
@@ -84,95 +587,108 @@ class Languages(metaclass=LanguageMeta):
     """
     Class holding procedures to all supported languages.
 
-    to add support for a language create a new static method with the language name,
-    use the shell function to define commands in the order they should run.
+    to add support for a language create a new static method with the language name
+    returning a Procedure.
 
-    the last command in the list of commands in the shell function must be the
-    command that executes the program.
+    the build commands of the procedure compile the program into the build directory
+    and the run command executes it. interpreted languages have no build commands.
+    everything a compiled program needs to run must be written to the build directory
+    since the build directory is what is cached between requests.
 
-    the file parameter in the method is the file where the source code is located.
+    the file parameter in the method is the file where the source code is located
+    and the build parameter is the directory the program should be built in.
     """
 
     @staticmethod
-    async def python(file: Path, sys_args: str) -> Response:
+    def python(file: Path, build: Path) -> Procedure:
         """
         procedure for python
         """
-        return await shell([
-            f"python3 {file} {sys_args}"
-        ])
+        return Procedure([], f"python3 {file}")
 
     @staticmethod
-    async def php(file: Path, sys_args: str) -> Response:
+    def php(file: Path, build: Path) -> Procedure:
         """
         procedure for php
         """
-        return await shell([
-            f"php -f {file} {sys_args}"
-        ])
+        return Procedure([], f"php -f {file}")
 
     @staticmethod
-    async def java(file: Path, sys_args: str) -> Response:
+    def java(file: Path, build: Path) -> Procedure:
         """
         procedure for java
+
+        the source is copied to a file named after the main class since javac requires
+        public classes to be declared in a file with the same name.
         """
-        return await shell([
-            f"java {file} {sys_args}"
-        ])
+        source = file.parent.joinpath(f"{(main := main_class(file))}.java")
+        return Procedure([
+            f"cp {file} {source}",
+            f"javac -d {build} {source}"
+        ], f"java -cp {build} {main}")
 
     @staticmethod
-    async def javascript(file: Path, sys_args: str) -> Response:
+    def javascript(file: Path, build: Path) -> Procedure:
         """
         procedure for javascript using node.js
         """
-        return await shell([
-            f"node {file} {sys_args}"
-        ])
+        return Procedure([], f"node {file}")
 
     @staticmethod
-    async def go(file: Path, sys_args: str) -> Response:
+    def go(file: Path, build: Path) -> Procedure:
         """
         procedure for go
         """
-        return await shell([
-            f"go run {file} {sys_args}"
-        ])
+        return Procedure([
+            f"go build -o {(executable := build.joinpath('main'))} {file}"
+        ], f"{executable}")
 
     @staticmethod
-    async def cpp(file: Path, sys_args: str) -> Response:
+    def cpp(file: Path, build: Path) -> Procedure:
         """
         procedure for c++
         """
-        return await shell([
-            f"g++ -o {(executable := file.parent.joinpath(str(uuid4())))} {file}",
-            f"{executable} {sys_args}"
-        ])
+        return Procedure([
+            f"g++ -o {(executable := build.joinpath('main'))} {file}"
+        ], f"{executable}")
 
     @staticmethod
-    async def cs(file: Path, sys_args: str) -> Response:
+    def cs(file: Path, build: Path) -> Procedure:
         """
         procedure for C#
         """
-        return await shell([
-            f"mv {file} {(project := Path('/cs')).joinpath('Program.cs')}",  # move to prepared console project
-            f"dotnet run --project {project} {sys_args}"
-        ])
+        return Procedure([
+            f"cp {file} {(project := Path('/cs')).joinpath('Program.cs')}",  # copy to prepared console project
+            f"dotnet build {project} --nologo --output {build}"
+        ], f"dotnet {build.joinpath('cs.dll')}")
 
     @staticmethod
-    async def c(file: Path, sys_args: str) -> Response:
+    def c(file: Path, build: Path) -> Procedure:
         """
         procedure for C
         """
-        return await shell([
-            f"gcc -o {(executable := file.parent.joinpath(str(uuid4())))} {file}",
-            f"{executable} {sys_args}"
-        ])
+        return Procedure([
+            f"gcc -o {(executable := build.joinpath('main'))} {file}"
+        ], f"{executable}")
 
     @staticmethod
-    async def typescript(file: Path, args: str) -> Response:
+    def typescript(file: Path, build: Path) -> Procedure:
         """
         procedure for typescript using Deno
         """
-        return await shell([
-            f"deno run {file} {args}"
-        ])
+        return Procedure([], f"deno run {file}")
+
+
+# cheap commands that touches each languages toolchain.
+# used by idle clients to page in the toolchain before a request arrives.
+warmups: Dict[str, str] = {
+    "python": "python3 -c pass",
+    "php": "php -r ;",
+    "java": "java -version",
+    "javascript": "node -e 0",
+    "go": "go version",
+    "cpp": "g++ --version",
+    "cs": "dotnet --info",
+    "c": "gcc --version",
+    "typescript": "deno --version",
+}
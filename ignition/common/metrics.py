@@ -0,0 +1,225 @@
+from typing import *
+import bisect
+
+
+class Histogram:
+    """
+    histogram of observed values.
+
+    counts[i] is the amount of observations above buckets[i - 1] and at most buckets[i].
+    the last count holds the observations above the last bucket.
+    """
+    buckets: Tuple[float, ...]
+    counts: List[int]
+    sum: float
+    count: int
+
+    def __init__(self, buckets: Iterable[float]) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def __repr__(self) -> str:
+        return f"<Histogram count: {self.count} mean: {self.mean():.3f}>"
+
+    def observe(self, value: float) -> None:
+        """
+        adds an observation.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def mean(self) -> float:
+        """
+        the mean of all observations, 0 if nothing is observed.
+        """
+        return self.sum / self.count if self.count else 0
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """
+        the cumulative count of every bucket with infinity as the last bucket.
+        """
+        result = []
+        total = 0
+        for bucket, count in zip((*self.buckets, float("inf")), self.counts):
+            total += count
+            result.append((bucket, total))
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        the histogram as a json serializable dictionary.
+        """
+        return {
+            "buckets": [[str(bucket) if bucket == float("inf") else bucket, count]
+                        for bucket, count in self.cumulative()],
+            "sum": self.sum,
+            "count": self.count
+        }
+
+
+class Counter:
+    """
+    a value that only goes up.
+    """
+    value: float
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def __repr__(self) -> str:
+        return f"<Counter value: {self.value}>"
+
+    def inc(self, amount: float = 1) -> None:
+        """
+        adds amount to the counter.
+        """
+        self.value += amount
+
+
+class Gauge:
+    """
+    a value read from function when the metrics are collected.
+
+    also used for counters kept by other objects.
+    """
+    function: Callable[[], float]
+
+    def __init__(self, function: Callable[[], float]) -> None:
+        self.function = function
+
+    def __repr__(self) -> str:
+        return f"<Gauge value: {self.value}>"
+
+    @property
+    def value(self) -> float:
+        return self.function()
+
+
+Metric = Union[Counter, Gauge, Histogram]
+
+
+def escape(value: str) -> str:
+    """
+    escapes a label value for the prometheus text format.
+    """
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def number(value: float) -> str:
+    """
+    formats a value for the prometheus text format.
+    """
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Family:
+    """
+    a metric and its children, one for every combination of label values.
+
+    a family without labels has a single child with no label values.
+    kind is the prometheus type of the metric, counter, gauge or histogram.
+    """
+    name: str
+    help: str
+    kind: str
+    labels: Tuple[str, ...]
+    factory: Optional[Callable[[], Metric]]
+    children: Dict[Tuple[str, ...], Metric]
+
+    def __init__(self, name: str, help: str, kind: str, labels: Iterable[str] = (),
+                 factory: Optional[Callable[[], Metric]] = None) -> None:
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labels = tuple(labels)
+        self.factory = factory
+        self.children = {}
+
+    def __repr__(self) -> str:
+        return f"<Family '{self.name}' {self.kind} children: {len(self.children)}>"
+
+    def child(self, *values: Any) -> Metric:
+        """
+        the child with the label values, created on first use.
+        """
+        values = tuple(str(value) for value in values)
+        if (metric := self.children.get(values)) is None:
+            if len(values) != len(self.labels):
+                raise ValueError(f"'{self.name}' has the labels {self.labels} but got {values}.")
+            metric = self.children[values] = self.factory()
+        return metric
+
+    def add(self, metric: Metric, *values: Any) -> Metric:
+        """
+        adds a metric kept by another object as the child with the label values.
+        """
+        self.children[tuple(str(value) for value in values)] = metric
+        return metric
+
+    def render(self) -> Iterator[str]:
+        """
+        the lines of the family in the prometheus text format.
+        """
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, metric in self.children.items():
+            labels = [f"{label}=\"{escape(value)}\"" for label, value in zip(self.labels, values)]
+            if not isinstance(metric, Histogram):
+                yield f"{self.name}{self._format(labels)} {number(metric.value)}"
+                continue
+            for bucket, count in metric.cumulative():
+                le = f"le=\"{number(bucket)}\""
+                yield f"{self.name}_bucket{self._format([*labels, le])} {count}"
+            yield f"{self.name}_sum{self._format(labels)} {number(metric.sum)}"
+            yield f"{self.name}_count{self._format(labels)} {metric.count}"
+
+    @staticmethod
+    def _format(labels: List[str]) -> str:
+        return f"{{{','.join(labels)}}}" if labels else ""
+
+
+class Registry:
+    """
+    the metrics of a component rendered in the prometheus text format.
+    """
+    families: Dict[str, Family]
+
+    def __init__(self) -> None:
+        self.families = {}
+
+    def __repr__(self) -> str:
+        return f"<Registry families: {len(self.families)}>"
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Family:
+        return self._register(Family(name, help, "counter", labels, Counter))
+
+    def histogram(self, name: str, help: str, buckets: Iterable[float], labels: Iterable[str] = ()) -> Family:
+        buckets = tuple(buckets)
+        return self._register(Family(name, help, "histogram", labels, lambda: Histogram(buckets)))
+
+    def gauge(self, name: str, help: str, function: Callable[[], float], kind: str = "gauge") -> Family:
+        """
+        a metric without labels read from function when the metrics are collected.
+
+        kind is counter for a counter kept by another object.
+        """
+        family = self._register(Family(name, help, kind))
+        family.add(Gauge(function))
+        return family
+
+    def render(self) -> str:
+        """
+        all metrics in the prometheus text format.
+        """
+        return "".join(f"{line}\n" for family in self.families.values() for line in family.render())
+
+    def _register(self, family: Family) -> Family:
+        if family.name in self.families:
+            raise ValueError(f"a metric named '{family.name}' is already registered.")
+        self.families[family.name] = family
+        return family
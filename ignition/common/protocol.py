@@ -2,6 +2,17 @@ from typing import *
 from enum import Enum
 
 
+# the newest protocol version.
+# version 1 sends json encoded messages and the status as a separate frame.
+# version 2 sends binary messages with the status and response in a single frame
+# and supports streaming output in chunk frames.
+# version 3 uses the frames of version 2. a version 3 client keeps running requests
+# on its connection until the server closes it so a batch can share its container.
+# version 4 clients run the cases of a request. the output of the cases follows the extra of the result frame.
+# version 5 clients run benchmarks.
+version = 5
+
+
 class Status(Enum):
     """
     used to send status messages.
@@ -13,24 +24,213 @@ class Status(Enum):
     success = 200
     bad_request = 400
     timeout = 408
+    payload_too_large = 413
     internal_server_error = 500
     not_implemented = 501
+    service_unavailable = 503
     close = 1000
 
 
+class Stream(Enum):
+    """
+    the stream a chunk of streamed data belongs to.
+
+    stdout and stderr are the output of the program.
+    artifact is the build artifact of the program sent back to be cached.
+    """
+    stdout = 1
+    stderr = 2
+    artifact = 3
+
+
+class Hello(TypedDict):
+    """
+    used for type hinting dictionaries with these attributes.
+
+    sent by the client as the first message after connecting to the server.
+    token is the token the container was started with and identifies which launch the connection belongs to.
+    language is the language the container was warmed up for, None if it is generic.
+    version is the newest protocol version the client supports, a missing version means version 1.
+    """
+    token: Optional[str]
+    language: Optional[str]
+    version: int
+
+
+class NodeHello(TypedDict):
+    """
+    used for type hinting dictionaries with these attributes.
+
+    sent by an agent as the first message on every connection to the server.
+    node is the unique name of the node the agent runs on.
+    languages are the languages the node can run and warm are the languages it keeps warmed up.
+    version is the newest protocol version the agent supports.
+    secret is the secret shared with the server, None if the server accepts any agent.
+    """
+    node: str
+    languages: List[str]
+    warm: List[str]
+    version: int
+    secret: Optional[str]
+
+
+class Limits(TypedDict, total=False):
+    """
+    used for type hinting dictionaries with these attributes.
+
+    stdout and stderr are the max amount of bytes kept of each stream.
+    if kill is set the program is killed when a stream exceeds its limit
+    otherwise the rest of the output is dropped.
+    """
+    stdout: int
+    stderr: int
+    kill: bool
+
+
+class Case(TypedDict, total=False):
+    """
+    used for type hinting dictionaries with these attributes.
+
+    a run of a program with its own args and stdin, all keys are optional.
+    expected is the stdout the program is expected to write
+    and timeout the max amount of seconds the run may take.
+    """
+    args: str
+    stdin: str
+    expected: str
+    timeout: float
+
+
+class CaseResult(TypedDict):
+    """
+    used for type hinting dictionaries with these attributes.
+
+    the result of a case, status is the value of the Status of the case, success or timeout.
+    the other keys are the same as in Response. passed is None if the case has no expected output.
+    """
+    status: int
+    stdout: Optional[bytes]
+    stderr: Optional[bytes]
+    ns: int
+    stdout_bytes: int
+    stderr_bytes: int
+    stdout_truncated: bool
+    stderr_truncated: bool
+    returncode: int
+    user_ns: Optional[int]
+    sys_ns: Optional[int]
+    max_rss: Optional[int]
+    passed: Optional[bool]
+
+
+class Benchmark(TypedDict, total=False):
+    """
+    used for type hinting dictionaries with these attributes.
+
+    the program is run warmup times without being timed and then iterations times while being timed.
+    """
+    iterations: int
+    warmup: int
+
+
+class BenchmarkResult(TypedDict):
+    """
+    used for type hinting dictionaries with these attributes.
+
+    iterations is the amount of timed runs that finished, fewer than requested if the time ran out.
+    the times are the wall time of a run in ns and p95_ns is the nearest rank 95th percentile.
+    user_ns and sys_ns are the mean cpu time of a run, None if it was not measured.
+    samples are the times of all runs in the order they ran.
+    """
+    iterations: int
+    warmup: int
+    min_ns: int
+    median_ns: int
+    p95_ns: int
+    mean_ns: int
+    stddev_ns: int
+    user_ns: Optional[int]
+    sys_ns: Optional[int]
+    samples: List[int]
+
+
+class Step(TypedDict):
+    """
+    used for type hinting dictionaries with these attributes.
+
+    a command run while processing a request, such as a build command or the program itself.
+    ns is the wall time of the command and returncode its exit code, negative if it was killed by a signal.
+    user_ns and sys_ns are the cpu time the command spent in user and kernel mode
+    and max_rss the most memory in bytes it had resident at once.
+    the usage is None if the process running the command could not measure it,
+    max_rss is only measured by clients with the ignition-rusage helper installed.
+    """
+    command: str
+    ns: int
+    returncode: int
+    user_ns: Optional[int]
+    sys_ns: Optional[int]
+    max_rss: Optional[int]
+
+
 class Request(TypedDict):
     """
     used for type hinting dictionaries with these attributes.
+
+    stream is optional. if set the client streams the output as it is produced
+    instead of sending it in the response.
+    limits is optional. if missing the clients default limits are used.
+    artifact is optional and is the key of the build artifact of the program in the cache.
+    if cached is set the artifact is in the cache and the client can skip the build
+    otherwise the client sends the artifact back after a successful build.
+    cases is optional. if given the program is built once and run for every case instead of with args,
+    the cases are never streamed.
+    benchmark is optional. if given the program is built once and run repeatedly to time it, it is never streamed.
     """
     language: str
     args: str
     code: str
+    stream: bool
+    limits: Limits
+    artifact: str
+    cached: bool
+    cases: List[Case]
+    benchmark: Benchmark
 
 
 class Response(TypedDict):
     """
     used to type hinting dictionaries with these attributes.
+
+    stdout and stderr are the raw bytes the program wrote.
+    stdout_bytes and stderr_bytes are the amount of bytes the program wrote to each stream
+    and stdout_truncated and stderr_truncated are set if a stream exceeded its limit.
+    cached is set by the server if the response was memoized from an earlier run.
+    reused is set by the server if the program ran in a container that already ran another request of its batch.
+    cases holds the result of every case if the request had cases.
+    the streams are then empty and ns and the byte counts are the totals of the cases.
+    phases is the time in ns the client spent in each phase of the request,
+    setup (writing the program and extracting its artifact), compile and run.
+    returncode, user_ns, sys_ns and max_rss are the exit code and resource usage of the program, see Step.
+    steps has every command that was run in order, the build commands followed by the program.
+    with cases the usage is the total of the cases, max_rss the largest, and steps only has the build commands.
+    benchmark holds the statistics of a benchmark. the output and returncode are then those of the first timed run,
+    ns is the median, the cpu time the mean and max_rss the largest of the runs and steps only has the build commands.
     """
-    stdout: Optional[str]
-    stderr: Optional[str]
+    stdout: Optional[bytes]
+    stderr: Optional[bytes]
     ns: int
+    stdout_bytes: int
+    stderr_bytes: int
+    stdout_truncated: bool
+    stderr_truncated: bool
+    cached: bool
+    reused: bool
+    cases: List[CaseResult]
+    phases: Dict[str, int]
+    returncode: int
+    user_ns: Optional[int]
+    sys_ns: Optional[int]
+    max_rss: Optional[int]
+    steps: List[Step]
+    benchmark: BenchmarkResult
@@ -0,0 +1,87 @@
+/*
+ * runs a command as its child and writes the peak resident memory of the command in bytes to a file descriptor.
+ *
+ * usage: ignition-rusage fd command [args...]
+ *
+ * linux counts the memory a process had before it called exec in its peak resident memory,
+ * so a command forked from the client is charged for all the memory of the client.
+ * this program is small so the command it forks is charged for a few hundred KiB at most.
+ *
+ * it exits the same way as the command, signals asking it to stop are passed on to the command
+ * and the command is killed if this program is killed.
+ *
+ * build: gcc -O2 -o /usr/local/bin/ignition-rusage rusage.c
+ */
+#define _GNU_SOURCE
+#include <errno.h>
+#include <fcntl.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/prctl.h>
+#include <sys/resource.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+static pid_t child;
+
+static void forward(int sig) {
+    kill(child, sig);
+}
+
+int main(int argc, char **argv) {
+    if (argc < 3) {
+        fprintf(stderr, "usage: %s fd command [args...]\n", argv[0]);
+        return 127;
+    }
+    int report = atoi(argv[1]);
+    // the command does not inherit the report
+    fcntl(report, F_SETFD, FD_CLOEXEC);
+
+    pid_t parent = getpid();
+    if ((child = fork()) < 0) {
+        perror("fork");
+        return 127;
+    }
+    if (child == 0) {
+        prctl(PR_SET_PDEATHSIG, SIGKILL);
+        // the parent could have died before the death signal was set
+        if (getppid() != parent) {
+            _exit(127);
+        }
+        execvp(argv[2], argv + 2);
+        fprintf(stderr, "%s: %s\n", argv[2], strerror(errno));
+        _exit(127);
+    }
+    signal(SIGTERM, forward);
+    signal(SIGINT, forward);
+    signal(SIGHUP, forward);
+
+    int status;
+    struct rusage usage;
+    while (wait4(child, &status, 0, &usage) < 0) {
+        if (errno != EINTR) {
+            perror("wait4");
+            return 127;
+        }
+    }
+    // linux reports ru_maxrss in KiB
+    dprintf(report, "%ld\n", usage.ru_maxrss * 1024);
+    close(report);
+
+    if (WIFSIGNALED(status)) {
+        // dies from the same signal without dumping a core of its own
+        int sig = WTERMSIG(status);
+        struct rlimit core = {0, 0};
+        setrlimit(RLIMIT_CORE, &core);
+        signal(sig, SIG_DFL);
+        sigset_t set;
+        sigemptyset(&set);
+        sigaddset(&set, sig);
+        sigprocmask(SIG_UNBLOCK, &set, NULL);
+        kill(getpid(), sig);
+        return 128 + sig;
+    }
+    return WEXITSTATUS(status);
+}
@@ -0,0 +1,364 @@
+from typing import *
+import os
+import sys
+import signal
+import socket
+import asyncio
+import logging
+import platform
+import resource
+from collections import deque
+from pathlib import Path
+from time import perf_counter
+from ..common.communicator import Communicator
+from ..common import protocol
+from ..common.languages import summarize
+from ..logger import get_logger
+
+
+class LaunchError(Exception):
+    """
+    raised when a backend fails to start an instance.
+    """
+
+
+class Instance:
+    """
+    a started environment running an ignition client.
+
+    short_id identifies the instance in logs.
+    """
+    short_id: str
+
+
+class ExecutionBackend:
+    """
+    starts the environments ignition clients run in.
+
+    every launched instance runs a client that connects back to the server and sends a hello
+    with the token and language given in its environment.
+
+    resources are the resource limits of new instances in the terms of the docker sdk,
+    backends that can not enforce a limit ignores it.
+    the latency of the latest launches are kept in latencies.
+    """
+    loop: asyncio.AbstractEventLoop
+    logger: logging.Logger
+    resources: Dict[str, Any]
+    latencies: Deque[Tuple[str, float]]
+
+    def __init__(self, history: int = 1000,
+                 logger: Optional[logging.Logger] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self.loop = loop if loop else asyncio.get_event_loop()
+        self.logger = logger if logger else get_logger(__name__, logging.WARNING, stdout=True)
+        self.resources = {}
+        self.latencies = deque(maxlen=history)
+
+    async def launch(self, environment: Optional[Dict[str, str]] = None) -> Instance:
+        """
+        starts an instance with environment added to the environment of the client.
+
+        raises a LaunchError if the instance can not be started.
+        """
+        raise NotImplementedError
+
+    async def kill(self, instance: Instance) -> None:
+        """
+        stops an instance. an instance that already exited is ignored.
+        """
+        raise NotImplementedError
+
+    def version(self) -> str:
+        """
+        identifies the toolchains of the instances.
+
+        results and artifacts are only reused between instances with the same version.
+        """
+        raise NotImplementedError
+
+    def info(self) -> Dict[str, Any]:
+        """
+        information about the docker daemon in the terms of the docker sdk, empty if there is no daemon.
+        """
+        return {}
+
+    def mount_cache(self, directory: Path) -> None:
+        """
+        makes the artifact cache directory readable to the clients.
+        """
+
+    def close(self) -> None:
+        """
+        releases the resources of the backend without waiting for running launches.
+        """
+
+
+class LocalInstance(Instance):
+    """
+    a client running as a subprocess.
+    """
+    process: asyncio.subprocess.Process
+
+    def __init__(self, process: asyncio.subprocess.Process) -> None:
+        self.process = process
+        self.short_id = str(process.pid)
+
+
+class LocalBackend(ExecutionBackend):
+    """
+    runs the clients as plain subprocesses on the server.
+
+    every client runs in its own session and is limited by rlimits, by default to cpu_time seconds
+    of cpu time and files of at most file_size bytes.
+    the clients can also be started in new linux namespaces with unshare, for example ["--pid", "--fork"].
+    the network namespace can not be unshared since the client connects to the server over tcp.
+
+    there is no isolation from the host beyond that so this is only meant for trusted workloads
+    where the startup of a container is too slow.
+    """
+    host: str
+    port: int
+    rlimits: Dict[int, Tuple[int, int]]
+    namespaces: List[str]
+    environment: Dict[str, str]
+
+    entrypoint = Path(__file__).parent.parent.parent.joinpath("main.py")
+
+    def __init__(self, port: int = 6090,
+                 cpu_time: int = 60,
+                 file_size: int = 1024 * 1024 * 1024,
+                 rlimits: Optional[Dict[int, Tuple[int, int]]] = None,
+                 namespaces: Optional[List[str]] = None,
+                 history: int = 1000,
+                 logger: Optional[logging.Logger] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        super().__init__(history, logger, loop)
+        self.host = "127.0.0.1"
+        self.port = port
+        self.rlimits = {
+            resource.RLIMIT_CPU: (cpu_time, cpu_time),
+            resource.RLIMIT_FSIZE: (file_size, file_size),
+            **(rlimits if rlimits else {})
+        }
+        self.namespaces = namespaces if namespaces else []
+        self.environment = {}
+
+    async def launch(self, environment: Optional[Dict[str, str]] = None) -> Instance:
+        """
+        starts a client subprocess.
+        """
+        start = perf_counter()
+        command = [sys.executable, str(self.entrypoint), "client"]
+        if self.namespaces:
+            command = ["unshare", *self.namespaces, "--", *command]
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                env={
+                    **os.environ, **self.environment, **(environment if environment else {}),
+                    "IGNITION_HOST": self.host, "IGNITION_PORT": str(self.port)
+                },
+                stdin=asyncio.subprocess.DEVNULL,
+                start_new_session=True,
+                preexec_fn=self._limit
+            )
+        except OSError as e:
+            raise LaunchError(f"failed to start a local client: {e}") from e
+        instance = LocalInstance(process)
+        self.latencies.append((instance.short_id, latency := perf_counter() - start))
+        self.logger.debug(f"local client '{instance.short_id}' launched in {latency:.3f}s.")
+        return instance
+
+    async def kill(self, instance: LocalInstance) -> None:
+        """
+        kills the session of a client so the programs it started are killed too.
+        """
+        try:
+            os.killpg(instance.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await instance.process.wait()
+
+    def version(self) -> str:
+        """
+        the toolchains are the ones installed on the host.
+        """
+        return f"local-{platform.node()}-{platform.platform()}"
+
+    def mount_cache(self, directory: Path) -> None:
+        """
+        points the clients at the cache directory.
+        """
+        self.environment["IGNITION_CACHE"] = str(directory)
+
+    def _limit(self) -> None:
+        """
+        applies the rlimits in the forked child before the client starts.
+        """
+        for limit, value in self.rlimits.items():
+            resource.setrlimit(limit, value)
+
+
+class FakeInstance(Instance):
+    """
+    a fake client running as a task in the server process.
+    """
+    task: "asyncio.Task[None]"
+
+    def __init__(self, short_id: str, task: "asyncio.Task[None]") -> None:
+        self.short_id = short_id
+        self.task = task
+
+
+class FakeBackend(ExecutionBackend):
+    """
+    runs fake clients in the server process.
+
+    a fake client connects to the server like a real client but does not run anything.
+    a launch takes launch_latency seconds and a request run_latency seconds.
+    the response echoes the code of the request on stdout, streamed if the request is streamed.
+
+    used to measure the overhead of the scheduling, the protocol and the http layer on their own.
+    """
+    host: str
+    port: int
+    launch_latency: float
+    run_latency: float
+    communicator: Communicator
+    launched: int
+
+    def __init__(self, port: int = 6090,
+                 launch_latency: float = 0,
+                 run_latency: float = 0,
+                 history: int = 1000,
+                 logger: Optional[logging.Logger] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        super().__init__(history, logger, loop)
+        self.host = "127.0.0.1"
+        self.port = port
+        self.launch_latency = launch_latency
+        self.run_latency = run_latency
+        self.communicator = Communicator(self.logger, self.loop)
+        self.launched = 0
+
+    async def launch(self, environment: Optional[Dict[str, str]] = None) -> Instance:
+        """
+        starts a fake client after launch_latency seconds.
+        """
+        start = perf_counter()
+        await asyncio.sleep(self.launch_latency)
+        self.launched += 1
+        environment = environment if environment else {}
+        instance = FakeInstance(f"fake-{self.launched}", self.loop.create_task(self._client(
+            environment.get("IGNITION_TOKEN"), environment.get("IGNITION_LANGUAGE")
+        )))
+        self.latencies.append((instance.short_id, perf_counter() - start))
+        return instance
+
+    async def kill(self, instance: FakeInstance) -> None:
+        """
+        cancels a fake client.
+        """
+        instance.task.cancel()
+
+    def version(self) -> str:
+        return "fake"
+
+    async def _client(self, token: Optional[str], language: Optional[str]) -> None:
+        """
+        connects to the server and answers requests like a client until the connection is closed.
+        """
+        connection = socket.socket()
+        connection.setblocking(False)
+        try:
+            await self.loop.sock_connect(connection, (self.host, self.port))
+            await self.communicator.send_hello(connection, {
+                "token": token, "language": language, "version": protocol.version
+            })
+            while True:
+                request, version = await self.communicator.recv_request(connection)
+                start = perf_counter()
+                await asyncio.sleep(self.run_latency)
+                stdout = request["code"].encode("utf-8")
+                if request.get("cases") and version >= 4:
+                    await self.communicator.send_result(connection, protocol.Status.success, self._cases(
+                        request["cases"], stdout, int((perf_counter() - start) * 1e9)
+                    ), version)
+                    continue
+                if request.get("benchmark") and version >= 5:
+                    await self.communicator.send_result(connection, protocol.Status.success, await self._benchmark(
+                        request["benchmark"], stdout, int((perf_counter() - start) * 1e9)
+                    ), version)
+                    continue
+                if request.get("stream") and version >= 2:
+                    await self.communicator.send_chunk(connection, protocol.Stream.stdout, stdout, version)
+                await self.communicator.send_result(connection, protocol.Status.success, {
+                    "stdout": None if request.get("stream") and version >= 2 else stdout,
+                    "stderr": None,
+                    "ns": int((perf_counter() - start) * 1e9),
+                    "stdout_bytes": len(stdout),
+                    "stderr_bytes": 0,
+                    "stdout_truncated": False,
+                    "stderr_truncated": False
+                }, version)
+                if version < 3:
+                    return
+        except (ConnectionError, OSError, ValueError) as e:
+            self.logger.debug(f"fake client lost its connection ({e}).")
+        finally:
+            connection.close()
+
+    async def _benchmark(self, benchmark: protocol.Benchmark, stdout: bytes, ns: int) -> protocol.Response:
+        """
+        the response of a benchmark, every warmup and timed run takes run_latency seconds like the first one.
+        """
+        await asyncio.sleep(self.run_latency * (benchmark.get("warmup", 0) + benchmark.get("iterations", 1) - 1))
+        samples = [ns] * benchmark.get("iterations", 1)
+        return {
+            "stdout": stdout,
+            "stderr": None,
+            "ns": ns,
+            "stdout_bytes": len(stdout),
+            "stderr_bytes": 0,
+            "stdout_truncated": False,
+            "stderr_truncated": False,
+            "benchmark": summarize(samples, [], benchmark.get("warmup", 0))
+        }
+
+    @staticmethod
+    def _cases(cases: List[protocol.Case], stdout: bytes, ns: int) -> protocol.Response:
+        """
+        the response of a request with cases, every case echoes the code and passes if it expects the code.
+        it has the same fields as the response of execute_cases, nothing is run so the usage is not measured.
+        """
+        results: List[protocol.CaseResult] = [{
+            "status": protocol.Status.success.value,
+            "stdout": stdout,
+            "stderr": None,
+            "ns": ns // len(cases),
+            "stdout_bytes": len(stdout),
+            "stderr_bytes": 0,
+            "stdout_truncated": False,
+            "stderr_truncated": False,
+            "returncode": 0,
+            "user_ns": None,
+            "sys_ns": None,
+            "max_rss": None,
+            "passed": None if case.get("expected") is None else case["expected"].encode("utf-8") == stdout
+        } for case in cases]
+        return {
+            "stdout": None,
+            "stderr": None,
+            "ns": ns,
+            "stdout_bytes": len(stdout) * len(cases),
+            "stderr_bytes": 0,
+            "stdout_truncated": False,
+            "stderr_truncated": False,
+            "user_ns": None,
+            "sys_ns": None,
+            "max_rss": None,
+            "cases": results,
+            "phases": {"compile": 0, "run": ns},
+            "steps": []
+        }
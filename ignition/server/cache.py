@@ -0,0 +1,323 @@
+from typing import *
+import os
+import json
+import asyncio
+import uuid
+import hashlib
+import logging
+from pathlib import Path
+from collections import OrderedDict
+from ..common import protocol
+from ..logger import get_logger
+
+
+Result = Tuple[protocol.Status, Optional[protocol.Response]]
+
+
+class ArtifactCache:
+    """
+    content addressed store of build artifacts.
+
+    an artifact is the gzipped tarball of a programs build directory.
+    it is keyed on the language, the toolchain version, the source code and the build commands
+    so any change to either builds a new artifact.
+
+    the directory is mounted read only into every container so a client can extract
+    a cached artifact and skip the build. artifacts are only ever written by the server.
+
+    the least recently used artifacts are evicted when the store exceeds max_bytes.
+    """
+    directory: Path
+    toolchain: str
+    max_bytes: int
+    loop: asyncio.AbstractEventLoop
+    logger: logging.Logger
+
+    entries: "OrderedDict[str, int]"
+    size: int
+    hits: int
+    misses: int
+    evictions: int
+
+    def __init__(self, directory: Path, toolchain: str,
+                 max_bytes: int = 1024 * 1024 * 1024,
+                 logger: Optional[logging.Logger] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self.directory = directory
+        self.toolchain = toolchain
+        self.max_bytes = max_bytes
+        self.loop = loop if loop else asyncio.get_event_loop()
+        self.logger = logger if logger else get_logger(__name__, logging.WARNING, stdout=True)
+
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for path in sorted(self.directory.glob("*.tar.gz"), key=lambda path: path.stat().st_atime):
+            self.entries[path.name[:-len(".tar.gz")]] = (size := path.stat().st_size)
+            self.size += size
+        self._evict()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def __repr__(self) -> str:
+        return (
+            f"<ArtifactCache entries: {len(self.entries)} size: {self.size} / {self.max_bytes} "
+            f"hits: {self.hits} misses: {self.misses} evictions: {self.evictions}>"
+        )
+
+    def key(self, language: str, code: str, build: List[str]) -> str:
+        """
+        the key of the artifact of code built with the build commands.
+        """
+        return hashlib.sha256(json.dumps([language, self.toolchain, code, build]).encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> Path:
+        """
+        the path of an artifact relative to the cache directory.
+        """
+        return Path(f"{key}.tar.gz")
+
+    def get(self, key: str) -> bool:
+        """
+        looks up an artifact and marks it as recently used.
+
+        returns True on a hit.
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    async def put(self, key: str, artifact: bytes) -> None:
+        """
+        stores an artifact.
+
+        the artifact is written to a temporary file in an executor and moved in place so
+        a container never sees a partially written artifact.
+        """
+        if key in self.entries or len(artifact) > self.max_bytes:
+            return
+        await self.loop.run_in_executor(None, self._write, key, artifact)
+        if key in self.entries:
+            return
+        self.entries[key] = len(artifact)
+        self.size += len(artifact)
+        self.logger.debug(f"cached artifact '{key}' of {len(artifact)} bytes.")
+        self._evict()
+
+    def _write(self, key: str, artifact: bytes) -> None:
+        """
+        writes an artifact to the directory.
+        """
+        temporary = self.directory.joinpath(f".{key}.{uuid.uuid4().hex}.tmp")
+        temporary.write_bytes(artifact)
+        os.replace(temporary, self.directory.joinpath(self.path(key)))
+
+    def _evict(self) -> None:
+        """
+        removes the least recently used artifacts until the store fits in max_bytes.
+        """
+        while self.size > self.max_bytes and self.entries:
+            key, size = self.entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            try:
+                self.directory.joinpath(self.path(key)).unlink()
+            except FileNotFoundError:
+                pass
+            self.logger.debug(f"evicted artifact '{key}'.")
+
+
+class Memo(NamedTuple):
+    """
+    a memoized result.
+    """
+    result: Result
+    size: int
+    expires: float
+    tag: Optional[Hashable]
+
+
+class ResultCache:
+    """
+    memoizes the results of deterministic programs.
+
+    a result is keyed on the language, code, args and output limits of the request and the image id
+    so a program is only memoized for the exact toolchain that ran it.
+    only successful results are memoized and a result expires after ttl seconds.
+    a result marked reused ran in a container an earlier program could have tampered with and is not memoized.
+
+    the least recently used results are evicted when the cached output exceeds max_bytes.
+
+    concurrent runs of the same key are coalesced so only the first one runs the program
+    and the others wait for its result.
+
+    a result can be tagged, for example with the id of a snippet, and invalidated by the tag.
+    a run that was started before its tag was invalidated is not memoized.
+    the generation of a tag is only kept while runs started under the tag are in flight.
+    """
+    image: str
+    ttl: float
+    max_bytes: int
+    loop: asyncio.AbstractEventLoop
+    logger: logging.Logger
+
+    entries: "OrderedDict[str, Memo]"
+    running: Dict[str, "asyncio.Future[Result]"]
+    tags: Dict[Hashable, Set[str]]
+    generations: Dict[Hashable, int]
+    inflight: Dict[Hashable, int]
+    size: int
+    hits: int
+    misses: int
+    coalesced: int
+    evictions: int
+
+    def __init__(self, image: str,
+                 ttl: float = 60,
+                 max_bytes: int = 64 * 1024 * 1024,
+                 logger: Optional[logging.Logger] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self.image = image
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.loop = loop if loop else asyncio.get_event_loop()
+        self.logger = logger if logger else get_logger(__name__, logging.WARNING, stdout=True)
+
+        self.entries = OrderedDict()
+        self.running = {}
+        self.tags = {}
+        self.generations = {}
+        self.inflight = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"<ResultCache entries: {len(self.entries)} size: {self.size} / {self.max_bytes} "
+            f"hits: {self.hits} misses: {self.misses} coalesced: {self.coalesced} evictions: {self.evictions}>"
+        )
+
+    def key(self, request: protocol.Request) -> str:
+        """
+        the key of the result of a request.
+        """
+        return hashlib.sha256(json.dumps([
+            request["language"], self.image, request["code"], request["args"], request.get("limits"),
+            request.get("cases"), request.get("benchmark")
+        ], sort_keys=True).encode("utf-8")).hexdigest()
+
+    async def run(self, key: str, function: Callable[[], Awaitable[Result]],
+                  tag: Optional[Hashable] = None) -> Tuple[Result, bool]:
+        """
+        the result of key, running function if it is not cached.
+
+        returns the result and if it was served without running function.
+        if the run of the same key this call waited for is cancelled the key is looked up again.
+        """
+        while True:
+            if (memo := self._get(key)) is not None:
+                self.hits += 1
+                return memo.result, True
+            if (future := self.running.get(key)) is None:
+                break
+            await asyncio.wait((future,))
+            if not future.cancelled():
+                self.coalesced += 1
+                return future.result(), True
+
+        self.misses += 1
+        generation = self.generations.get(tag)
+        self.inflight[tag] = self.inflight.get(tag, 0) + 1
+        future = self.running[key] = self.loop.create_future()
+        try:
+            result = await function()
+            current = self.generations.get(tag)
+        except BaseException as e:
+            future.cancel()
+            raise e
+        finally:
+            self.running.pop(key, None)
+            self._finish(tag)
+        future.set_result(result)
+        if (result[0] == protocol.Status.success and not (result[1] and result[1].get("reused"))
+                and current == generation):
+            self._put(key, result, tag)
+        return result, False
+
+    def invalidate(self, tag: Hashable) -> None:
+        """
+        removes every result tagged with tag.
+
+        the runs of the tag that are in flight are not memoized when they finish.
+        """
+        if self.inflight.get(tag):
+            self.generations[tag] = self.generations.get(tag, 0) + 1
+        for key in list(self.tags.pop(tag, ())):
+            self._remove(key)
+        self.logger.debug(f"invalidated results tagged '{tag}'.")
+
+    def _finish(self, tag: Optional[Hashable]) -> None:
+        """
+        counts a finished run of tag and forgets the generation of the tag once no run of it is in flight.
+        """
+        if (left := self.inflight[tag] - 1) > 0:
+            self.inflight[tag] = left
+            return
+        del self.inflight[tag]
+        self.generations.pop(tag, None)
+
+    def _get(self, key: str) -> Optional[Memo]:
+        """
+        looks up a result that has not expired and marks it as recently used.
+        """
+        if (memo := self.entries.get(key)) is None:
+            return None
+        if memo.expires <= self.loop.time():
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return memo
+
+    def _put(self, key: str, result: Result, tag: Optional[Hashable]) -> None:
+        """
+        stores a result and evicts the least recently used results until the cache fits in max_bytes.
+        """
+        _, response = result
+        size = sum(
+            len(output[stream])
+            for output in ([response, *response.get("cases", ())] if response else ())
+            for stream in ("stdout", "stderr") if output[stream]
+        )
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self.entries[key] = Memo(result, size, self.loop.time() + self.ttl, tag)
+        self.size += size
+        if tag is not None:
+            self.tags.setdefault(tag, set()).add(key)
+        while self.size > self.max_bytes and self.entries:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        """
+        removes a result.
+        """
+        if (memo := self.entries.pop(key, None)) is None:
+            return
+        self.size -= memo.size
+        if memo.tag is not None and (keys := self.tags.get(memo.tag)):
+            keys.discard(key)
+            if not keys:
+                del self.tags[memo.tag]
@@ -0,0 +1,229 @@
+from typing import *
+import os
+import shutil
+import asyncio
+import logging
+from .scheduler import Scheduler
+from .backends import ExecutionBackend
+from ..logger import get_logger
+
+
+class Host(NamedTuple):
+    """
+    the resources of the host the containers run on.
+
+    memory and available_memory are in bytes and load is the load average of the last minute per cpu.
+    pressure is the percentage of the last 10 seconds some task waited for a cpu, None if the kernel
+    does not report pressure stall information.
+    """
+    cpus: int
+    memory: int
+    available_memory: int
+    load: float
+    pressure: Optional[float]
+
+    @classmethod
+    def measure(cls) -> "Host":
+        """
+        measures the resources of the host.
+        """
+        cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+        memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        available = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES")
+        try:
+            with open("/proc/meminfo") as meminfo:
+                for line in meminfo:
+                    if line.startswith("MemAvailable:"):
+                        # reclaimable caches counts as available
+                        available = int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            pass
+        pressure = None
+        try:
+            with open("/proc/pressure/cpu") as cpu:
+                # some avg10=1.34 avg60=2.82 avg300=3.75 total=86502112
+                pressure = float(cpu.readline().split()[1].split("=")[1])
+        except (OSError, IndexError, ValueError):
+            pass
+        return cls(cpus, memory, available, os.getloadavg()[0] / cpus, pressure)
+
+
+def supports_storage_opt(info: Dict[str, Any]) -> bool:
+    """
+    checks if the docker daemon can limit the size of a containers writable layer.
+
+    overlay2 only supports it on xfs (mounted with pquota) while devicemapper, btrfs and zfs always do.
+    """
+    if (driver := info.get("Driver")) in ("devicemapper", "btrfs", "zfs"):
+        return True
+    return driver == "overlay2" and dict(info.get("DriverStatus") or ()).get("Backing Filesystem") == "xfs"
+
+
+class CapacityController:
+    """
+    sizes the amount of concurrently running containers and their resource limits from the host.
+
+    the amount of slots of the scheduler is adjusted every interval seconds with additive increase
+    and multiplicative decrease. as long as requests are waiting a slot is added each interval.
+    the slots are cut by decrease when the host is overloaded: the cpu pressure is above max_pressure,
+    or the load per cpu is above max_load on kernels without pressure stall information,
+    less than reserve bytes of memory is available or the smoothed run time of the requests of a language
+    is more than tolerance times the baseline of the language.
+    cpu bound programs keep the load per cpu around 1 at full throughput so max_load leaves room above that.
+
+    the signals are averaged over a window, 10 seconds for the pressure and a minute for the load,
+    so after a cut the slots are not cut again until the window has passed and shows the effect of the cut.
+
+    the baseline of a language follows a faster run time at once and moves drift of the way towards a slower one
+    every interval so it tracks the programs that are run lately instead of the fastest run ever seen.
+
+    the slots are kept between min_slots and max_slots. max_slots defaults to the amount of containers
+    that fit in the memory of the host next to reserve.
+
+    every container is limited to memory bytes of memory and an equal share of the cpus between the slots.
+    backends that are not docker ignore the limits they can not enforce.
+    if the docker daemon supports it the writable layer of the containers is limited to an equal share of
+    the free disk space of docker, at most max_storage bytes.
+    new limits only apply to containers started after the change.
+    """
+    scheduler: Scheduler
+    backend: ExecutionBackend
+    loop: asyncio.AbstractEventLoop
+    logger: logging.Logger
+
+    host: Host
+    memory: int
+    reserve: int
+    min_slots: int
+    max_slots: int
+    max_load: float
+    max_pressure: float
+    tolerance: float
+    drift: float
+    decrease: float
+    interval: float
+    storage: Optional[int]
+
+    baselines: Dict[str, float]
+    seen: Dict[str, int]
+    held_until: float
+
+    cpu_period = 100_000
+    pressure_window = 10
+    load_window = 60
+
+    def __init__(self, scheduler: Scheduler,
+                 backend: ExecutionBackend,
+                 memory: int = 128 * 1024 * 1024,
+                 reserve: int = 1024 * 1024 * 1024,
+                 min_slots: int = 1,
+                 max_slots: Optional[int] = None,
+                 max_load: float = 2.0,
+                 max_pressure: float = 40.0,
+                 tolerance: float = 2.0,
+                 drift: float = 0.05,
+                 decrease: float = 0.75,
+                 interval: float = 5,
+                 max_storage: Optional[int] = 4 * 1024 * 1024 * 1024,
+                 logger: Optional[logging.Logger] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self.scheduler = scheduler
+        self.backend = backend
+        self.loop = loop if loop else asyncio.get_event_loop()
+        self.logger = logger if logger else get_logger(__name__, logging.WARNING, stdout=True)
+
+        self.host = Host.measure()
+        self.memory = memory
+        self.reserve = reserve
+        self.min_slots = max(1, min_slots)
+        self.max_slots = max(self.min_slots, max_slots if max_slots else (self.host.memory - reserve) // memory)
+        self.max_load = max_load
+        self.max_pressure = max_pressure
+        self.tolerance = tolerance
+        self.drift = drift
+        self.decrease = decrease
+        self.interval = interval
+
+        info = backend.info()
+        self.storage = min(
+            max_storage, shutil.disk_usage(info.get("DockerRootDir", "/var/lib/docker")).free // self.max_slots
+        ) if max_storage and supports_storage_opt(info) else None
+
+        self.baselines = {}
+        self.seen = {}
+        self.held_until = 0
+        self.resize(min(max(self.scheduler.capacity, self.min_slots), self.max_slots))
+
+    def __repr__(self) -> str:
+        return (
+            f"<CapacityController slots: {self.scheduler.capacity} ({self.min_slots} - {self.max_slots}) "
+            f"load: {self.host.load:.2f} pressure: {self.host.pressure} available memory: {self.host.available_memory}>"
+        )
+
+    def limits(self, slots: int) -> Dict[str, Any]:
+        """
+        the docker resource limits of a container when slots containers run at once.
+        """
+        limits = {
+            "cpu_period": self.cpu_period,
+            "cpu_quota": max(self.cpu_period // 100, self.cpu_period * self.host.cpus // slots),
+            "mem_limit": self.memory,
+            # no swap on top of the memory limit
+            "memswap_limit": self.memory
+        }
+        if self.storage:
+            limits["storage_opt"] = {"size": str(self.storage)}
+        return limits
+
+    def resize(self, slots: int) -> None:
+        """
+        sets the amount of slots and the limits of new containers.
+        """
+        self.backend.resources = self.limits(slots)
+        if slots != self.scheduler.capacity:
+            self.logger.info(f"resizing from {self.scheduler.capacity} to {slots} slots.")
+            self.scheduler.resize(slots)
+
+    def overloaded(self) -> bool:
+        """
+        checks if the host or the requests show signs of overload.
+        """
+        busy = (
+            self.host.pressure > self.max_pressure if self.host.pressure is not None else self.host.load > self.max_load
+        )
+        if busy or self.host.available_memory < self.reserve:
+            return True
+        slow = False
+        for language, service_time in self.scheduler.service_times.items():
+            # only languages that completed requests since the last check say anything about the host
+            if self.seen.get(language) == (completions := self.scheduler.completions[language]):
+                continue
+            self.seen[language] = completions
+            baseline = self.baselines.get(language, service_time)
+            baseline = self.baselines[language] = min(service_time, baseline + self.drift * (service_time - baseline))
+            slow = slow or service_time > self.tolerance * baseline
+        return slow
+
+    def adjust(self) -> None:
+        """
+        measures the host and adjusts the amount of slots once.
+        """
+        self.host = Host.measure()
+        slots = self.scheduler.capacity
+        if self.overloaded():
+            if (now := self.loop.time()) < self.held_until:
+                return
+            slots = int(slots * self.decrease)
+            self.held_until = now + (self.pressure_window if self.host.pressure is not None else self.load_window)
+        elif len(self.scheduler) and len(self.scheduler.running) >= slots + self.scheduler.remote:
+            slots += 1
+        self.resize(min(max(slots, self.min_slots), self.max_slots))
+
+    async def run(self) -> None:
+        """
+        adjusts the slots every interval seconds.
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            self.adjust()
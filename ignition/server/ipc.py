@@ -0,0 +1,433 @@
+from typing import *
+import os
+import pickle
+import socket
+import asyncio
+import logging
+import itertools
+from pathlib import Path
+from ..common.communicator import Communicator
+from ..common import protocol
+from .scheduler import Overloaded
+from ..logger import get_logger
+if TYPE_CHECKING:
+    from .server import Server
+
+
+Message = Tuple[Any, ...]
+
+# the items of a stream or batch the dispatcher sends ahead of the worker consuming them
+window = 16
+
+
+class Dispatcher:
+    """
+    serves a server to http workers in other processes over a unix socket.
+
+    the server with its scheduler, pool and containers lives in a single process so the limit of
+    concurrently running requests is global while the http workers scale over the cpus.
+
+    every worker keeps one connection that all its requests are multiplexed over.
+    a message is a pickled tuple of its kind, the id of the call and its arguments sent as a data frame.
+    the socket is only accessible to the user running the server since pickles are trusted.
+
+    the items of a stream or batch are sent at most window ahead of the worker consuming them.
+    the worker acknowledges the items it consumed so a slow worker slows down the stream on the server
+    just like a slow caller of Server.stream does.
+
+    the requests of a worker that disconnects are aborted.
+    """
+    server: "Server"
+    communicator: Communicator
+    loop: asyncio.AbstractEventLoop
+    logger: logging.Logger
+    path: Path
+
+    def __init__(self, server: "Server", path: Path,
+                 logger: Optional[logging.Logger] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self.server = server
+        self.loop = loop if loop else asyncio.get_event_loop()
+        self.logger = logger if logger else get_logger(__name__, logging.WARNING, stdout=True)
+        self.communicator = Communicator(self.logger, self.loop, max_frame_size=server.communicator.max_frame_size)
+        self.path = path
+
+    async def run(self) -> None:
+        """
+        listens for workers on the socket.
+
+        a socket left behind by a previous dispatcher is replaced.
+        """
+        sock = socket.socket(socket.AF_UNIX)
+        self.path.unlink(missing_ok=True)
+        sock.bind(str(self.path))
+        os.chmod(self.path, 0o600)
+        sock.setblocking(False)
+        sock.listen()
+        self.logger.info(f"dispatching requests from workers on '{self.path}'...")
+        try:
+            while True:
+                connection, _ = await self.loop.sock_accept(sock)
+                self.loop.create_task(self._serve(connection))
+        finally:
+            sock.close()
+            self.path.unlink(missing_ok=True)
+
+    async def _serve(self, connection: socket.socket) -> None:
+        """
+        handles the messages of a worker until it disconnects.
+        """
+        lock = asyncio.Lock()
+        tasks: Dict[int, "asyncio.Task[None]"] = {}
+        credits: Dict[int, asyncio.Semaphore] = {}
+        self.logger.info("worker connected.")
+        try:
+            while True:
+                kind, call, *arguments = pickle.loads(await self.communicator.recv_data(connection))
+                if kind == "process":
+                    task = tasks[call] = self.loop.create_task(self._process(connection, lock, call, *arguments))
+                    task.add_done_callback(lambda _, call=call: tasks.pop(call, None))
+                elif kind in ("stream", "batch"):
+                    handler = {"stream": self._stream, "batch": self._batch}[kind]
+                    credits[call] = asyncio.Semaphore(window)
+                    task = tasks[call] = self.loop.create_task(
+                        handler(connection, lock, call, credits[call], *arguments)
+                    )
+                    task.add_done_callback(lambda _, call=call: (tasks.pop(call, None), credits.pop(call, None)))
+                elif kind == "ack":
+                    if semaphore := credits.get(call):
+                        for _ in range(arguments[0]):
+                            semaphore.release()
+                elif kind == "cancel":
+                    if task := tasks.get(call):
+                        task.cancel()
+                elif kind == "invalidate":
+                    self.server.invalidate(*arguments)
+                elif kind == "metrics":
+                    await self._send(connection, lock, ("result", call, await self.server.metrics()))
+                elif kind == "exposition":
+                    await self._send(connection, lock, ("result", call, await self.server.exposition()))
+        except (ConnectionError, ValueError, EOFError, pickle.UnpicklingError) as e:
+            self.logger.info(f"worker disconnected ({e}).")
+        finally:
+            for task in list(tasks.values()):
+                task.cancel()
+            connection.close()
+
+    async def _process(self, connection: socket.socket, lock: asyncio.Lock, call: int,
+                       request: protocol.Request, options: Dict[str, Any]) -> None:
+        """
+        processes a request for a worker and sends back the result.
+        """
+        try:
+            result = await self.server.process(request, **options)
+        except Overloaded as e:
+            await self._send(connection, lock, ("overloaded", call, str(e), e.retry_after))
+            return
+        except Exception as e:
+            self.logger.exception("processing a request for a worker failed.")
+            await self._send(connection, lock, ("error", call, repr(e)))
+            return
+        await self._send(connection, lock, ("result", call, result))
+
+    async def _stream(self, connection: socket.socket, lock: asyncio.Lock, call: int, credits: asyncio.Semaphore,
+                      request: protocol.Request, options: Dict[str, Any]) -> None:
+        """
+        streams a request for a worker, every item is sent as it is produced once the worker has room for it.
+        """
+        try:
+            async for item in self.server.stream(request, **options):
+                await credits.acquire()
+                await self._send(connection, lock, ("item", call, item))
+        except Overloaded as e:
+            await self._send(connection, lock, ("overloaded", call, str(e), e.retry_after))
+            return
+        except Exception as e:
+            self.logger.exception("streaming a request for a worker failed.")
+            await self._send(connection, lock, ("error", call, repr(e)))
+            return
+        await self._send(connection, lock, ("end", call))
+
+    async def _batch(self, connection: socket.socket, lock: asyncio.Lock, call: int, credits: asyncio.Semaphore,
+                     requests: List[protocol.Request], options: Dict[str, Any]) -> None:
+        """
+        runs a batch for a worker, every result is sent as it completes once the worker has room for it.
+        """
+        try:
+            async for item in self.server.batch(requests, **options):
+                await credits.acquire()
+                await self._send(connection, lock, ("item", call, item))
+        except Exception as e:
+            self.logger.exception("running a batch for a worker failed.")
+            await self._send(connection, lock, ("error", call, repr(e)))
+            return
+        await self._send(connection, lock, ("end", call))
+
+    async def _send(self, connection: socket.socket, lock: asyncio.Lock, message: Message) -> None:
+        """
+        sends a message to a worker.
+
+        the send is shielded so a cancelled request never leaves half a frame on the connection.
+        a worker that is gone is ignored, the connection is cleaned up when its messages stop.
+        """
+        try:
+            await asyncio.shield(self._write(connection, lock, message))
+        except OSError as e:
+            self.logger.debug(f"failed to send to worker ({e}).")
+
+    async def _write(self, connection: socket.socket, lock: asyncio.Lock, message: Message) -> None:
+        async with lock:
+            await self.communicator.send_data(connection, pickle.dumps(message, pickle.HIGHEST_PROTOCOL))
+
+
+class RemoteServer:
+    """
+    a server running in another process reached through its dispatcher.
+
+    has the same public API as Server so an http worker can use either.
+    the connection is established on the first request and again after it is lost.
+    a scheduler that can not be reached or is lost during a request raises Overloaded
+    so the caller retries after retry_after seconds.
+
+    the replies of a call are queued in a queue of at most window items and the final reply.
+    the items of a stream or batch are acknowledged as they are consumed, see Dispatcher.
+    """
+    communicator: Communicator
+    loop: asyncio.AbstractEventLoop
+    logger: logging.Logger
+    path: Path
+
+    connection: Optional[socket.socket]
+    connecting: asyncio.Lock
+    lock: asyncio.Lock
+    calls: Dict[int, "asyncio.Queue[Message]"]
+    counter: Iterator[int]
+
+    retry_after = 1
+
+    def __init__(self, path: Path,
+                 logger: Optional[logging.Logger] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self.loop = loop if loop else asyncio.get_event_loop()
+        self.logger = logger if logger else get_logger(__name__, logging.WARNING, stdout=True)
+        self.communicator = Communicator(self.logger, self.loop)
+        self.path = path
+
+        self.connection = None
+        self.connecting = asyncio.Lock()
+        self.lock = asyncio.Lock()
+        self.calls = {}
+        self.counter = itertools.count()
+
+    async def process(self, request: protocol.Request,
+                      memoize: bool = False,
+                      tag: Optional[Hashable] = None,
+                      user: Optional[Hashable] = None,
+                      priority: int = 0) -> Tuple[protocol.Status, Optional[protocol.Response]]:
+        """
+        processes a request on the server, see Server.process.
+        """
+        call, replies = await self._submit("process", request, {
+            "memoize": memoize, "tag": tag, "user": user, "priority": priority
+        })
+        finished = False
+        try:
+            reply = await replies.get()
+            finished = True
+            return self._check(reply)[2]
+        finally:
+            self._forget(call, finished)
+
+    async def stream(self, request: protocol.Request,
+                     user: Optional[Hashable] = None,
+                     priority: int = 0) -> AsyncIterator[
+            Union[Tuple[protocol.Stream, bytes], Tuple[protocol.Status, Optional[protocol.Response]]]]:
+        """
+        streams a request on the server, see Server.stream.
+        """
+        call, replies = await self._submit("stream", request, {"user": user, "priority": priority})
+        finished = False
+        consumed = 0
+        try:
+            while (reply := await replies.get())[0] == "item":
+                yield reply[2]
+                consumed = await self._consumed(call, consumed + 1)
+            finished = True
+            self._check(reply)
+        finally:
+            self._forget(call, finished)
+
+    async def batch(self, requests: Sequence[protocol.Request],
+                    memoize: Optional[Sequence[bool]] = None,
+                    tags: Optional[Sequence[Optional[Hashable]]] = None,
+                    user: Optional[Hashable] = None,
+                    priority: int = 0) -> AsyncIterator[
+            Tuple[int, Union[Tuple[protocol.Status, Optional[protocol.Response]], Overloaded]]]:
+        """
+        runs a batch on the server, see Server.batch.
+
+        a lost connection raises Overloaded even if some results were already yielded.
+        """
+        call, replies = await self._submit("batch", list(requests), {
+            "memoize": list(memoize) if memoize else None, "tags": list(tags) if tags else None,
+            "user": user, "priority": priority
+        })
+        finished = False
+        consumed = 0
+        try:
+            while (reply := await replies.get())[0] == "item":
+                yield reply[2]
+                consumed = await self._consumed(call, consumed + 1)
+            finished = True
+            self._check(reply)
+        finally:
+            self._forget(call, finished)
+
+    def invalidate(self, tag: Hashable) -> None:
+        """
+        forgets the memoized results tagged with tag on the server.
+        """
+        self.loop.create_task(self._notify(("invalidate", None, tag)))
+
+    async def metrics(self) -> Dict[str, Any]:
+        """
+        the metrics of the server, see Server.metrics.
+        """
+        call, replies = await self._submit("metrics")
+        try:
+            return self._check(await replies.get())[2]
+        finally:
+            self.calls.pop(call, None)
+
+    async def exposition(self) -> str:
+        """
+        the metrics of the server in the prometheus text format, see Server.exposition.
+        """
+        call, replies = await self._submit("exposition")
+        try:
+            return self._check(await replies.get())[2]
+        finally:
+            self.calls.pop(call, None)
+
+    async def _connect(self) -> socket.socket:
+        """
+        connects to the dispatcher unless already connected.
+        """
+        async with self.connecting:
+            if self.connection:
+                return self.connection
+            connection = socket.socket(socket.AF_UNIX)
+            connection.setblocking(False)
+            try:
+                await self.loop.sock_connect(connection, str(self.path))
+            except OSError as e:
+                connection.close()
+                self.logger.error(f"failed to connect to the scheduler on '{self.path}' ({e}).")
+                raise Overloaded("the scheduler is unavailable.", self.retry_after)
+            self.connection = connection
+            self.loop.create_task(self._read(connection))
+            self.logger.info(f"connected to the scheduler on '{self.path}'.")
+            return connection
+
+    async def _read(self, connection: socket.socket) -> None:
+        """
+        passes the replies of the dispatcher on to their calls until the connection is lost.
+
+        every call waiting when the connection is lost is told so.
+        a dispatcher that sends more than window items ahead is disconnected.
+        """
+        try:
+            while True:
+                reply = pickle.loads(await self.communicator.recv_data(connection))
+                if replies := self.calls.get(reply[1]):
+                    try:
+                        replies.put_nowait(reply)
+                    except asyncio.QueueFull:
+                        raise ValueError(f"the scheduler sent more than {window} items ahead.")
+        except (ConnectionError, ValueError, EOFError, pickle.UnpicklingError) as e:
+            self.logger.error(f"lost the connection to the scheduler ({e}).")
+        finally:
+            connection.close()
+            if self.connection is connection:
+                self.connection = None
+            for replies in self.calls.values():
+                if replies.full():
+                    # the output of the call is lost anyway, the last item makes room
+                    replies.get_nowait()
+                replies.put_nowait(("lost", None))
+
+    async def _submit(self, kind: str, *arguments: Any) -> Tuple[int, "asyncio.Queue[Message]"]:
+        """
+        sends a call to the dispatcher and returns its id and the queue its replies arrive in.
+        """
+        await self._connect()
+        call = next(self.counter)
+        # the items sent ahead, the final reply and the reply of a lost connection
+        self.calls[call] = replies = asyncio.Queue(window + 2)
+        try:
+            await self._send((kind, call, *arguments))
+        except OSError as e:
+            self.calls.pop(call, None)
+            self.logger.error(f"failed to send to the scheduler ({e}).")
+            raise Overloaded("the scheduler is unavailable.", self.retry_after)
+        return call, replies
+
+    async def _consumed(self, call: int, consumed: int) -> int:
+        """
+        acknowledges the consumed items of a call once half a window of them has been consumed.
+
+        returns the amount of consumed items that are not acknowledged yet.
+        """
+        if consumed < max(window // 2, 1):
+            return consumed
+        try:
+            await self._send(("ack", call, consumed))
+        except OSError as e:
+            # the lost connection is reported through the replies of the call
+            self.logger.debug(f"failed to acknowledge items of call {call} ({e}).")
+        return 0
+
+    def _check(self, reply: Message) -> Message:
+        """
+        raises the errors of the dispatcher.
+
+        a lost connection is raised as Overloaded and an unexpected error on the server as a RuntimeError.
+        """
+        if reply[0] == "overloaded":
+            raise Overloaded(reply[2], reply[3])
+        if reply[0] == "lost":
+            raise Overloaded("lost the connection to the scheduler.", self.retry_after)
+        if reply[0] == "error":
+            raise RuntimeError(f"the server failed: {reply[2]}")
+        return reply
+
+    def _forget(self, call: int, finished: bool) -> None:
+        """
+        forgets a call and cancels it on the server if it was abandoned before it finished.
+        """
+        if self.calls.pop(call, None) is not None and not finished and self.connection:
+            self.loop.create_task(self._notify(("cancel", call)))
+
+    async def _notify(self, message: Message) -> None:
+        """
+        sends a message nothing waits a reply for.
+        """
+        try:
+            await self._connect()
+            await self._send(message)
+        except (Overloaded, OSError) as e:
+            self.logger.warning(f"failed to send '{message[0]}' to the scheduler ({e}).")
+
+    async def _send(self, message: Message) -> None:
+        """
+        sends a message to the dispatcher.
+
+        the send is shielded so an abandoned call never leaves half a frame on the connection.
+        """
+        await asyncio.shield(self._write(message))
+
+    async def _write(self, message: Message) -> None:
+        async with self.lock:
+            if not self.connection:
+                raise ConnectionError("not connected to the scheduler.")
+            await self.communicator.send_data(self.connection, pickle.dumps(message, pickle.HIGHEST_PROTOCOL))
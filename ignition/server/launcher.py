@@ -0,0 +1,124 @@
+from typing import *
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from pathlib import Path
+from .backends import ExecutionBackend, LaunchError
+import docker
+import docker.errors
+import docker.models.containers
+
+
+class ContainerLauncher(ExecutionBackend):
+    """
+    execution backend starting docker containers without blocking the event loop.
+
+    the docker sdk is synchronous so every call is run in a bounded thread pool.
+    this allows max_workers containers to be started at once while the event loop keeps serving requests.
+
+    a launch that takes longer than timeout seconds raises an asyncio.TimeoutError
+    and a launch the docker daemon fails raises a LaunchError.
+    a launch that times out or is cancelled can not be interrupted inside the docker sdk
+    so the container is killed as soon as it has started instead.
+
+    volumes are mounted into every container and resources are the docker resource limits of new containers.
+    """
+    docker_client: docker.DockerClient
+    executor: ThreadPoolExecutor
+
+    image: str
+    timeout: float
+    volumes: Dict[str, Dict[str, str]]
+
+    def __init__(self, docker_client: docker.DockerClient,
+                 max_workers: int = 8,
+                 timeout: float = 30,
+                 image: str = "ignition",
+                 history: int = 1000,
+                 volumes: Optional[Dict[str, Dict[str, str]]] = None,
+                 resources: Optional[Dict[str, Any]] = None,
+                 logger: Optional[logging.Logger] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        super().__init__(history, logger, loop)
+        self.docker_client = docker_client
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="ignition-launcher")
+
+        self.image = image
+        self.timeout = timeout
+        self.volumes = volumes if volumes else {}
+        self.resources = resources if resources else {}
+
+    async def launch(self, environment: Optional[Dict[str, str]] = None,
+                     **kwargs) -> docker.models.containers.Container:
+        """
+        starts an ignition container.
+
+        extra keyword arguments are passed on to the docker sdks containers.run.
+        """
+        start = perf_counter()
+        future = self.loop.run_in_executor(self.executor, functools.partial(
+            self.docker_client.containers.run,
+            self.image, detach=True, auto_remove=True, extra_hosts={"host.docker.internal": "host-gateway"},
+            environment=environment if environment else {}, volumes=self.volumes, **{**self.resources, **kwargs}
+        ))
+        try:
+            container = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            self.logger.warning(f"container launch aborted after {perf_counter() - start:.3f}s.")
+            future.add_done_callback(self._discard)
+            raise e
+        except docker.errors.DockerException as e:
+            raise LaunchError(f"failed to start a container: {e}") from e
+        latency = perf_counter() - start
+        self.latencies.append((container.short_id, latency))
+        self.logger.debug(f"container '{container.short_id}' launched in {latency:.3f}s.")
+        return container
+
+    async def kill(self, container: docker.models.containers.Container) -> None:
+        """
+        kills a container.
+
+        a container that already exited is ignored.
+        """
+        await self.loop.run_in_executor(self.executor, self._kill, container)
+
+    def version(self) -> str:
+        """
+        the toolchains are part of the image so the image id versions every toolchain at once.
+        """
+        return self.docker_client.images.get(self.image).id
+
+    def info(self) -> Dict[str, Any]:
+        return self.docker_client.info()
+
+    def mount_cache(self, directory: Path) -> None:
+        """
+        mounts the cache directory read only at /cache where the clients look for it.
+        """
+        self.volumes[str(directory)] = {"bind": "/cache", "mode": "ro"}
+
+    def close(self) -> None:
+        """
+        shuts down the thread pool without waiting for running launches.
+        """
+        self.executor.shutdown(wait=False)
+
+    def _kill(self, container: docker.models.containers.Container) -> None:
+        """
+        kills a container from a thread in the pool.
+        """
+        try:
+            container.kill()
+            self.logger.debug(f"container '{container.short_id}' killed.")
+        except docker.errors.APIError:
+            self.logger.debug(f"container '{container.short_id}' already exited.")
+
+    def _discard(self, future: "asyncio.Future[docker.models.containers.Container]") -> None:
+        """
+        kills the container of an aborted launch once it has started.
+        """
+        if future.cancelled() or future.exception():
+            return
+        self.loop.run_in_executor(self.executor, self._kill, future.result())
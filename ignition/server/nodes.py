@@ -0,0 +1,217 @@
+from typing import *
+import hmac
+import socket
+import asyncio
+import logging
+from ..common.communicator import Communicator
+from ..common import protocol
+from ..logger import get_logger
+
+
+class Slot:
+    """
+    a connection of a node that runs one request at a time.
+
+    a node opens one connection per request it can run at once.
+    a slot is busy from acquire until it is released back to its node.
+    """
+    connection: socket.socket
+    address: Tuple[str, int]
+    node: "Node"
+    version: int
+    busy: bool
+
+    def __init__(self, connection: socket.socket, address: Tuple[str, int], node: "Node", version: int) -> None:
+        self.connection = connection
+        self.address = address
+        self.node = node
+        self.version = version
+        self.busy = False
+
+    def alive(self) -> bool:
+        """
+        checks if the agent is still connected.
+
+        peeks at the socket without consuming anything. an idle agent never sends anything
+        so readable data or an end of file both means the slot is broken.
+        """
+        try:
+            self.connection.recv(1, socket.MSG_PEEK)
+        except BlockingIOError:
+            return True
+        except OSError:
+            pass
+        return False
+
+    def close(self) -> None:
+        """
+        closes the connection.
+        """
+        self.connection.close()
+
+
+class Node:
+    """
+    an execution node that runs requests for the server.
+
+    languages are the languages the node supports and warm are the languages it has containers warmed up for.
+    """
+    name: str
+    languages: Set[str]
+    warm: Set[str]
+    slots: List[Slot]
+
+    def __init__(self, name: str, languages: Iterable[str], warm: Iterable[str]) -> None:
+        self.name = name
+        self.languages = set(languages)
+        self.warm = set(warm)
+        self.slots = []
+
+    def __repr__(self) -> str:
+        return f"<Node '{self.name}' busy: {self.busy()} / {len(self.slots)}>"
+
+    def busy(self) -> int:
+        """
+        the amount of busy slots.
+        """
+        return sum(1 for slot in self.slots if slot.busy)
+
+    def load(self) -> float:
+        """
+        the share of busy slots.
+        """
+        return self.busy() / len(self.slots) if self.slots else 1
+
+
+class Cluster:
+    """
+    the execution nodes connected to the server.
+
+    an agent on a node connects once per slot and sends a hello with the name of the node,
+    the languages it supports and the languages it has warmed up.
+    if a secret is given a slot is only registered if its hello has the same secret.
+
+    a request is placed on a free slot of a node supporting its language.
+    nodes warmed up for the language are preferred and among them the least loaded node is chosen.
+
+    a node is dropped with all its slots as soon as one of its slots fails since a node usually fails as a whole.
+    a slot that is left in an unknown state by a request is discarded on its own.
+    on_change is called whenever the amount of slots changes.
+    """
+    communicator: Communicator
+    loop: asyncio.AbstractEventLoop
+    logger: logging.Logger
+    on_change: Callable[[], None]
+
+    nodes: Dict[str, Node]
+    secret: Optional[str]
+    hello_timeout: float
+
+    def __init__(self, communicator: Communicator,
+                 on_change: Optional[Callable[[], None]] = None,
+                 secret: Optional[str] = None,
+                 hello_timeout: float = 5,
+                 logger: Optional[logging.Logger] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self.communicator = communicator
+        self.loop = loop if loop else asyncio.get_event_loop()
+        self.logger = logger if logger else get_logger(__name__, logging.WARNING, stdout=True)
+        self.on_change = on_change if on_change else lambda: None
+
+        self.nodes = {}
+        self.secret = secret
+        self.hello_timeout = hello_timeout
+
+    def __len__(self) -> int:
+        """
+        the amount of slots of all nodes.
+        """
+        return sum(len(node.slots) for node in self.nodes.values())
+
+    def __repr__(self) -> str:
+        return f"<Cluster nodes: {list(self.nodes.values())}>"
+
+    async def register(self, connection: socket.socket, address: Tuple[str, int]) -> None:
+        """
+        registers a newly connected slot of a node.
+
+        a slot that does not send a hello with the secret of the cluster in time is closed.
+
+        the protocol version used with the agent is the newest version supported by both sides.
+        """
+        try:
+            hello = await asyncio.wait_for(self.communicator.recv_hello(connection), self.hello_timeout)
+            name = hello["node"]
+        except (asyncio.TimeoutError, ValueError, ConnectionError, KeyError) as e:
+            self.logger.warning(f"'{address[0]}:{address[1]}' did not send a valid hello ({e}). closing connection.")
+            connection.close()
+            return
+        if self.secret is not None and not hmac.compare_digest(
+            str(hello.get("secret") or "").encode("utf-8"), self.secret.encode("utf-8")
+        ):
+            self.logger.warning(f"'{address[0]}:{address[1]}' sent a wrong secret. closing connection.")
+            connection.close()
+            return
+        if not (node := self.nodes.get(name)):
+            node = self.nodes[name] = Node(name, hello.get("languages", ()), hello.get("warm", ()))
+            self.logger.info(f"node '{name}' joined from '{address[0]}'.")
+        node.slots.append(Slot(connection, address, node, min(hello.get("version", 1), protocol.version)))
+        self.on_change()
+
+    def acquire(self, language: str) -> Optional[Slot]:
+        """
+        takes a free slot for a request in language.
+
+        returns None if no node has a free slot for the language.
+        """
+        candidates = sorted(
+            (node for node in self.nodes.values() if language in node.languages and node.busy() < len(node.slots)),
+            key=lambda node: (language not in node.warm, node.load())
+        )
+        for node in candidates:
+            for slot in node.slots:
+                if slot.busy:
+                    continue
+                if not slot.alive():
+                    self.fail(node)
+                    break
+                slot.busy = True
+                return slot
+        return None
+
+    def release(self, slot: Slot) -> None:
+        """
+        gives a slot back to its node after a request.
+        """
+        slot.busy = False
+
+    def discard(self, slot: Slot) -> None:
+        """
+        closes a slot that is in an unknown state.
+
+        the agent reconnects the slot when it notices the closed connection.
+        """
+        slot.close()
+        if slot in slot.node.slots:
+            slot.node.slots.remove(slot)
+            self.on_change()
+
+    def fail(self, node: Node) -> None:
+        """
+        drops a node that failed.
+        """
+        if self.nodes.pop(node.name, None) is None:
+            return
+        self.logger.warning(f"node '{node.name}' failed. dropping its {len(node.slots)} slots.")
+        for slot in node.slots:
+            slot.close()
+        self.on_change()
+
+    def close(self) -> None:
+        """
+        closes the connections of all nodes.
+        """
+        for node in self.nodes.values():
+            for slot in node.slots:
+                slot.close()
+        self.nodes.clear()
@@ -0,0 +1,385 @@
+from typing import *
+import socket
+import asyncio
+import logging
+import secrets
+from collections import deque
+from ..common.communicator import Communicator
+from ..common import protocol
+from .backends import ExecutionBackend, Instance
+from ..logger import get_logger
+
+
+class Launch:
+    """
+    a container that is started but not yet connected.
+
+    the token is given to the container and sent back by its client in the hello
+    which is how a connection is matched to its launch.
+
+    a launch with a future is a cold launch owned by a checkout waiting for exactly this container.
+    a launch without a future will become an idle member of the pool.
+
+    requested is when the backend was asked for the container and started when the container was running.
+    """
+    token: str
+    language: Optional[str]
+    future: Optional["asyncio.Future[Member]"]
+    container: Optional[Instance]
+    requested: Optional[float]
+    started: Optional[float]
+
+    def __init__(self, language: Optional[str], future: Optional["asyncio.Future[Member]"] = None) -> None:
+        self.token = secrets.token_hex(16)
+        self.language = language
+        self.future = future
+        self.container = None
+        self.requested = None
+        self.started = None
+
+
+class Member:
+    """
+    an idle container in the pool.
+
+    holds the connection the containers client established with the server,
+    the language the container was warmed up for, the container itself
+    and the protocol version negotiated with the client.
+
+    spawn and connect are the seconds a cold container took to start and for its client to connect,
+    they are 0 for a member that was idle in the pool since nothing waited for it.
+    reused is set once the member is kept to run another request of a batch.
+    """
+    connection: socket.socket
+    address: Tuple[str, int]
+    language: Optional[str]
+    container: Optional[Instance]
+    version: int
+    idle_since: float
+    spawn: float
+    connect: float
+    reused: bool
+
+    def __init__(self, connection: socket.socket, address: Tuple[str, int],
+                 language: Optional[str], container: Optional[Instance],
+                 version: int, idle_since: float) -> None:
+        self.connection = connection
+        self.address = address
+        self.language = language
+        self.container = container
+        self.version = version
+        self.idle_since = idle_since
+        self.spawn = 0
+        self.connect = 0
+        self.reused = False
+
+    def alive(self) -> bool:
+        """
+        checks if the client in the container is still connected.
+
+        peeks at the socket without consuming anything. an idle client never sends anything
+        so readable data or an end of file both means the member is broken.
+        """
+        try:
+            self.connection.recv(1, socket.MSG_PEEK)
+        except BlockingIOError:
+            return True
+        except OSError:
+            pass
+        return False
+
+    def close(self) -> None:
+        """
+        closes the connection.
+
+        the client exits when its connection is closed which in turn stops and removes the container.
+        """
+        self.connection.close()
+
+
+class ContainerPool:
+    """
+    pool of pre-warmed containers.
+
+    keeps between min_size and max_size containers started and connected to the server
+    so a request does not have to wait for a container to boot.
+
+    a container is only ever checked out once. every checkout triggers a refill in the background
+    so each container still only runs one request.
+
+    containers can be warmed up for a specific language. a checkout prefers a container warmed up for
+    the requested language, then a generic one and then any idle container.
+    if no container is idle a cold container is started for the request.
+
+    every container is started with a unique token that its client sends back in the hello.
+    the token is looked up in the registry so a connection always ends up with its own launch.
+    connections with unknown tokens are closed.
+
+    idle members are periodically health checked and members that have been idle
+    for longer than max_idle_time are reaped as long as the pool stays above min_size.
+    containers that never connect are killed.
+
+    environment is added to the environment of every container.
+
+    the containers are started by an execution backend so a container can also be a local subprocess
+    or a fake client, see backends.
+    """
+    backend: ExecutionBackend
+    communicator: Communicator
+    loop: asyncio.AbstractEventLoop
+    logger: logging.Logger
+
+    min_size: int
+    max_size: int
+    affinity: Dict[str, int]
+    connect_timeout: float
+    max_idle_time: float
+    health_interval: float
+    environment: Dict[str, str]
+
+    idle: Dict[Optional[str], Deque[Member]]
+    registry: Dict[str, Launch]
+
+    def __init__(self, backend: ExecutionBackend,
+                 communicator: Communicator,
+                 min_size: int = 0,
+                 max_size: int = 10,
+                 affinity: Optional[Dict[str, int]] = None,
+                 connect_timeout: float = 5,
+                 max_idle_time: float = 300,
+                 health_interval: float = 10,
+                 environment: Optional[Dict[str, str]] = None,
+                 logger: Optional[logging.Logger] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self.backend = backend
+        self.communicator = communicator
+        self.loop = loop if loop else asyncio.get_event_loop()
+        self.logger = logger if logger else get_logger(__name__, logging.WARNING, stdout=True)
+
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.affinity = affinity if affinity else {}
+        self.connect_timeout = connect_timeout
+        self.max_idle_time = max_idle_time
+        self.health_interval = health_interval
+        self.environment = environment if environment else {}
+
+        self.idle = {}
+        self.registry = {}
+
+    def __len__(self) -> int:
+        """
+        the amount of idle and starting containers owned by the pool.
+        """
+        return (
+            sum(len(members) for members in self.idle.values()) +
+            sum(1 for launch in self.registry.values() if not launch.future)
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"<ContainerPool idle: {sum(len(members) for members in self.idle.values())} "
+            f"starting: {sum(1 for launch in self.registry.values() if not launch.future)} "
+            f"cold: {sum(1 for launch in self.registry.values() if launch.future)} "
+            f"({self.min_size} - {self.max_size})>"
+        )
+
+    async def checkout(self, language: Optional[str] = None) -> Member:
+        """
+        checks out a connected container for one request.
+
+        an idle member is preferred. if there are no idle members a cold container is started
+        and its connection is expected within connect_timeout seconds after the container started
+        else an asyncio.TimeoutError is raised.
+
+        the pool is refilled in the background after every checkout.
+        """
+        if member := self._pop_idle(language):
+            self.logger.debug(f"checked out idle container '{member.address[0]}:{member.address[1]}'.")
+            self.loop.call_soon(self.refill, language)
+            return member
+
+        self.logger.debug(f"no idle container for '{language}'. starting a cold container...")
+        launch = Launch(language, self.loop.create_future())
+        try:
+            await self._launch(launch)
+            member = await asyncio.wait_for(launch.future, self.connect_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            self._discard(launch)
+            raise e
+        self.logger.debug(f"checked out cold container '{member.address[0]}:{member.address[1]}'.")
+        self.loop.call_soon(self.refill, language)
+        return member
+
+    async def register(self, connection: socket.socket, address: Tuple[str, int]) -> None:
+        """
+        registers a newly connected container.
+
+        receives the hello from the client and looks up its launch by the token.
+        a cold launch gives the connection to its waiting checkout,
+        any other launch adds the connection to the idle members.
+
+        the protocol version used with the client is the newest version supported by both sides.
+        """
+        try:
+            hello = await asyncio.wait_for(self.communicator.recv_hello(connection), self.connect_timeout)
+        except (asyncio.TimeoutError, ValueError, ConnectionError) as e:
+            self.logger.warning(f"'{address[0]}:{address[1]}' did not send a valid hello ({e}). closing connection.")
+            connection.close()
+            return
+        if not (launch := self.registry.pop(hello.get("token"), None)):
+            self.logger.warning(f"'{address[0]}:{address[1]}' sent an unknown token. closing connection.")
+            connection.close()
+            return
+        version = min(hello.get("version", 1), protocol.version)
+        member = Member(connection, address, launch.language, launch.container, version, self.loop.time())
+
+        if launch.future:
+            if launch.requested and launch.started:
+                member.spawn = launch.started - launch.requested
+                member.connect = member.idle_since - launch.started
+            launch.future.set_result(member)
+            return
+        if len(self) >= self.max_size:
+            self.logger.debug(f"pool is full. closing connection from '{address[0]}:{address[1]}'.")
+            self._close(member)
+            return
+        self.idle.setdefault(launch.language, deque()).append(member)
+        self.logger.debug(f"container '{address[0]}:{address[1]}' is idle in the pool for '{launch.language}'.")
+
+    def refill(self, language: Optional[str] = None) -> None:
+        """
+        starts containers until the pool holds min_size containers.
+
+        first the languages configured in affinity are topped up then the language that was
+        just checked out is replaced, the rest of the pool is filled with generic containers.
+        """
+        for affine, size in self.affinity.items():
+            while len(self) < self.max_size and self._size(affine) < size:
+                self._background_launch(affine)
+        if len(self) < self.min_size and language is not None:
+            self._background_launch(language)
+        while len(self) < self.min_size:
+            self._background_launch(None)
+
+    async def maintain(self) -> None:
+        """
+        periodically health checks and reaps the idle members.
+
+        broken members are always removed. members idle for longer than max_idle_time
+        are closed as long as the pool stays above min_size.
+        containers that did not connect within connect_timeout after they started are killed.
+        """
+        self.refill()
+        while True:
+            await asyncio.sleep(self.health_interval)
+            now = self.loop.time()
+            for launch in list(self.registry.values()):
+                if not launch.future and launch.started and now - launch.started > self.connect_timeout:
+                    self.logger.warning(f"a container for '{launch.language}' never connected.")
+                    self._discard(launch)
+            for language, members in self.idle.items():
+                for member in list(members):
+                    if not member.alive():
+                        self.logger.info(f"removing broken container '{member.address[0]}:{member.address[1]}'.")
+                        members.remove(member)
+                        self._close(member)
+                    elif now - member.idle_since > self.max_idle_time and len(self) > self.min_size:
+                        self.logger.info(f"reaping idle container '{member.address[0]}:{member.address[1]}'.")
+                        members.remove(member)
+                        self._close(member)
+            self.refill()
+
+    def close(self) -> None:
+        """
+        closes all idle members and kills all containers that have not connected yet.
+        """
+        for members in self.idle.values():
+            while members:
+                self._close(members.popleft())
+        for launch in list(self.registry.values()):
+            self._discard(launch)
+
+    def _size(self, language: Optional[str]) -> int:
+        """
+        the amount of idle and starting containers warmed up for language owned by the pool.
+        """
+        return len(self.idle.get(language, ())) + sum(
+            1 for launch in self.registry.values() if not launch.future and launch.language == language
+        )
+
+    def _pop_idle(self, language: Optional[str]) -> Optional[Member]:
+        """
+        pops the most suitable healthy idle member.
+        """
+        preferred = [language, None] + [key for key in self.idle if key not in (language, None)]
+        for key in preferred:
+            members = self.idle.get(key)
+            while members:
+                member = members.popleft()
+                if member.alive():
+                    return member
+                self.logger.info(f"removing broken container '{member.address[0]}:{member.address[1]}'.")
+                self._close(member)
+        return None
+
+    async def _launch(self, launch: Launch) -> None:
+        """
+        starts a container with a client warmed up for the launches language.
+
+        the launch is kept in the registry until its client connects or it is discarded.
+        if the launch was discarded while the container was starting the container is killed.
+        """
+        self.logger.debug(f"starting a container for '{launch.language}'...")
+        self.registry[launch.token] = launch
+        environment = {**self.environment, "IGNITION_TOKEN": launch.token}
+        if launch.language:
+            environment["IGNITION_LANGUAGE"] = launch.language
+        launch.requested = self.loop.time()
+        try:
+            container = await self.backend.launch(environment=environment)
+        except BaseException as e:
+            self.registry.pop(launch.token, None)
+            raise e
+        launch.container = container
+        launch.started = self.loop.time()
+        if launch.token not in self.registry:
+            self.loop.create_task(self.backend.kill(container))
+            return
+        self.logger.debug(f"container '{container.short_id}' started.")
+
+    def _discard(self, launch: Launch) -> None:
+        """
+        forgets a launch and kills its container.
+
+        a late connection with the launches token will be closed as unknown.
+        """
+        self.registry.pop(launch.token, None)
+        if launch.container:
+            self.loop.create_task(self.backend.kill(launch.container))
+
+    def _close(self, member: Member) -> None:
+        """
+        closes a member and kills its container.
+        """
+        member.close()
+        if member.container:
+            self.loop.create_task(self.backend.kill(member.container))
+
+    def _background_launch(self, language: Optional[str]) -> None:
+        """
+        starts a container for the pool without waiting for it.
+
+        failures are logged since nothing is waiting for the container.
+        """
+        launch = Launch(language)
+        self.registry[launch.token] = launch
+        task = self.loop.create_task(self._launch(launch))
+        task.add_done_callback(self._log_launch_failure)
+
+    def _log_launch_failure(self, task: "asyncio.Task[None]") -> None:
+        """
+        logs the failure of a background launch.
+        """
+        if not task.cancelled() and (exception := task.exception()):
+            self.logger.error(f"failed to start a container for the pool: {exception!r}")
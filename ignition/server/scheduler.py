@@ -0,0 +1,314 @@
+from typing import *
+import math
+import uuid
+import asyncio
+import logging
+from enum import Enum
+from collections import OrderedDict, deque
+from ..common import protocol
+from ..common.metrics import Histogram
+from ..logger import get_logger
+
+
+class Overloaded(Exception):
+    """
+    raised when a request is rejected or shed because the server is overloaded.
+
+    retry_after is the amount of seconds the caller is advised to wait before retrying.
+    """
+    retry_after: int
+
+    def __init__(self, message: str, retry_after: int) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        # pickled with the results of a batch sent to other processes, see ipc
+        return Overloaded, (str(self), self.retry_after)
+
+
+class Policy(Enum):
+    """
+    what happens to a request submitted when the overflow is full.
+
+    reject rejects the new request.
+    shed drops the newest pending request of the lowest priority class below the new request
+    and rejects the new request if there is none.
+    """
+    reject = "reject"
+    shed = "shed"
+
+
+class Pending:
+    """
+    a request waiting for a free slot.
+    """
+    uid: uuid.UUID
+    request: protocol.Request
+    user: Optional[Hashable]
+    priority: int
+    enqueued: float
+    started: Optional[float]
+    expiry: Optional[asyncio.TimerHandle]
+
+    def __init__(self, uid: uuid.UUID, request: protocol.Request, user: Optional[Hashable],
+                 priority: int, enqueued: float) -> None:
+        self.uid = uid
+        self.request = request
+        self.user = user
+        self.priority = priority
+        self.enqueued = enqueued
+        self.started = None
+        self.expiry = None
+
+
+class Scheduler:
+    """
+    admission control for the requests of the server.
+
+    at most capacity requests plus the remote slots of other nodes run at once.
+    the rest wait in a bounded overflow of max_pending requests.
+    a request submitted to a full overflow is handled according to the policy.
+
+    pending requests are started by priority, higher first. within a priority class the users
+    take turns so a user with many pending requests does not starve the other users.
+    requests without a user share a turn.
+
+    a request that waited for longer than max_wait seconds is expired before a container is spent on it.
+
+    start is called with every request that gets a slot and expire with every pending request that is
+    shed or expired. release must be called when a started request is done.
+
+    the depth of the overflow is observed on every submit and the wait of every started request
+    is observed in histograms.
+    the run time of the requests is smoothed over all requests in service_time and per language in service_times.
+    """
+    loop: asyncio.AbstractEventLoop
+    logger: logging.Logger
+    start: Callable[[uuid.UUID, protocol.Request], None]
+    expire: Callable[[uuid.UUID, Overloaded], None]
+
+    capacity: int
+    remote: int
+    max_pending: int
+    max_wait: Optional[float]
+    policy: Policy
+
+    running: Dict[uuid.UUID, Pending]
+    pending: Dict[uuid.UUID, Pending]
+    classes: Dict[int, "OrderedDict[Optional[Hashable], Deque[Pending]]"]
+
+    service_time: float
+    service_times: Dict[str, float]
+    completions: Dict[str, int]
+    depth: Histogram
+    waits: Histogram
+    rejected: int
+    expired: int
+    completed: int
+
+    def __init__(self, start: Callable[[uuid.UUID, protocol.Request], None],
+                 expire: Callable[[uuid.UUID, Overloaded], None],
+                 capacity: int = 10,
+                 max_pending: int = 100,
+                 max_wait: Optional[float] = 30,
+                 policy: Policy = Policy.reject,
+                 logger: Optional[logging.Logger] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self.loop = loop if loop else asyncio.get_event_loop()
+        self.logger = logger if logger else get_logger(__name__, logging.WARNING, stdout=True)
+        self.start = start
+        self.expire = expire
+
+        self.capacity = capacity
+        self.remote = 0
+        self.max_pending = max_pending
+        self.max_wait = max_wait
+        self.policy = policy
+
+        self.running = {}
+        self.pending = {}
+        self.classes = {}
+
+        # seconds, smoothed over the latest requests
+        self.service_time = 1
+        self.service_times = {}
+        self.completions = {}
+        self.depth = Histogram((0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+        self.waits = Histogram((0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+        self.rejected = 0
+        self.expired = 0
+        self.completed = 0
+
+    def __len__(self) -> int:
+        """
+        the amount of pending requests.
+        """
+        return len(self.pending)
+
+    def __repr__(self) -> str:
+        return (
+            f"<Scheduler running: {len(self.running)} / {self.capacity} + {self.remote} "
+            f"pending: {len(self.pending)} / {self.max_pending} "
+            f"rejected: {self.rejected} expired: {self.expired}>"
+        )
+
+    def submit(self, uid: uuid.UUID, request: protocol.Request,
+               user: Optional[Hashable] = None, priority: int = 0) -> None:
+        """
+        submits a request.
+
+        the request is started right away if there is a free slot otherwise it is queued.
+        raises Overloaded if the request is rejected.
+        """
+        self.depth.observe(len(self.pending))
+        if len(self.pending) >= self.max_pending and not self._make_room(priority):
+            self.rejected += 1
+            raise Overloaded("the server is overloaded.", self.retry_after())
+        pending = Pending(uid, request, user, priority, self.loop.time())
+        if self.max_wait is not None:
+            pending.expiry = self.loop.call_later(self.max_wait, self._expire, uid)
+        self.pending[uid] = pending
+        self.classes.setdefault(priority, OrderedDict()).setdefault(user, deque()).append(pending)
+        self._dispatch()
+
+    def cancel(self, uid: uuid.UUID) -> bool:
+        """
+        removes a pending request.
+
+        returns False if the request is not pending.
+        """
+        if not self._remove(uid):
+            return False
+        self.logger.debug(f"pending request '{uid}' was cancelled.")
+        return True
+
+    def release(self, uid: uuid.UUID) -> None:
+        """
+        frees the slot of a started request and starts the next pending request.
+        """
+        if (pending := self.running.pop(uid, None)) is not None:
+            elapsed = self.loop.time() - pending.started
+            self.service_time = 0.9 * self.service_time + 0.1 * elapsed
+            language = pending.request["language"]
+            previous = self.service_times.get(language)
+            self.service_times[language] = elapsed if previous is None else 0.9 * previous + 0.1 * elapsed
+            self.completions[language] = self.completions.get(language, 0) + 1
+            self.completed += 1
+        self._dispatch()
+
+    def resize(self, capacity: int) -> None:
+        """
+        changes the amount of requests that run at once.
+
+        running requests are never stopped, a smaller capacity only delays new requests.
+        """
+        self.capacity = capacity
+        self._dispatch()
+
+    def resize_remote(self, remote: int) -> None:
+        """
+        changes the amount of slots on other nodes.
+        """
+        self.remote = remote
+        self._dispatch()
+
+    def slots(self) -> int:
+        """
+        the amount of requests that run at once.
+        """
+        return self.capacity + self.remote
+
+    def retry_after(self) -> int:
+        """
+        an estimate of the seconds until a new request would be started.
+        """
+        return max(1, math.ceil((len(self.pending) / max(self.slots(), 1) + 1) * self.service_time))
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        the state of the scheduler as a json serializable dictionary.
+        """
+        return {
+            "running": len(self.running),
+            "capacity": self.capacity,
+            "remote": self.remote,
+            "pending": len(self.pending),
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "completed": self.completed,
+            "service_time": self.service_time,
+            "depth": self.depth.snapshot(),
+            "wait": self.waits.snapshot()
+        }
+
+    def _dispatch(self) -> None:
+        """
+        starts pending requests while there are free slots.
+        """
+        while self.pending and len(self.running) < self.slots():
+            pending = self._next()
+            pending.started = self.loop.time()
+            self.running[pending.uid] = pending
+            self.waits.observe(pending.started - pending.enqueued)
+            self.start(pending.uid, pending.request)
+        self.logger.info(
+            f"current queue: {len(self.running)} / {self.slots()} "
+            f"with overflow: {len(self.pending)} / {self.max_pending}"
+        )
+
+    def _next(self) -> Pending:
+        """
+        pops the next request to start.
+
+        the first user of the highest priority class gets the turn and is moved last in its class.
+        """
+        priority = max(self.classes)
+        users = self.classes[priority]
+        user, queue = next(iter(users.items()))
+        users.move_to_end(user)
+        return self._remove(queue[0].uid)
+
+    def _make_room(self, priority: int) -> bool:
+        """
+        sheds a pending request of lower priority according to the policy.
+
+        returns True if a request was shed.
+        """
+        if self.policy != Policy.shed or not self.classes or (lowest := min(self.classes)) >= priority:
+            return False
+        users = self.classes[lowest]
+        uid = users[next(reversed(users))][-1].uid
+        self._remove(uid)
+        self.rejected += 1
+        self.logger.warning(f"shedding pending request '{uid}' of priority {lowest}.")
+        self.expire(uid, Overloaded("the request was shed for a request of higher priority.", self.retry_after()))
+        return True
+
+    def _expire(self, uid: uuid.UUID) -> None:
+        """
+        expires a request that waited for longer than max_wait.
+        """
+        if not self._remove(uid):
+            return
+        self.expired += 1
+        self.logger.warning(f"pending request '{uid}' waited for longer than {self.max_wait}s. expiring it.")
+        self.expire(uid, Overloaded("the request waited too long for a free slot.", self.retry_after()))
+
+    def _remove(self, uid: uuid.UUID) -> Optional[Pending]:
+        """
+        removes a pending request from the overflow.
+        """
+        if not (pending := self.pending.pop(uid, None)):
+            return None
+        if pending.expiry:
+            pending.expiry.cancel()
+        users = self.classes[pending.priority]
+        queue = users[pending.user]
+        queue.remove(pending)
+        if not queue:
+            del users[pending.user]
+        if not users:
+            del self.classes[pending.priority]
+        return pending
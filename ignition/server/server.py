@@ -1,24 +1,33 @@
 from typing import *
 from ..common.communicator import Communicator
+from .pool import ContainerPool, Member
+from .launcher import ContainerLauncher
+from .backends import ExecutionBackend, LaunchError
+from .cache import ArtifactCache, ResultCache
+from .scheduler import Scheduler, Policy, Overloaded
+from .capacity import CapacityController, Host
+from .nodes import Cluster, Slot
+from ..common.metrics import Registry, Family
 import socket
+import ipaddress
+from pathlib import Path
 from ..common import protocol
+from ..common.languages import Languages
 import asyncio
+import functools
 import logging
 from ..logger import get_logger
 import docker
-import docker.models.containers
-import docker.errors
-from collections import OrderedDict
 import uuid
 
 
-def setup_socket() -> socket.socket:
+def setup_socket(port: int = 6090, host: str = "") -> socket.socket:
     """
     helper method for setting upp the tcp socket
     """
     sock = socket.socket()
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    sock.bind(("", 6090))
+    sock.bind((host, port))
     sock.setblocking(False)
     sock.listen()
     return sock
@@ -31,124 +40,465 @@ class Server:
     the server communicates uses the docker sdk to spawn containers containing an ignition client.
     the client will be sent a request to process and a response will be given back.
 
-    the public API only consists of the __init__ and process methods. everything else is internal.
+    the public API only consists of the __init__, process, stream, batch, invalidate, metrics and exposition methods.
+    everything else is internal.
 
-    when the process method is used the process is added to the queue. if there is room
-    in the queue the process will start to process otherwise it will wait in overflow
-    until there is room.
+    when the process method is used the process is submitted to the scheduler. if there is room
+    in the queue the process will start to process otherwise it will wait in a bounded overflow
+    until there is room. processes are started by priority and the users take turns within a priority.
+    a process that is rejected, shed or waits for longer than max_wait raises Overloaded
+    with the seconds the caller should wait before retrying.
 
-    when the process is processing a container is spawned using the docker sdk and a connection is
-    expected to be established within max 5 seconds. if it takes longer something is wrong.
+    when the process is processing a container is checked out from the container pool.
+    the pool keeps containers started and connected ahead of time. if there is no idle container in the pool
+    a container is spawned using the docker sdk and a connection is expected to be established
+    within max 5 seconds. if it takes longer something is wrong.
 
     if the connection was established the request is sent to the client for processing and the
     response will be returned.
+
+    the output of every request is limited per stream. the limit is the smallest of the limit in the request,
+    the limit of the language in output_limits (or default_output_limit) and max_output_limit.
+    the client enforces the limits while the program runs so neither side buffers more than the limits.
+
+    the stream method works like the process method but yields the output as the client produces it.
+    at most stream_buffer chunks are buffered per request, when the buffer is full the connection
+    to the client is not read until the caller has consumed a chunk.
+
+    the batch method queues several requests of a user at once and yields the results as they complete.
+    the requests of a batch share their containers, see batch.
+
+    if a cache_directory is given the build artifacts of compiled languages are cached there.
+    the directory is mounted read only into the containers so a cached program is extracted instead of built.
+    a program that is not cached has its artifact sent back by the client after the build.
+
+    if a result_ttl is given the results of deterministic programs can be memoized by passing memoize to process.
+    identical requests running at the same time are coalesced into a single run.
+
+    if standby is set containers for interpreted languages start the interpreter while they wait in the pool
+    and run the program in it so the startup of the interpreter is not part of the request.
+
+    the amount of processes running at once starts at queue_size, by default the amount of cpus.
+    if adaptive is set it is adjusted to the load of the host and every container is limited to
+    container_memory bytes of memory and its share of the cpus, see CapacityController.
+
+    the containers are started by an execution backend, by default docker containers of the ignition image.
+    a LocalBackend runs trusted workloads in subprocesses without the startup of a container and
+    a FakeBackend answers requests without running them to measure the server on its own, see backends.
+
+    if a node_port is given agents on other machines can connect to it and run requests for the server.
+    requests are placed on the nodes first, see Cluster, and run in local containers when no node has room.
+    the node port listens on node_host, by default only on loopback. an agent sees the code and output
+    of every request placed on it and the server trusts the results of its agents so only agents that
+    know node_secret are accepted. a node_secret is required to listen anywhere else than on loopback.
+    the node port is not encrypted so nodes on an untrusted network should connect through a tunnel.
+
+    the server can be shared by processes on the same machine through a Dispatcher, see ipc.
+
+    the time of every phase of a request, the status of every request per language, the size of the frames
+    and the state of the scheduler, pool and caches are kept in registry, see exposition.
     """
     communicator: Communicator
     loop: asyncio.AbstractEventLoop
-    docker_client: docker.DockerClient
     sock: socket.socket
     logger: logging.Logger
+    backend: ExecutionBackend
+    pool: ContainerPool
+    cache: Optional[ArtifactCache]
+    results_cache: Optional[ResultCache]
+    scheduler: Scheduler
+    capacity: Optional[CapacityController]
+    cluster: Optional[Cluster]
+    node_sock: Optional[socket.socket]
 
-    queue_size: int
-    queue: Set[uuid.UUID]
-    overflow: "OrderedDict[uuid.UUID, protocol.Request]"
     results: Dict[uuid.UUID, "asyncio.Future[Tuple[protocol.Status, Optional[protocol.Response]]]"]
-    lingering_processes: List["asyncio.Future[Tuple[socket.socket, Tuple[str, int]]]"]
+    streams: Dict[uuid.UUID, "asyncio.Queue[Tuple[protocol.Stream, bytes]]"]
+    delivered: Set[uuid.UUID]
+    tasks: Dict[uuid.UUID, "asyncio.Task[None]"]
+    groups: Dict[uuid.UUID, uuid.UUID]
+    shared: Dict[uuid.UUID, List[Member]]
+    submitted: Dict[uuid.UUID, float]
+    registry: Registry
+    phases: Family
+    statuses: Family
+    cpu: Family
+    memory: Family
+    stream_buffer = 16
+    phase_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    memory_buckets = tuple(2 ** power * 1024 * 1024 for power in range(11))
+    image = "ignition"
 
-    def __init__(self, queue_size: int = 10,
+    output_limits: Dict[str, int]
+    default_output_limit = 1024 * 1024
+    max_output_limit = 16 * 1024 * 1024
+
+    def __init__(self, queue_size: Optional[int] = None,
                  logger: Optional[logging.Logger] = None,
-                 loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
-        self.docker_client = docker.from_env()
+                 loop: Optional[asyncio.AbstractEventLoop] = None,
+                 pool_min_size: int = 0,
+                 pool_max_size: Optional[int] = None,
+                 pool_affinity: Optional[Dict[str, int]] = None,
+                 launch_workers: Optional[int] = None,
+                 output_limits: Optional[Dict[str, int]] = None,
+                 cache_directory: Optional[Path] = None,
+                 cache_size: int = 1024 * 1024 * 1024,
+                 result_ttl: Optional[float] = None,
+                 result_cache_size: int = 64 * 1024 * 1024,
+                 standby: bool = False,
+                 max_pending: int = 100,
+                 max_wait: Optional[float] = 30,
+                 policy: Policy = Policy.reject,
+                 adaptive: bool = True,
+                 max_slots: Optional[int] = None,
+                 container_memory: int = 128 * 1024 * 1024,
+                 node_port: Optional[int] = None,
+                 node_host: str = "127.0.0.1",
+                 node_secret: Optional[str] = None,
+                 backend: Optional[ExecutionBackend] = None) -> None:
+        if node_port and not node_secret and not ipaddress.ip_address(socket.gethostbyname(node_host)).is_loopback:
+            raise ValueError(f"a node_secret is required to accept nodes on '{node_host}'.")
         self.loop = loop if loop else asyncio.get_event_loop()
-        self.communicator = Communicator(logger, self.loop)
+        # room for both streams at their max limit and the rest of the response
+        self.communicator = Communicator(logger, self.loop, max_frame_size=2 * self.max_output_limit + 1024 * 1024)
         self.sock = setup_socket()
         self.logger = logger if logger else get_logger(__name__, logging.WARNING, stdout=True)
+        queue_size = queue_size if queue_size else Host.measure().cpus
+        self.backend = backend if backend else ContainerLauncher(
+            docker.from_env(),
+            max_workers=launch_workers if launch_workers else queue_size,
+            image=self.image,
+            logger=self.logger, loop=self.loop
+        )
+        image_id = self.backend.version() if cache_directory or result_ttl else ""
+        self.cache = ArtifactCache(
+            cache_directory.resolve(), image_id,
+            max_bytes=cache_size, logger=self.logger, loop=self.loop
+        ) if cache_directory else None
+        self.results_cache = ResultCache(
+            image_id, ttl=result_ttl, max_bytes=result_cache_size, logger=self.logger, loop=self.loop
+        ) if result_ttl else None
+        if self.cache:
+            self.backend.mount_cache(self.cache.directory)
+        self.pool = ContainerPool(
+            self.backend, self.communicator,
+            min_size=pool_min_size,
+            max_size=pool_max_size if pool_max_size is not None else queue_size,
+            affinity=pool_affinity,
+            environment={"IGNITION_STANDBY": "1"} if standby else None,
+            logger=self.logger, loop=self.loop
+        )
 
-        self.queue_size = queue_size
-        self.queue = set()
-        self.overflow = OrderedDict()
+        self.scheduler = Scheduler(
+            self._start, self._expire,
+            capacity=queue_size, max_pending=max_pending, max_wait=max_wait, policy=policy,
+            logger=self.logger, loop=self.loop
+        )
+        self.capacity = CapacityController(
+            self.scheduler, self.backend,
+            memory=container_memory, max_slots=max_slots, logger=self.logger, loop=self.loop
+        ) if adaptive else None
+        self.cluster = Cluster(
+            self.communicator, lambda: self.scheduler.resize_remote(len(self.cluster)),
+            secret=node_secret, logger=self.logger, loop=self.loop
+        ) if node_port else None
+        self.node_sock = setup_socket(node_port, node_host) if node_port else None
         self.results = {}
-        self.lingering_processes = []
+        self.streams = {}
+        self.delivered = set()
+        self.tasks = {}
+        self.groups = {}
+        self.shared = {}
+        self.submitted = {}
+        self.registry = Registry()
+        self._register_metrics()
+        self.output_limits = output_limits if output_limits else {}
 
         self.loop.create_task(self._run())
+        self.loop.create_task(self.pool.maintain())
+        if self.capacity:
+            self.loop.create_task(self.capacity.run())
+        if self.cluster is not None:
+            self.loop.create_task(self._run_nodes())
 
-    async def process(self, request: protocol.Request) -> Tuple[protocol.Status, Optional[protocol.Response]]:
+    async def process(self, request: protocol.Request,
+                      memoize: bool = False,
+                      tag: Optional[Hashable] = None,
+                      user: Optional[Hashable] = None,
+                      priority: int = 0) -> Tuple[protocol.Status, Optional[protocol.Response]]:
         """
         queues the request to be processed.
 
         creates a future in which the result can be set.
-        adds the requests in the queue and attempts to advance the queue.
+        submits the request to the scheduler on behalf of user with the given priority.
         waits for the future to be set and returns the response.
+
+        if memoize is set and results are cached the result of an identical request is reused
+        and the response has cached set. tag is used to invalidate the result later.
+
+        raises Overloaded if the request is rejected or waited too long.
         """
-        future: asyncio.Future[Tuple[protocol.Status, Optional[protocol.Response]]] = self.loop.create_future()
-        self.results[(uid := uuid.uuid4())] = future
-        self.overflow[uid] = request
-        self._advance_queue()
-        await future
-        _ = self.results.pop(uid)
-        return future.result()
+        return await self._memoized(request, memoize, tag, user, priority, None)
+
+    async def batch(self, requests: Sequence[protocol.Request],
+                    memoize: Optional[Sequence[bool]] = None,
+                    tags: Optional[Sequence[Optional[Hashable]]] = None,
+                    user: Optional[Hashable] = None,
+                    priority: int = 0) -> AsyncIterator[
+            Tuple[int, Union[Tuple[protocol.Status, Optional[protocol.Response]], Overloaded]]]:
+        """
+        queues several requests at once and yields their results as they complete.
+
+        yields (index, result) tuples where index is the position of the request in requests
+        and result is the same (status, response) tuple as process returns
+        or the Overloaded error of a request that was rejected or waited too long.
+        memoize and tags are given per request and work like in process.
+
+        every request is scheduled on its own so a batch takes turns with the requests of other users.
+        a container that ran a request of the batch successfully is kept for the next request of the batch
+        in the same language instead of being stopped, if its client supports it (protocol version 3).
+        containers are never shared between batches so programs of different batches never meet.
+
+        if the caller stops iterating before the end the remaining requests are aborted.
+        """
+        group = uuid.uuid4()
+        self.shared[group] = []
+        tasks = {
+            self.loop.create_task(self._memoized(
+                request, bool(memoize and memoize[index]), tags[index] if tags else None, user, priority, group
+            )): index for index, request in enumerate(requests)
+        }
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        result = task.result()
+                    except Overloaded as e:
+                        result = e
+                    yield tasks[task], result
+        finally:
+            for task in tasks:
+                task.cancel()
+            for member in self.shared.pop(group):
+                member.close()
+
+    def invalidate(self, tag: Hashable) -> None:
+        """
+        forgets the memoized results tagged with tag.
+        """
+        if self.results_cache:
+            self.results_cache.invalidate(tag)
+
+    async def metrics(self) -> Dict[str, Any]:
+        """
+        the state of the scheduler as a json serializable dictionary, see Scheduler.metrics.
+        """
+        return self.scheduler.metrics()
 
-    async def _get_connection(self) -> Tuple[socket.socket, Tuple[str, int]]:
+    async def exposition(self) -> str:
         """
-        starts a container and waits to receive a connection
+        the metrics of the server in the prometheus text format.
 
-        starts the container and creates a future in which the connection can be defined
-        from _run() whenever a connection is established.
+        ignition_phase_seconds has the time of every phase of a request.
+        queue is the time waiting for the scheduler, spawn and connect the time a cold container took to start
+        and for its client to connect, only observed for requests that waited for a cold container.
+        setup, compile and run are measured by the client and transfer is the rest of the time
+        the request spent on the connection, sending the request and receiving the output.
 
-        if connection is established within 5 seconds the connection is returned else a asyncio.TimeoutError is raised.
+        ignition_cpu_seconds_total and ignition_max_rss_bytes have the resource usage of the programs per language
+        so the cost of a language can be compared to the resources of the containers.
         """
-        self.logger.debug(f"starting a container...")
-        container = self.docker_client.containers.run(
-            "ignition", detach=True, auto_remove=True, extra_hosts={"host.docker.internal": "host-gateway"}
+        return self.registry.render()
+
+    def _register_metrics(self) -> None:
+        """
+        registers the metrics of the server and the objects it owns.
+        """
+        self.phases = self.registry.histogram(
+            "ignition_phase_seconds", "seconds spent in each phase of a request.", self.phase_buckets, ["phase"]
+        )
+        self.statuses = self.registry.counter(
+            "ignition_processes_total", "processed requests by language and status.", ["language", "status"]
+        )
+        self.cpu = self.registry.counter(
+            "ignition_cpu_seconds_total", "cpu time used by the programs by language and mode.", ["language", "mode"]
+        )
+        self.memory = self.registry.histogram(
+            "ignition_max_rss_bytes", "peak resident memory of the programs by language.", self.memory_buckets,
+            ["language"]
+        )
+        frames = self.registry.histogram(
+            "ignition_frame_bytes", "size of the frames sent to and received from clients.", (), ["direction"]
+        )
+        frames.add(self.communicator.sent, "sent")
+        frames.add(self.communicator.received, "received")
+        scheduler = self.scheduler
+        self.registry.gauge("ignition_running", "requests running.", lambda: len(scheduler.running))
+        self.registry.gauge("ignition_pending", "requests waiting in the overflow.", lambda: len(scheduler.pending))
+        self.registry.gauge("ignition_slots", "requests that can run at once.", scheduler.slots)
+        self.registry.gauge(
+            "ignition_rejected_total", "requests rejected or shed.", lambda: scheduler.rejected, "counter"
+        )
+        self.registry.gauge(
+            "ignition_expired_total", "requests that waited longer than max_wait.", lambda: scheduler.expired, "counter"
+        )
+        pool = self.pool
+        self.registry.gauge(
+            "ignition_pool_idle", "idle containers in the pool.", lambda: sum(map(len, pool.idle.values()))
+        )
+        self.registry.gauge(
+            "ignition_pool_starting", "containers starting for the pool.",
+            lambda: sum(1 for launch in pool.registry.values() if not launch.future)
+        )
+        self.registry.gauge(
+            "ignition_batch_containers", "containers lingering for the next request of their batch.",
+            lambda: sum(map(len, self.shared.values()))
+        )
+        for name, cache in (("artifact", self.cache), ("result", self.results_cache)):
+            if cache:
+                self.registry.gauge(
+                    f"ignition_{name}_cache_hits_total", f"{name} cache hits.", lambda c=cache: c.hits, "counter"
+                )
+                self.registry.gauge(
+                    f"ignition_{name}_cache_misses_total", f"{name} cache misses.", lambda c=cache: c.misses, "counter"
+                )
+
+    async def _memoized(self, request: protocol.Request, memoize: bool, tag: Optional[Hashable],
+                        user: Optional[Hashable], priority: int,
+                        group: Optional[uuid.UUID]) -> Tuple[protocol.Status, Optional[protocol.Response]]:
+        """
+        processes a request, see process, as part of the batch group if given.
+        """
+        if not memoize or not self.results_cache:
+            return await self._queue(request, user, priority, group)
+        request = {**request, "limits": self._limits(request)}
+        (status, response), cached = await self.results_cache.run(
+            self.results_cache.key(request), functools.partial(self._queue, request, user, priority, group), tag
         )
-        self.logger.debug(f"container '{container.short_id}' started.")
+        return status, {**response, "cached": cached} if response else response
 
-        future: asyncio.Future[Tuple[socket.socket, Tuple[str, int]]] = self.loop.create_future()
-        self.logger.debug(f"waiting for a container to connect...")
-        self.lingering_processes.append(future)
+    async def _queue(self, request: protocol.Request, user: Optional[Hashable], priority: int,
+                     group: Optional[uuid.UUID] = None) -> Tuple[protocol.Status, Optional[protocol.Response]]:
+        """
+        queues the request and waits for its result.
+
+        the request can use the containers shared within its batch group.
+        """
+        future: asyncio.Future[Tuple[protocol.Status, Optional[protocol.Response]]] = self.loop.create_future()
+        self.results[(uid := uuid.uuid4())] = future
+        if group:
+            self.groups[uid] = group
+        self.submitted[uid] = self.loop.time()
+        try:
+            self.scheduler.submit(
+                uid, {**request, **self._artifact(request), "limits": self._limits(request)}, user, priority
+            )
+            return await future
+        finally:
+            self.results.pop(uid, None)
+            self.groups.pop(uid, None)
+            self.submitted.pop(uid, None)
+            self._abort(uid, future)
+
+    async def stream(self, request: protocol.Request,
+                     user: Optional[Hashable] = None,
+                     priority: int = 0) -> AsyncIterator[
+            Union[Tuple[protocol.Stream, bytes], Tuple[protocol.Status, Optional[protocol.Response]]]]:
+        """
+        queues the request to be processed and streams its output.
+
+        yields (stream, data) tuples as the output is produced and finally the same
+        (status, response) tuple as process returns. the response does not contain the streamed output.
+
+        the client stops streaming a stream when it reaches its limit.
+        if the client sends more than the limit anyway the container is stopped and the status is payload_too_large.
+
+        if the caller stops iterating before the end the request is aborted.
+        raises Overloaded if the request is rejected or waited too long.
+        """
+        future: asyncio.Future[Tuple[protocol.Status, Optional[protocol.Response]]] = self.loop.create_future()
+        chunks: asyncio.Queue[Tuple[protocol.Stream, bytes]] = asyncio.Queue(self.stream_buffer)
+        self.results[(uid := uuid.uuid4())] = future
+        self.streams[uid] = chunks
+        self.submitted[uid] = self.loop.time()
         try:
-            await asyncio.wait_for(future, 5)
-        except asyncio.TimeoutError as e:
-            self.lingering_processes.remove(future)
-            raise e
-        result = future.result()
-        self.logger.debug(f"connection from '{result[1][0]}:{result[1][1]}' received.")
-        return result
+            self.scheduler.submit(uid, {
+                **request, **self._artifact(request), "stream": True, "limits": self._limits(request)
+            }, user, priority)
+            while not future.done():
+                getter = self.loop.create_task(chunks.get())
+                await asyncio.wait((getter, future), return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            while not chunks.empty():
+                yield chunks.get_nowait()
+            yield future.result()
+        finally:
+            self.results.pop(uid, None)
+            self.streams.pop(uid, None)
+            self.submitted.pop(uid, None)
+            self._abort(uid, future)
+
+    async def _get_connection(self, language: str, group: Optional[uuid.UUID] = None) -> Union[Member, Slot]:
+        """
+        takes a connection to run a request in language on.
+
+        a container kept by an earlier request of the same batch group is preferred, then a free slot on a node.
+        otherwise a connected container is checked out from the pool.
+        prefers a container warmed up for language. if no container is idle a container is started
+        and if the connection is not established within 5 seconds a asyncio.TimeoutError is raised.
+        """
+        if group and (member := self._take_shared(group, language)):
+            self.logger.debug(f"reusing container '{member.address[0]}:{member.address[1]}' of batch '{group}'.")
+            return member
+        if self.cluster and (slot := self.cluster.acquire(language)):
+            self.logger.debug(f"placing request on node '{slot.node.name}'.")
+            return slot
+        self.logger.debug(f"checking out a container from {self.pool}...")
+        member = await self.pool.checkout(language)
+        self.logger.debug(f"connection from '{member.address[0]}:{member.address[1]}' received.")
+        return member
 
     async def _process(self, uid: uuid.UUID, request: protocol.Request) -> None:
         """
         processes a request.
 
         starts and waits for a client to connect.
-        when a client connects the requests is sent and the response is received.
+        when a client connects the requests is sent and the response is received
+        using the protocol version negotiated with the client.
         when the response is received the future created in process() is set.
+
+        if a node fails while running the request the node is dropped and the request is run again
+        elsewhere unless output of the request has already been streamed.
+
+        the time of every phase and the status of the request are recorded, see exposition.
         """
         self.logger.info(f"starting to process '{uid}'.")
         self.logger.debug(f"waiting for container to connect to process '{uid}'...")
+        now = self.loop.time()
+        self.phases.child("queue").observe(now - self.submitted.get(uid, now))
+        status: Optional[protocol.Status] = None
         try:
-            connection, (ip, port) = await self._get_connection()
-            self.logger.debug(f"connection '{ip}:{port}' connected to process '{uid}'.")
-            self.logger.debug(f"sending request to connection '{ip}:{port}'.")
-            await self.communicator.send_request(connection, request)
-            self.logger.debug(f"waiting for status from connection '{ip}:{port}'...")
-            status = await self.communicator.recv_status(connection)
-            self.logger.debug(f"received status '{status}' from connection '{ip}:{port}'.")
-
-            if status == protocol.Status.success:
-                self.logger.debug(f"waiting for '{ip}:{port}' to send back a response object...")
-                response = await self.communicator.recv_response(connection)
-                self.logger.debug(f"received response from '{ip}:{port}'.")
-                self.logger.debug(f"defining the response in process '{uid}' to response from '{ip}:{port}'.")
-            else:
-                self.logger.debug(f"defining the response in process '{uid}' to None since '{ip}:{port}' failed.")
-                response = None
+            while True:
+                target = await self._get_connection(request["language"], self.groups.get(uid))
+                if isinstance(target, Member) and target.spawn:
+                    self.phases.child("spawn").observe(target.spawn)
+                    self.phases.child("connect").observe(target.connect)
+                try:
+                    sent = self.loop.time()
+                    status, response = await self._run_on(uid, target, request)
+                    self._observe(request["language"], self.loop.time() - sent, response)
+                    break
+                except (ConnectionError, ValueError) as e:
+                    if not isinstance(target, Slot) or uid in self.delivered:
+                        raise e
+                    self.logger.warning(f"node '{target.node.name}' failed running '{uid}' ({e}). retrying.")
+                    self.cluster.fail(target.node)
             self.results[uid].set_result((status, response))
-
-            connection.close()
-            self.logger.info(
-                f"process '{uid}' ran in container from '{ip}:{port}' "
-                f"and exited with status '{status}'."
-            )
+            self.logger.info(f"process '{uid}' exited with status '{status}'.")
         except asyncio.TimeoutError:
             status = protocol.Status.internal_server_error
             self.logger.error(f"no connection from container was made. Aborting process '{uid}'.")
@@ -157,45 +507,244 @@ class Server:
                 f"process '{uid}' did not receive a connection "
                 f"and exited with status '{status}'."
             )
+        except LaunchError as e:
+            status = protocol.Status.internal_server_error
+            self.logger.error(f"failed to start a container ({e}). Aborting process '{uid}'.")
+            self.results[uid].set_result((status, None))
+        except (ConnectionError, ValueError) as e:
+            status = protocol.Status.internal_server_error
+            self.logger.error(f"connection to container was lost ({e}). Aborting process '{uid}'.")
+            self.results[uid].set_result((status, None))
         finally:
+            if status:
+                self.statuses.child(request["language"], status.name).inc()
+            self.delivered.discard(uid)
+            self.tasks.pop(uid, None)
             self.logger.debug(f"removing process '{uid}' from queue.")
-            self.queue.remove(uid)
-            self._advance_queue()
+            self.scheduler.release(uid)
 
-    def _advance_queue(self) -> None:
+    def _observe(self, language: str, elapsed: float, response: Optional[protocol.Response]) -> None:
         """
-        advances the queue.
+        records the phases the client measured and the rest of the elapsed seconds as transfer
+        and the resource usage of the program if the client measured it.
+        """
+        phases = response.get("phases", {}) if response else {}
+        for phase, ns in phases.items():
+            self.phases.child(phase).observe(ns / 1e9)
+        self.phases.child("transfer").observe(max(elapsed - sum(phases.values()) / 1e9, 0))
+        if not response:
+            return
+        for mode in ("user", "sys"):
+            if (ns := response.get(f"{mode}_ns")) is not None:
+                self.cpu.child(language, mode).inc(ns / 1e9)
+        if (max_rss := response.get("max_rss")) is not None:
+            self.memory.child(language).observe(max_rss)
 
-        moves and starts processes from overflow to the queue if there is room.
+    async def _run_on(self, uid: uuid.UUID, target: Union[Member, Slot],
+                      request: protocol.Request) -> Tuple[protocol.Status, Optional[protocol.Response]]:
+        """
+        runs a request on a container or a slot of a node.
 
-        IMPORTANT this method NEEDS to be called whenever self.queue is mutated.
-        should probably make get and set property in the future.
+        the connection of a container is closed after the request unless the request is part of a batch,
+        then a container that supports it and ran the request successfully is kept for the batch.
+        a slot is given back to its node unless the request failed.
+        nodes keep their own artifact cache so the artifact fields are not sent to them.
+        an earlier program of the batch could have tampered with a reused container so it is not asked
+        for an artifact and its response is marked reused so the result is not memoized either.
+        a request with cases is not_implemented by clients and agents older than protocol version 4
+        and a request with a benchmark by those older than version 5.
         """
-        while self.overflow and len(self.queue) < self.queue_size:
-            self.logger.debug("advancing the queue.")
-            uid, request = self.overflow.popitem(last=False)
-            self.queue.add(uid)
-            asyncio.create_task(self._process(uid, request))
-        self.logger.info(
-            f"current queue: {len(self.queue)} / {self.queue_size} "
-            f"with overflow: {len(self.overflow)} / ∞"
-        )
+        connection, (ip, port) = target.connection, target.address
+        if isinstance(target, Slot):
+            request = {key: value for key, value in request.items() if key not in ("artifact", "cached")}
+        elif target.reused and not request.get("cached"):
+            request = {key: value for key, value in request.items() if key != "artifact"}
+        failed = True
+        reusable = False
+        try:
+            if request.get("cases") and target.version < 4:
+                self.logger.warning(f"connection '{ip}:{port}' can not run cases. rejecting process '{uid}'.")
+                failed = False
+                return protocol.Status.not_implemented, None
+            if request.get("benchmark") and target.version < 5:
+                self.logger.warning(f"connection '{ip}:{port}' can not run benchmarks. rejecting process '{uid}'.")
+                failed = False
+                return protocol.Status.not_implemented, None
+            self.logger.debug(f"sending request to connection '{ip}:{port}'.")
+            await self.communicator.send_request(connection, request, target.version)
+            self.logger.debug(f"waiting for result from connection '{ip}:{port}'...")
+            if uid in self.streams or (request.get("artifact") and not request.get("cached") and target.version >= 2):
+                result = await self._recv_stream(uid, connection, target.version, request)
+            else:
+                result = await self.communicator.recv_result(connection, target.version)
+            self.logger.debug(f"received status '{result[0]}' from connection '{ip}:{port}'.")
+            failed = result[0] == protocol.Status.payload_too_large
+            reusable = result[0] == protocol.Status.success
+            if isinstance(target, Member) and target.reused and result[1]:
+                result[1]["reused"] = True
+            return result
+        finally:
+            if isinstance(target, Member):
+                if not (reusable and self._share(uid, target, request["language"])):
+                    connection.close()
+            elif failed:
+                # the agent may still be sending the output of the request
+                self.cluster.discard(target)
+            else:
+                self.cluster.release(target)
+
+    async def _recv_stream(self, uid: uuid.UUID, connection: socket.socket, version: int,
+                           request: protocol.Request) -> Tuple[protocol.Status, Optional[protocol.Response]]:
+        """
+        receives streamed output and passes it on to the stream of the process.
+
+        stops the process with the status payload_too_large as soon as a stream exceeds its limit.
+        version 1 clients can not stream so their output is passed on after they are done.
+
+        a build artifact sent by the client is stored in the cache once the result is received.
+        a process that is not streamed only receives an artifact and its output arrives in the result.
+        """
+        chunks = self.streams.get(uid)
+        limits = request["limits"]
+        if version < 2:
+            status, response = await self.communicator.recv_result(connection, version)
+            for stream in (protocol.Stream.stdout, protocol.Stream.stderr):
+                if response and response[stream.name]:
+                    await chunks.put((stream, response[stream.name][:limits[stream.name]]))
+                    self.delivered.add(uid)
+                    response[stream.name] = None
+            return status, response
+
+        received = {stream: 0 for stream in protocol.Stream}
+        artifact: Optional[bytes] = None
+        async for item in self.communicator.recv_stream(connection):
+            if isinstance(item[0], protocol.Status):
+                if artifact is not None and item[0] == protocol.Status.success and self.cache:
+                    await self.cache.put(request["artifact"], artifact)
+                return item
+            stream, data = item
+            if stream == protocol.Stream.artifact:
+                artifact = data
+                continue
+            if not chunks:
+                raise ValueError(f"received {stream.name} from a process that is not streamed.")
+            received[stream] += len(data)
+            if received[stream] > limits[stream.name]:
+                self.logger.warning(
+                    f"process '{uid}' exceeded {limits[stream.name]} bytes of {stream.name}. stopping the process."
+                )
+                return protocol.Status.payload_too_large, None
+            await chunks.put(item)
+            self.delivered.add(uid)
+        raise ConnectionError("stream ended without a result.")
+
+    def _share(self, uid: uuid.UUID, member: Member, language: str) -> bool:
+        """
+        keeps the container of a request for the next request of its batch.
+
+        returns False if the request is not part of a running batch or the client can not run another request.
+        """
+        if member.version < 3 or (shared := self.shared.get(self.groups.get(uid))) is None:
+            return False
+        member.language = language
+        member.idle_since = self.loop.time()
+        member.spawn = member.connect = 0
+        member.reused = True
+        shared.append(member)
+        return True
+
+    def _take_shared(self, group: uuid.UUID, language: str) -> Optional[Member]:
+        """
+        takes a healthy container kept by the batch group that last ran a request in language.
+        """
+        shared = self.shared.get(group, [])
+        for member in [member for member in shared if member.language == language]:
+            shared.remove(member)
+            if member.alive():
+                return member
+            member.close()
+        return None
+
+    def _artifact(self, request: protocol.Request) -> protocol.Request:
+        """
+        the artifact fields of a request.
+
+        only programs in languages with build commands have an artifact.
+        the build commands are resolved with fixed paths so the key does not depend on the container.
+        """
+        if not self.cache or request["language"] not in Languages:
+            return {}
+        build = Languages[request["language"]](Path("/source"), Path("/build")).build
+        if not build:
+            return {}
+        key = self.cache.key(request["language"], request["code"], build)
+        return {"artifact": key, "cached": self.cache.get(key)}
+
+    def _limits(self, request: protocol.Request) -> protocol.Limits:
+        """
+        the output limits of a request.
+
+        each stream is limited to the smallest of the limit in the request,
+        the limit of the language and max_output_limit.
+        """
+        language_limit = self.output_limits.get(request["language"], self.default_output_limit)
+        requested = request.get("limits", {})
+        return {
+            "stdout": min(requested.get("stdout", language_limit), language_limit, self.max_output_limit),
+            "stderr": min(requested.get("stderr", language_limit), language_limit, self.max_output_limit),
+            "kill": requested.get("kill", True)
+        }
+
+    def _start(self, uid: uuid.UUID, request: protocol.Request) -> None:
+        """
+        starts processing a request the scheduler gave a slot.
+        """
+        self.tasks[uid] = self.loop.create_task(self._process(uid, request))
+
+    def _expire(self, uid: uuid.UUID, error: Overloaded) -> None:
+        """
+        fails a pending request the scheduler shed or expired.
+        """
+        if (future := self.results.get(uid)) and not future.done():
+            future.set_exception(error)
+
+    def _abort(self, uid: uuid.UUID, future: "asyncio.Future[Any]") -> None:
+        """
+        aborts a request whose caller stopped waiting for it.
+
+        a pending request is removed from the scheduler and a running request is cancelled.
+        """
+        # awaiting a future that is cancelled cancels the future as well
+        if future.done() and not future.cancelled():
+            return
+        self.logger.info(f"process '{uid}' was abandoned. aborting process.")
+        future.cancel()
+        if not self.scheduler.cancel(uid) and (task := self.tasks.get(uid)):
+            task.cancel()
 
     async def _run(self) -> None:
         """
         handles incoming connection from clients from docker containers.
 
-        whenever a client connects the first process in the queue is given the connection
-        by setting a future.
+        whenever a client connects the connection is registered in the container pool
+        which gives it to a waiting process or keeps it idle.
         """
         try:
             self.logger.info(f"listening for connections on port 6090...")
             while True:
                 connection, address = await self.loop.sock_accept(self.sock)
-                if self.lingering_processes:
-                    self.lingering_processes.pop(0).set_result((connection, address))
-                else:
-                    self.logger.info(f"connection received but no process needs a client. closing connection.")
-                    connection.close()
+                self.loop.create_task(self.pool.register(connection, address))
         except ConnectionError:
             self.logger.debug(f"container connected but no process was waiting for a connection.")
+
+    async def _run_nodes(self) -> None:
+        """
+        handles incoming connections from agents on other nodes.
+
+        every connection is a slot of a node and is registered in the cluster.
+        """
+        host, port = self.node_sock.getsockname()[:2]
+        self.logger.info(f"listening for nodes on {host}:{port}...")
+        while True:
+            connection, address = await self.loop.sock_accept(self.node_sock)
+            self.loop.create_task(self.cluster.register(connection, address))
@@ -5,10 +5,15 @@ from pathlib import Path
 import ignition
 import asyncio
 import subprocess
+import sys
+import tempfile
 import uvicorn
 import enum
 import sql
 from sqlalchemy import text
+from ignition.server.backends import LocalBackend, FakeBackend
+from ignition.server.ipc import Dispatcher
+import benchmarks.load
 
 logger = ignition.get_logger(__name__, logging.INFO, stdout=True)
 
@@ -39,8 +44,34 @@ def start_client(_args):
     loop.run_until_complete(client.run())
 
 
+def start_agent(_args):
+    loop = asyncio.get_event_loop()
+    if _args.local:
+        executor = ignition.agent.executors.LocalExecutor()
+    else:
+        executor = ignition.agent.executors.ServerExecutor(
+            ignition.Server(_args.slots, logger=logger, loop=loop, pool_affinity={
+                language: 1 for language in _args.warm
+            })
+        )
+    agent = ignition.Agent(
+        executor, _args.host, _args.port, name=_args.name, slots=_args.slots, warm=_args.warm,
+        secret=_args.secret, logger=logger, loop=loop
+    )
+    loop.run_until_complete(agent.run())
+
+
+def start_scheduler(_args):
+    # the routers must not start a server of their own in this process
+    os.environ["IGNITION_SCHEDULER"] = str(_args.path)
+    import routers
+    loop = asyncio.get_event_loop()
+    server = routers.snippet.create_server(loop)
+    loop.run_until_complete(Dispatcher(server, _args.path, logger=logger, loop=loop).run())
+
+
 def start_server(_args):
-    print(_args)
+    logger.debug(f"starting the server with {_args}")
     kwargs = {
         "port": _args.port,
         "root_path": _args.root_path,
@@ -49,16 +80,34 @@ def start_server(_args):
     }
     if _args.dev:
         kwargs["reload"] = True
+    if _args.workers <= 1:
+        uvicorn.run(
+            "app:app", **kwargs
+        )
+        return
 
-    uvicorn.run(
-        "app:app", **kwargs
-    )
+    # the workers share a single scheduler process so the limits of the server stay global
+    path = Path(tempfile.mkdtemp(prefix="ignition-")).joinpath("scheduler.sock")
+    os.environ["IGNITION_SCHEDULER"] = str(path)
+    scheduler = subprocess.Popen([sys.executable, __file__, "scheduler", "--path", str(path)])
+    try:
+        uvicorn.run(
+            "app:app", workers=_args.workers, **kwargs
+        )
+    finally:
+        scheduler.terminate()
+        scheduler.wait()
 
 
 def test(_args):
     async def _test():
         loop = asyncio.get_event_loop()
-        server = ignition.Server(3, logger=logger, loop=loop)
+        backends = {
+            "docker": lambda: None,
+            "local": lambda: LocalBackend(logger=logger, loop=loop),
+            "fake": lambda: FakeBackend(launch_latency=0.5, run_latency=0.1, logger=logger, loop=loop)
+        }
+        server = ignition.Server(3, logger=logger, loop=loop, backend=backends[_args.backend]())
         print("testing async")
         tasks = [asyncio.create_task(server.process({
             "language": "python",
@@ -98,12 +147,16 @@ def test(_args):
         for index, (status, result) in enumerate(results):
             print(index + 1, status, result)
         print("results", server.results)
-        print("queue", server.queue)
-        print("queue_overflow", server.overflow)
+        print("scheduler", server.scheduler)
+        print("pool", server.pool)
 
     asyncio.run(_test())
 
 
+def bench(_args):
+    sys.exit(benchmarks.load.run(_args))
+
+
 def db(_args):
     def init(_db_args):
         sql.models.Base.metadata.create_all(bind=sql.database.engine)
@@ -112,9 +165,13 @@ def db(_args):
     def drop(_db_args):
         sql.models.Base.metadata.drop_all(bind=sql.database.engine)
 
+    def upgrade(_db_args):
+        sql.database.engine.execute(text(sql.raw.upgrade))
+
     db_modes = {
         "init": lambda _db_args: init(_db_args),
-        "drop": lambda _db_args: drop(_db_args)
+        "drop": lambda _db_args: drop(_db_args),
+        "upgrade": lambda _db_args: upgrade(_db_args)
     }
     db_modes[_args.db_mode](_args)
 
@@ -140,25 +197,62 @@ if __name__ == '__main__':
         "--dev", action="store_true", help="start a development server.")
     server_parser.add_argument(
         "--root-path", type=str, default="", help="application root url.")
+    server_parser.add_argument(
+        "--workers", type=int, default=1, help="http worker processes sharing a scheduler process.")
+
+    scheduler_parser = sub_parsers.add_parser(
+        "scheduler", help="starts the scheduler shared by the http workers (internal use).")
+    scheduler_parser.add_argument(
+        "--path", type=Path, required=True, help="path of the unix socket the workers connect to.")
 
     client_parser = sub_parsers.add_parser(
         "client", help="starts a ignition client (internal use).")
 
+    agent_parser = sub_parsers.add_parser(
+        "agent", help="starts an agent running requests for a server on another machine.")
+    agent_parser.add_argument(
+        "host", type=str, help="host of the server.")
+    agent_parser.add_argument(
+        "--port", type=int, default=6091, help="node port of the server.")
+    agent_parser.add_argument(
+        "--name", type=str, help="unique name of the node, defaults to the hostname and pid.")
+    agent_parser.add_argument(
+        "--slots", type=int, default=4, help="amount of requests the node runs at once.")
+    agent_parser.add_argument(
+        "--warm", type=str, nargs="*", default=[], help="languages to keep warmed up containers for.")
+    agent_parser.add_argument(
+        "--secret", type=str, default=os.environ.get("IGNITION_NODE_SECRET"),
+        help="secret shared with the server, defaults to IGNITION_NODE_SECRET.")
+    agent_parser.add_argument(
+        "--local", action="store_true", help="run programs directly on the machine without containers (testing).")
+
     test_parser = sub_parsers.add_parser(
         "test", help="test the ignition internals.")
     test_parser.add_argument("--app-port", type=int, help="port for ignitions internal use.")
+    test_parser.add_argument(
+        "--backend", type=str, choices=["docker", "local", "fake"], default="docker",
+        help="execution backend to run the requests with.")
+
+    bench_parser = sub_parsers.add_parser(
+        "bench", help="load test the execution pipeline and compare the results to a baseline.")
+    benchmarks.load.add_arguments(bench_parser)
 
     db_parser = sub_parsers.add_parser(
         "db", help="CLI utility for managing the database.")
     db_sub_parser = db_parser.add_subparsers(dest="db_mode")
     db_init_parser = db_sub_parser.add_parser("init", help="initializes the database.")
     db_recreate_parser = db_sub_parser.add_parser("drop", help="drops the database.")
+    db_upgrade_parser = db_sub_parser.add_parser(
+        "upgrade", help="adds new columns to the tables of an existing database.")
 
     modes = {
         "build": lambda _args: build_docker_image(_args),
         "server": lambda _args: start_server(_args),
         "client": lambda _args: start_client(_args),
+        "scheduler": lambda _args: start_scheduler(_args),
+        "agent": lambda _args: start_agent(_args),
         "test": lambda _args: test(_args),
+        "bench": lambda _args: bench(_args),
         "db": lambda _args: db(_args)
     }
     try:
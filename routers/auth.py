@@ -1,7 +1,9 @@
+import hmac
 import schemas
 import sql
 import fastapi
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
+from sqlalchemy.ext.asyncio import AsyncSession
 
 router = fastapi.APIRouter(tags=["Auth"])
 
@@ -9,6 +11,47 @@ router = fastapi.APIRouter(tags=["Auth"])
 oath = OAuth2PasswordBearer("token/")
 
 
+def internal(auth_token: str = fastapi.Depends(oath)) -> None:
+    """
+    only lets requests with the metrics_token of the credentials file through.
+
+    the internal endpoints expose the state of the server and its users so a user token is not enough.
+    they do not exist when no metrics_token is configured.
+    """
+    if not sql.database.METRICS_TOKEN:
+        raise fastapi.HTTPException(404)
+    if not hmac.compare_digest(auth_token.encode("utf-8"), sql.database.METRICS_TOKEN.encode("utf-8")):
+        raise fastapi.HTTPException(403)
+
+
+def busy(error: sql.errors.HasherBusy) -> fastapi.HTTPException:
+    """
+    the 503 response of a request rejected because too many passwords are being hashed.
+    """
+    return fastapi.HTTPException(503, detail=error.details, headers={"Retry-After": "1"})
+
+
+async def login(session: AsyncSession, data: OAuth2PasswordRequestForm) -> sql.models.User:
+    """
+    the user with the email and password in data.
+
+    a password hashed with outdated parameters is rehashed.
+    """
+    async with sql.async_crud.User(session) as crud:
+        user = await crud.get_by_email(data.username)
+        if not user:
+            raise fastapi.HTTPException(400)
+        try:
+            verified, password_hash = await sql.passwords.hasher.verify(user.password_hash, data.password)
+        except sql.errors.HasherBusy as e:
+            raise busy(e)
+        if not verified:
+            raise fastapi.HTTPException(401)
+        if password_hash:
+            await crud.update_password_hash(user, password_hash)
+    return user
+
+
 @router.post(
     f"/token/",
     response_model=schemas.token.TokenResponse)
@@ -20,15 +63,10 @@ async def get_token(
 
     unless you rely on the spec use the 'authenticate' endpoint instead.
     """
-    with sql.database.Session() as session:
-        with sql.crud.User(session) as crud:
-            user = crud.get_by_email(data.username)
-        if not user:
-            raise fastapi.HTTPException(400)
-        if not sql.crud.hasher.verify(user.password_hash, data.password):
-            raise fastapi.HTTPException(401)
-        with sql.crud.Token(session) as crud:
-            crud.create(user)
+    async with sql.database.AsyncSession() as session:
+        user = await login(session, data)
+        async with sql.async_crud.Token(session) as crud:
+            await crud.create(user)
 
         return schemas.token.TokenResponse(
             access_token=user.token.access_token, expires=user.token.expires
@@ -48,15 +86,10 @@ async def authenticate_user(
 
     only required fields are used.
     """
-    with sql.database.Session() as session:
-        with sql.crud.User(session) as crud:
-            user = crud.get_by_email(data.username)
-        if not user:
-            raise fastapi.HTTPException(400)
-        if not sql.crud.hasher.verify(user.password_hash, data.password):
-            raise fastapi.HTTPException(401)
-        with sql.crud.Token(session) as crud:
-            crud.create(user)
+    async with sql.database.AsyncSession() as session:
+        user = await login(session, data)
+        async with sql.async_crud.Token(session) as crud:
+            await crud.create(user)
 
         return schemas.user.UserResponse(
             id=user.id, email=user.email, token=user.token, quota=user.quota
@@ -75,16 +108,20 @@ async def register_user(
 
     only required fields are used.
     """
-    with sql.database.Session() as session:
-        with sql.crud.User(session) as crud:
+    try:
+        password_hash = await sql.passwords.hasher.hash(data.password)
+    except sql.errors.HasherBusy as e:
+        raise busy(e)
+    async with sql.database.AsyncSession() as session:
+        async with sql.async_crud.User(session) as crud:
             try:
-                user = crud.create(data)
+                user = await crud.create(data, password_hash)
             except sql.errors.DuplicateEmail as e:
                 raise fastapi.HTTPException(400, detail=e.details)
-        with sql.crud.Token(session) as crud:
-            crud.create(user)
-        with sql.crud.Quota(session) as crud:
-            crud.create(user)
+        async with sql.async_crud.Token(session) as crud:
+            await crud.create(user)
+        async with sql.async_crud.Quota(session) as crud:
+            await crud.create(user)
 
         return schemas.user.UserResponse(
             id=user.id, email=user.email, token=user.token, quota=user.quota
@@ -101,7 +138,9 @@ async def logout_user(
     log out a user.
 
     destroys the session.
+    other http workers may accept the token until their token cache expires it.
     """
-    with sql.database.Session() as session:
-        sql.crud.Token(session).delete_by_value(auth_token)
+    sql.tokens.cache.invalidate(auth_token)
+    async with sql.database.AsyncSession() as session:
+        await sql.async_crud.Token(session).delete_by_value(auth_token)
     return fastapi.Response(status_code=204)
@@ -1,21 +1,142 @@
+from typing import *
 import fastapi
 import sql
 import schemas
-import datetime
 import uuid
+import json
+import codecs
+import os
+from pathlib import Path
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
 import asyncio
 import logging
 import ignition
+from ignition.common import protocol
+from ignition.server.scheduler import Overloaded
+from .auth import internal
+
+
+def create_server(loop: asyncio.AbstractEventLoop) -> ignition.Server:
+    """
+    the execution server of the api.
+
+    with several http workers it runs in the scheduler process started by main.py instead.
+    """
+    return ignition.Server(
+        logger=ignition.get_logger(__name__, logging.INFO, stdout=True), loop=loop,
+        pool_min_size=4, pool_max_size=10,
+        cache_directory=Path(__file__).parent.parent.joinpath("cache"),
+        result_ttl=300,
+        standby=True
+    )
 
 
 loop = asyncio.get_event_loop()
-server = ignition.Server(10, ignition.get_logger(__name__, logging.INFO, stdout=True), loop=loop)
+# the workers share the server of the scheduler process when IGNITION_SCHEDULER is set
+server = ignition.RemoteServer(
+    Path(os.environ["IGNITION_SCHEDULER"]),
+    logger=ignition.get_logger(__name__, logging.INFO, stdout=True), loop=loop
+) if os.environ.get("IGNITION_SCHEDULER") else create_server(loop)
 
 router = fastapi.APIRouter(tags=["Snippets"])
 oath = OAuth2PasswordBearer("token/")
 
 
+def limits_of(quota: Optional[sql.tokens.Quota]) -> protocol.Limits:
+    """
+    the output limits of a user with the given quota.
+    """
+    if not quota or quota.output_limit is None:
+        return {}
+    return {"stdout": quota.output_limit, "stderr": quota.output_limit}
+
+
+def priority_of(quota: Optional[sql.tokens.Quota]) -> int:
+    """
+    the scheduling priority of a user with the given quota.
+    """
+    return quota.tier if quota and quota.tier is not None else 0
+
+
+def cases_of(data: schemas.process.ProcessData) -> protocol.Request:
+    """
+    the cases field of the request of a process, empty if there are no cases.
+    """
+    return {"cases": [case.dict(exclude_none=True) for case in data.cases]} if data.cases else {}
+
+
+def benchmark_of(data: schemas.process.ProcessData) -> protocol.Request:
+    """
+    the benchmark field of the request of a process, empty if the process is not a benchmark.
+    """
+    return {"benchmark": data.benchmark.dict()} if data.benchmark else {}
+
+
+def overloaded(error: Overloaded) -> fastapi.HTTPException:
+    """
+    the 503 response of a process rejected by the scheduler.
+    """
+    return fastapi.HTTPException(503, str(error), headers={"Retry-After": str(error.retry_after)})
+
+
+def rate_limit(identity: sql.tokens.Identity, count: int = 1) -> sql.rate_limit.Decision:
+    """
+    takes count requests from the rate limit of a user.
+
+    raises a 429 with the time until the requests are allowed if the user has too few requests left.
+    """
+    decision = sql.rate_limit.limiter.take(identity.user_id, identity.quota, count)
+    if not decision.allowed:
+        raise fastapi.HTTPException(429, "rate limit exceeded", headers=decision.headers())
+    return decision
+
+
+def process_response(
+        status: protocol.Status, response: Optional[protocol.Response]
+) -> schemas.process.ProcessResponse:
+    """
+    converts the result of a process to a ProcessResponse.
+
+    the output is decoded as utf-8, bytes that are not valid utf-8 are replaced.
+    """
+    if not response:
+        return schemas.process.ProcessResponse(status=status.value)
+    return schemas.process.ProcessResponse(
+        status=status.value,
+        stdout=response["stdout"].decode("utf-8", "replace") if response["stdout"] is not None else None,
+        stderr=response["stderr"].decode("utf-8", "replace") if response["stderr"] is not None else None,
+        ns=response["ns"],
+        stdout_bytes=response.get("stdout_bytes"),
+        stderr_bytes=response.get("stderr_bytes"),
+        stdout_truncated=response.get("stdout_truncated", False),
+        stderr_truncated=response.get("stderr_truncated", False),
+        cached=response.get("cached", False),
+        cases=[schemas.process.CaseResponse(**{
+            **case,
+            "stdout": case["stdout"].decode("utf-8", "replace") if case["stdout"] is not None else None,
+            "stderr": case["stderr"].decode("utf-8", "replace") if case["stderr"] is not None else None
+        }) for case in response["cases"]] if response.get("cases") is not None else None,
+        phases=response.get("phases"),
+        returncode=response.get("returncode"),
+        user_ns=response.get("user_ns"),
+        sys_ns=response.get("sys_ns"),
+        max_rss=response.get("max_rss"),
+        steps=response.get("steps"),
+        benchmark=response.get("benchmark")
+    )
+
+
+@router.get(
+    f"/queue/",
+    dependencies=[fastapi.Depends(internal)])
+async def queue() -> Dict[str, Any]:
+    """
+    the state of the process queue with histograms of the queue depth and the time spent waiting in it.
+    """
+    return await server.metrics()
+
+
 @router.get(
     f"/snippets/{{id}}/",
     response_model=schemas.snippet.SnippetResponse)
@@ -25,9 +146,9 @@ async def get_snippets(
     """
     get the code snippet with the specified id.
     """
-    with sql.database.Session() as session:
-        with sql.crud.Snippet(session) as crud:
-            snippet = crud.get_by_id(id)
+    async with sql.database.AsyncSession() as session:
+        async with sql.async_crud.Snippet(session) as crud:
+            snippet = await crud.get_by_id(id)
         if not snippet:
             raise fastapi.HTTPException(404)
         return snippet
@@ -43,14 +164,11 @@ async def create_snippets(
     """
     create a new code snippet.
     """
-    with sql.database.Session() as session:
-        with sql.crud.Token(session) as crud:
-            token = crud.get_by_access_token(auth_token)
-            if not token or token.expires < datetime.datetime.now():
-                raise fastapi.HTTPException(401)
-            crud.update(token)
-        with sql.crud.Snippet(session, token) as crud:
-            snippet = crud.create(token.user, data)
+    async with sql.database.AsyncSession() as session:
+        if not (identity := await sql.tokens.cache.authenticate(session, auth_token)):
+            raise fastapi.HTTPException(401)
+        async with sql.async_crud.Snippet(session, identity) as crud:
+            snippet = await crud.create(identity.user_id, data)
         if not snippet:
             raise fastapi.HTTPException(404)
         return snippet
@@ -61,27 +179,192 @@ async def create_snippets(
     response_model=schemas.process.ProcessResponse)
 async def process_snippets(
         data: schemas.process.ProcessData,
+        response: fastapi.Response,
         auth_token: str = fastapi.Depends(oath)
 ) -> schemas.process.ProcessResponse:
     """
     processes the snippet with the specified id.
+
+    if cases are given the snippet is built once and run for every case with the args and stdin of the case.
+    the result of every case is in cases, the output limits of the user apply to all cases together.
+
+    if a benchmark is given the snippet is built once, run warmup times and then timed iterations times
+    in the same container. the statistics of the timed runs are in benchmark and ns is their median.
+
+    the result of a deterministic snippet is memoized until the snippet is updated or deleted, benchmarks are not.
+    every request for an existing snippet counts towards the hourly cap of the users quota,
+    see the X-RateLimit headers.
     """
-    with sql.database.Session() as session:
-        with sql.crud.Token(session) as crud:
-            token = crud.get_by_access_token(auth_token)
-            if not token or token.expires < datetime.datetime.now():
-                raise fastapi.HTTPException(401)
-            crud.update(token)
-        with sql.crud.Snippet(session) as crud:
-            snippet = crud.get_by_id(data.id)
-
-    status, response = await server.process({
-        "language": snippet.language,
-        "code": snippet.code,
-        "args": snippet.args
-    })
-    return schemas.process.ProcessResponse(
-        status=status.value, stdout=response["stdout"], stderr=response["stderr"], ns=response["ns"]
+    async with sql.database.AsyncSession() as session:
+        if not (identity := await sql.tokens.cache.authenticate(session, auth_token)):
+            raise fastapi.HTTPException(401)
+        async with sql.async_crud.Snippet(session) as crud:
+            snippet = await crud.get_by_id(data.id)
+        if not snippet:
+            raise fastapi.HTTPException(404)
+        response.headers.update(rate_limit(identity).headers())
+        limits = limits_of(identity.quota)
+        priority = priority_of(identity.quota)
+        user_id = identity.user_id
+
+    try:
+        status, result = await server.process({
+            "language": snippet.language,
+            "code": snippet.code,
+            "args": snippet.args,
+            "limits": limits,
+            **cases_of(data),
+            **benchmark_of(data)
+        }, memoize=snippet.deterministic and not data.benchmark, tag=snippet.id, user=user_id, priority=priority)
+    except Overloaded as e:
+        raise overloaded(e)
+    return process_response(status, result)
+
+
+@router.post(
+    f"/snippets/process/stream/",
+    response_class=StreamingResponse)
+async def stream_snippets(
+        data: schemas.process.ProcessData,
+        auth_token: str = fastapi.Depends(oath)
+) -> StreamingResponse:
+    """
+    processes the snippet with the specified id and streams the output as server sent events.
+
+    every chunk of output is sent as a 'stdout' or 'stderr' event with the text json encoded as data.
+    the last event is a 'result' event with the status, the run time in ns and the output sizes.
+    the output of a snippet run with cases is not streamed but sent in the cases of the 'result' event.
+    neither is the output of a benchmark, the statistics are sent in the benchmark of the 'result' event.
+    if the server is overloaded the only event is an 'error' event with the status 503 and retry_after in seconds.
+    every request for an existing snippet counts towards the hourly cap of the users quota,
+    see the X-RateLimit headers.
+    """
+    async with sql.database.AsyncSession() as session:
+        if not (identity := await sql.tokens.cache.authenticate(session, auth_token)):
+            raise fastapi.HTTPException(401)
+        async with sql.async_crud.Snippet(session) as crud:
+            snippet = await crud.get_by_id(data.id)
+        if not snippet:
+            raise fastapi.HTTPException(404)
+        headers = rate_limit(identity).headers()
+        limits = limits_of(identity.quota)
+        priority = priority_of(identity.quota)
+        user_id = identity.user_id
+        request: protocol.Request = {
+            "language": snippet.language,
+            "code": snippet.code,
+            "args": snippet.args,
+            "limits": limits,
+            **cases_of(data),
+            **benchmark_of(data)
+        }
+
+    async def events() -> AsyncIterator[str]:
+        # output is decoded incrementally since a chunk can end in the middle of a character
+        decoders = {stream: codecs.getincrementaldecoder("utf-8")("replace") for stream in protocol.Stream}
+        try:
+            async for item in server.stream(request, user=user_id, priority=priority):
+                if isinstance(item[0], protocol.Stream):
+                    stream, chunk = item
+                    if text := decoders[stream].decode(chunk):
+                        yield f"event: {stream.name}\ndata: {json.dumps(text)}\n\n"
+                    continue
+                for stream, decoder in decoders.items():
+                    if text := decoder.decode(b"", final=True):
+                        yield f"event: {stream.name}\ndata: {json.dumps(text)}\n\n"
+                result = process_response(*item).dict(exclude={"stdout", "stderr"})
+                yield f"event: result\ndata: {json.dumps(result)}\n\n"
+        except Overloaded as e:
+            error = {"status": 503, "detail": str(e), "retry_after": e.retry_after}
+            yield f"retry: {e.retry_after * 1000}\nevent: error\ndata: {json.dumps(error)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+
+@router.post(
+    f"/snippets/process/batch/",
+    response_model=schemas.process.BatchResponse)
+async def batch_snippets(
+        data: schemas.process.BatchData,
+        response: fastapi.Response,
+        auth_token: str = fastapi.Depends(oath)
+) -> Union[schemas.process.BatchResponse, StreamingResponse]:
+    """
+    processes several snippets at once.
+
+    every job is either the id of a snippet or inline code in a language with its args.
+    the snippets are fetched in a single query and all jobs are queued at once.
+    jobs in the same language share their containers where possible.
+
+    if stream is set the results are streamed as newline delimited json in the order they complete
+    otherwise they are returned together in the order of the jobs.
+    every result has the index of its job. a job whose snippet does not exist has the status 404
+    and a job the server was too busy for has the status 503 and retry_after in seconds.
+
+    the result of a deterministic snippet is memoized until the snippet is updated or deleted.
+    every job except those whose snippet does not exist counts towards the hourly cap of the users quota,
+    see the X-RateLimit headers.
+    """
+    async with sql.database.AsyncSession() as session:
+        if not (identity := await sql.tokens.cache.authenticate(session, auth_token)):
+            raise fastapi.HTTPException(401)
+        limits = limits_of(identity.quota)
+        priority = priority_of(identity.quota)
+        user_id = identity.user_id
+        snippets = {}
+        if ids := {job.id for job in data.jobs if job.id}:
+            async with sql.async_crud.Snippet(session) as crud:
+                snippets = {snippet.id: snippet for snippet in await crud.get_by_ids(ids)}
+
+    missing: List[int] = []
+    indices: List[int] = []
+    requests: List[protocol.Request] = []
+    memoize: List[bool] = []
+    tags: List[Optional[uuid.UUID]] = []
+    for index, job in enumerate(data.jobs):
+        if job.id and not (snippet := snippets.get(job.id)):
+            missing.append(index)
+            continue
+        indices.append(index)
+        if job.id:
+            requests.append({
+                "language": snippet.language, "code": snippet.code, "args": snippet.args, "limits": limits
+            })
+            memoize.append(snippet.deterministic)
+            tags.append(snippet.id)
+        else:
+            requests.append({"language": job.language, "code": job.code, "args": job.args, "limits": limits})
+            memoize.append(False)
+            tags.append(None)
+    headers = rate_limit(identity, len(requests)).headers()
+
+    async def results() -> AsyncIterator[schemas.process.BatchResult]:
+        for index in missing:
+            yield schemas.process.BatchResult(index=index, status=404)
+        left = set(indices)
+        try:
+            async for position, result in server.batch(requests, memoize, tags, user=user_id, priority=priority):
+                left.discard(indices[position])
+                if isinstance(result, Overloaded):
+                    yield schemas.process.BatchResult(
+                        index=indices[position], status=503, retry_after=result.retry_after
+                    )
+                else:
+                    yield schemas.process.BatchResult(index=indices[position], **process_response(*result).dict())
+        except Overloaded as e:
+            # the scheduler was lost during the batch
+            for index in sorted(left):
+                yield schemas.process.BatchResult(index=index, status=503, retry_after=e.retry_after)
+
+    if data.stream:
+        async def lines() -> AsyncIterator[str]:
+            async for result in results():
+                yield f"{result.json()}\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson", headers=headers)
+    response.headers.update(headers)
+    return schemas.process.BatchResponse(
+        results=sorted([result async for result in results()], key=lambda result: result.index)
     )
 
 
@@ -96,16 +379,14 @@ async def update_snippets(
     """
     update the code snippet with the specified id.
     """
-    with sql.database.Session() as session:
-        with sql.crud.Token(session) as crud:
-            token = crud.get_by_access_token(auth_token)
-            if not token or token.expires < datetime.datetime.now():
-                raise fastapi.HTTPException(401)
-            crud.update(token)
-        with sql.crud.Snippet(session, token) as crud:
-            snippet = crud.update_by_id(id, data)
+    async with sql.database.AsyncSession() as session:
+        if not (identity := await sql.tokens.cache.authenticate(session, auth_token)):
+            raise fastapi.HTTPException(401)
+        async with sql.async_crud.Snippet(session, identity) as crud:
+            snippet = await crud.update_by_id(id, data)
         if not snippet:
             raise fastapi.HTTPException(404)
+        server.invalidate(snippet.id)
         return snippet
 
 
@@ -119,14 +400,12 @@ async def delete_snippets(
     """
     delete the code snippet with the specified id.
     """
-    with sql.database.Session() as session:
-        with sql.crud.Token(session) as crud:
-            token = crud.get_by_access_token(auth_token)
-            if not token or token.expires < datetime.datetime.now():
-                raise fastapi.HTTPException(401)
-            crud.update(token)
-        with sql.crud.Snippet(session, token) as crud:
-            snippet = crud.delete_by_id(id)
+    async with sql.database.AsyncSession() as session:
+        if not (identity := await sql.tokens.cache.authenticate(session, auth_token)):
+            raise fastapi.HTTPException(401)
+        async with sql.async_crud.Snippet(session, identity) as crud:
+            snippet = await crud.delete_by_id(id)
         if not snippet:
             raise fastapi.HTTPException(404)
+        server.invalidate(snippet.id)
         return snippet
@@ -1,18 +1,137 @@
 from typing import *
-from pydantic import BaseModel
+from pydantic import BaseModel, confloat, conint, conlist, constr, root_validator
 import uuid
+from sql import models
+from .snippet import supported_languages
 
 
 class ProcessBase(BaseModel):
     id: uuid.UUID
 
 
+class Case(BaseModel):
+    # property no detected by pycharm inspection
+    # noinspection PyUnresolvedReferences
+    args: constr(max_length=models.Snippet.args.property.columns[0].type.length) = ""
+    stdin: Optional[constr(max_length=64 * 1024)]
+    expected: Optional[constr(max_length=64 * 1024)]
+    # seconds, the client limits every case to 10 seconds and all cases together to 30 seconds
+    timeout: Optional[confloat(gt=0, le=10)]
+
+
+class Benchmark(BaseModel):
+    # timed runs, fewer are run if they do not fit in the 30 seconds of a process
+    iterations: conint(ge=1, le=1000) = 10
+    # untimed runs before the timed runs
+    warmup: conint(ge=0, le=100) = 1
+
+
 class ProcessData(ProcessBase):
-    pass
+    # runs the snippet once per case with the args of the case instead of the args of the snippet
+    cases: Optional[conlist(Case, min_items=1, max_items=100)]
+    # builds the snippet once and runs it repeatedly to time it
+    benchmark: Optional[Benchmark]
 
+    @root_validator(skip_on_failure=True)
+    def cases_or_benchmark(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        if values.get("cases") and values.get("benchmark"):
+            raise ValueError("a snippet can not be run with both cases and a benchmark.")
+        return values
 
-class ProcessResponse(BaseModel):
+
+class CaseResponse(BaseModel):
     status: int
     stdout: Optional[str]
     stderr: Optional[str]
     ns: int
+    stdout_bytes: int
+    stderr_bytes: int
+    stdout_truncated: bool = False
+    stderr_truncated: bool = False
+    returncode: Optional[int]
+    user_ns: Optional[int]
+    sys_ns: Optional[int]
+    max_rss: Optional[int]
+    # None if the case has no expected output
+    passed: Optional[bool]
+
+
+class BenchmarkResponse(BaseModel):
+    iterations: int
+    warmup: int
+    min_ns: int
+    median_ns: int
+    # nearest rank 95th percentile
+    p95_ns: int
+    mean_ns: int
+    stddev_ns: int
+    # mean cpu time of a run
+    user_ns: Optional[int]
+    sys_ns: Optional[int]
+    samples: List[int]
+
+
+class StepResponse(BaseModel):
+    command: str
+    ns: int
+    returncode: int
+    user_ns: Optional[int]
+    sys_ns: Optional[int]
+    max_rss: Optional[int]
+
+
+class ProcessResponse(BaseModel):
+    status: int
+    stdout: Optional[str]
+    stderr: Optional[str]
+    ns: Optional[int]
+    stdout_bytes: Optional[int]
+    stderr_bytes: Optional[int]
+    stdout_truncated: bool = False
+    stderr_truncated: bool = False
+    cached: bool = False
+    cases: Optional[List[CaseResponse]]
+    # nanoseconds the client spent in each phase, setup, compile and run
+    phases: Optional[Dict[str, int]]
+    # exit code, cpu time and peak memory in bytes of the program
+    returncode: Optional[int]
+    user_ns: Optional[int]
+    sys_ns: Optional[int]
+    max_rss: Optional[int]
+    # every command run for the request, the build commands followed by the program
+    steps: Optional[List[StepResponse]]
+    benchmark: Optional[BenchmarkResponse]
+
+
+class BatchJob(BaseModel):
+    # either the id of a stored snippet or inline code
+    id: Optional[uuid.UUID]
+    language: Optional[supported_languages]
+    # property not detected by pycharm inspection
+    # noinspection PyUnresolvedReferences
+    code: Optional[constr(max_length=models.Snippet.code.property.columns[0].type.length)]
+    # property no detected by pycharm inspection
+    # noinspection PyUnresolvedReferences
+    args: constr(max_length=models.Snippet.args.property.columns[0].type.length) = ""
+
+    @root_validator(skip_on_failure=True)
+    def snippet_or_code(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        if values.get("id") is None and (values.get("language") is None or values.get("code") is None):
+            raise ValueError("a job needs either the id of a snippet or a language and code.")
+        return values
+
+
+class BatchData(BaseModel):
+    jobs: conlist(BatchJob, min_items=1, max_items=50)
+    # stream the results as newline delimited json as they complete
+    stream: bool = False
+
+
+class BatchResult(ProcessResponse):
+    # the position of the job in the batch
+    index: int
+    retry_after: Optional[int]
+
+
+class BatchResponse(BaseModel):
+    results: List[BatchResult]
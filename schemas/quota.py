@@ -5,6 +5,8 @@ from pydantic import BaseModel
 class QuotaBase(BaseModel):
     cap: int
     current: int
+    output_limit: int
+    tier: int
     next_refresh: datetime.datetime
 
 
@@ -14,6 +14,7 @@ class SnippetBase(BaseModel):
     # property no detected by pycharm inspection
     # noinspection PyUnresolvedReferences
     args: constr(max_length=models.Snippet.args.property.columns[0].type.length)
+    deterministic: bool = False
 
 
 class SnippetData(SnippetBase):
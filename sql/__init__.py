@@ -1,7 +1,11 @@
 from . import database
 from . import models
 from . import crud
+from . import async_crud
+from . import tokens
+from . import passwords
+from . import rate_limit
 from . import raw
 from . import errors
 
-__all__ = ["models", "database", "crud", "raw", "errors"]
+__all__ = ["models", "database", "crud", "async_crud", "tokens", "passwords", "rate_limit", "raw", "errors"]
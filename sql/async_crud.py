@@ -0,0 +1,218 @@
+from typing import *
+import uuid
+import datetime
+from sqlalchemy import exc, select, update, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from . import models
+import schemas
+from . import errors
+from fastapi.security import OAuth2PasswordRequestForm
+if TYPE_CHECKING:
+    from .tokens import Identity
+
+
+class Crud:
+    """
+    async version of crud.Crud.
+
+    passwords are hashed by the caller with passwords.hasher so the hashing does not block the event loop.
+
+    relationships can not be lazily loaded in async code so every relationship
+    the routers use is loaded together with the row.
+
+    token is the token of the authenticated user, either a row or a cached identity.
+    """
+    session: AsyncSession
+    token: Optional[Union[models.Token, "Identity"]]
+
+    def __init__(self, session: AsyncSession, token: Optional[Union[models.Token, "Identity"]] = None) -> None:
+        self.session = session
+        self.token = token
+
+    async def __aenter__(self) -> "Crud":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class User(Crud):
+    options = (selectinload(models.User.token), selectinload(models.User.quota))
+
+    async def get_by_id(self, id: uuid.UUID) -> Optional[models.User]:
+        return await self.session.scalar(
+            select(models.User).options(*self.options).filter(models.User.id == id)
+        )
+
+    async def get_by_email(self, email: str) -> Optional[models.User]:
+        return await self.session.scalar(
+            select(models.User).options(*self.options).filter(models.User.email == email)
+        )
+
+    async def create(self, user: OAuth2PasswordRequestForm, password_hash: str) -> models.User:
+        db_user = models.User(
+            email=user.username, password_hash=password_hash, token=None, quota=None
+        )
+        try:
+            self.session.add(db_user)
+            await self.session.commit()
+        except exc.IntegrityError:
+            await self.session.rollback()
+            raise errors.DuplicateEmail(user.username)
+        await self.session.refresh(db_user, ["id"])
+        return db_user
+
+    async def update_by_id(self, id: uuid.UUID, user: schemas.user.UserAuthData,
+                           password_hash: str) -> Optional[models.User]:
+        db_user = await self.get_by_id(id)
+        if not db_user or self.token != db_user.token:
+            return
+        try:
+            db_user.email = user.email
+            db_user.password_hash = password_hash
+            await self.session.commit()
+        except exc.IntegrityError:
+            await self.session.rollback()
+            raise errors.DuplicateEmail(user.email)
+        return db_user
+
+    async def update_password_hash(self, user: models.User, password_hash: str) -> None:
+        user.password_hash = password_hash
+        await self.session.commit()
+
+    async def delete_by_id(self, id: uuid.UUID) -> Optional[models.User]:
+        db_user = await self.get_by_id(id)
+        if not db_user or self.token != db_user.token:
+            return
+        await self.session.delete(db_user)
+        await self.session.commit()
+        return db_user
+
+
+class Token(Crud):
+    options = (selectinload(models.Token.user).selectinload(models.User.quota),)
+
+    async def get_by_id(self, id: int) -> Optional[models.Token]:
+        return await self.session.scalar(
+            select(models.Token).options(*self.options).filter(models.Token.id == id)
+        )
+
+    async def get_by_access_token(self, access_token: str) -> Optional[models.Token]:
+        return await self.session.scalar(
+            select(models.Token).options(*self.options).filter(models.Token.access_token == access_token)
+        )
+
+    async def create(self, user: models.User) -> None:
+        if user.token:
+            return await self.update(user.token)
+        token = models.Token(user=user)
+        self.session.add(token)
+        await self.session.commit()
+        await self.session.refresh(token, ["id", "access_token", "expires"])
+
+    async def update(self, token: schemas.token.Token) -> None:
+        await self.session.execute(text("select update_expiration_of_row(:id);"), {"id": token.id})
+        await self.session.commit()
+        await self.session.refresh(token, ["expires"])
+
+    async def extend(self, id: int) -> Optional[datetime.datetime]:
+        """
+        slides the expiration of a token in a single statement.
+
+        returns the new expiration or None if the token does not exist.
+        """
+        expires = await self.session.scalar(
+            update(models.Token).where(models.Token.id == id)
+            .values(expires=text("now() + interval '1h'"))
+            .returning(models.Token.expires)
+        )
+        await self.session.commit()
+        return expires
+
+    async def delete_by_id(self, id: int) -> Optional[models.Token]:
+        db_token = await self.get_by_id(id)
+        if not db_token:
+            return
+        await self.session.delete(db_token)
+        await self.session.commit()
+        return db_token
+
+    async def delete_by_value(self, access_token: str) -> Optional[models.Token]:
+        db_token = await self.get_by_access_token(access_token)
+        if not db_token:
+            return
+        await self.session.delete(db_token)
+        await self.session.commit()
+        return db_token
+
+
+class Quota(Crud):
+    async def get_by_id(self, id: int) -> Optional[models.Quota]:
+        return await self.session.scalar(select(models.Quota).filter(models.Quota.id == id))
+
+    async def create(self, user: models.User) -> None:
+        if user.quota:
+            return
+        quota = models.Quota(user=user)
+        self.session.add(quota)
+        await self.session.commit()
+        await self.session.refresh(quota, ["id", "cap", "current", "output_limit", "tier", "next_refresh"])
+
+    async def update(self, quota: models.Quota) -> None:
+        pass
+
+    async def delete_by_id(self, id: int) -> Optional[models.Quota]:
+        db_quota = await self.get_by_id(id)
+        if not db_quota:
+            return
+        await self.session.delete(db_quota)
+        await self.session.commit()
+        return db_quota
+
+
+class Snippet(Crud):
+    async def get_by_id(self, id: uuid.UUID) -> Optional[models.Snippet]:
+        return await self.session.scalar(select(models.Snippet).filter(models.Snippet.id == id))
+
+    async def get_by_ids(self, ids: Iterable[uuid.UUID]) -> List[models.Snippet]:
+        """
+        the snippets with any of the ids in a single query, missing snippets are left out.
+        """
+        return list(await self.session.scalars(select(models.Snippet).filter(models.Snippet.id.in_(list(ids)))))
+
+    async def create(self, user_id: uuid.UUID, snippet: schemas.snippet.SnippetData) -> models.Snippet:
+        db_snippet = models.Snippet(
+            **snippet.dict(),
+            user_id=user_id
+        )
+        try:
+            self.session.add(db_snippet)
+            await self.session.commit()
+        except exc.IntegrityError:
+            # the slim chance that there is a duplicate uuid
+            # retry once
+            await self.session.rollback()
+            self.session.add(db_snippet)
+            await self.session.commit()
+        await self.session.refresh(db_snippet, ["id"])
+        return db_snippet
+
+    async def update_by_id(self, id: uuid.UUID, snippet: schemas.snippet.SnippetData) -> Optional[models.Snippet]:
+        db_snippet = await self.get_by_id(id)
+        if not db_snippet or not self.token or self.token.user_id != db_snippet.user_id:
+            return
+        db_snippet.language = snippet.language
+        db_snippet.code = snippet.code
+        db_snippet.args = snippet.args
+        db_snippet.deterministic = snippet.deterministic
+        await self.session.commit()
+        return db_snippet
+
+    async def delete_by_id(self, id: uuid.UUID) -> Optional[models.Snippet]:
+        db_snippet = await self.get_by_id(id)
+        if not db_snippet:
+            return
+        await self.session.delete(db_snippet)
+        await self.session.commit()
+        return db_snippet
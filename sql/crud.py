@@ -172,6 +172,7 @@ class Snippet(Crud):
         db_snippet.language = snippet.language
         db_snippet.code = snippet.code
         db_snippet.args = snippet.args
+        db_snippet.deterministic = snippet.deterministic
         self.session.commit()
         self.session.refresh(db_snippet)
         return db_snippet
@@ -1,7 +1,10 @@
 import json
+from typing import *
 from urllib.parse import quote_plus
 from pathlib import Path
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.asyncio import AsyncSession as _AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -13,9 +16,85 @@ SQLALCHEMY_DATABASE_URL = (
     f"postgresql://{quote_plus(cred['role'])}:{quote_plus(cred['password'])}@"
     f"{cred['host']}:{cred['port']}/{quote_plus(cred['db'])}"
 )
+ASYNC_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
 
+# the pool of the async engine can be tuned in the credentials file
+POOL_SIZE = cred.get("pool_size", 10)
+MAX_OVERFLOW = cred.get("max_overflow", 10)
+# seconds to wait for a connection from a full pool
+POOL_TIMEOUT = cred.get("pool_timeout", 5)
+# milliseconds a statement may run before postgres cancels it
+STATEMENT_TIMEOUT = cred.get("statement_timeout", 5000)
+# bearer token of the internal metrics endpoints of app.py, they are disabled without one
+METRICS_TOKEN: Optional[str] = cred.get("metrics_token")
+
+# the sync engine is only used by the db commands of main.py
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
+    pool_pre_ping=True,
+    # connections are recycled before postgres or a proxy closes them
+    pool_recycle=1800,
+    connect_args={
+        "server_settings": {"statement_timeout": str(STATEMENT_TIMEOUT)},
+        # the client side timeout is a fallback for when the server does not answer at all
+        "command_timeout": STATEMENT_TIMEOUT / 1000 * 2
+    }
+)
+
 Base = declarative_base()
 
 Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# objects are not expired on commit since expired attributes can not be lazily loaded in async code
+AsyncSession = sessionmaker(async_engine, class_=_AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+class PoolMetrics:
+    """
+    counts the events of the connection pool of the async engine.
+    """
+    connects: int
+    checkouts: int
+    invalidated: int
+
+    def __init__(self) -> None:
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidated = 0
+
+    def connect(self, *_) -> None:
+        self.connects += 1
+
+    def checkout(self, *_) -> None:
+        self.checkouts += 1
+
+    def invalidate(self, *_) -> None:
+        self.invalidated += 1
+
+
+pool_metrics = PoolMetrics()
+event.listen(async_engine.sync_engine.pool, "connect", pool_metrics.connect)
+event.listen(async_engine.sync_engine.pool, "checkout", pool_metrics.checkout)
+event.listen(async_engine.sync_engine.pool, "invalidate", pool_metrics.invalidate)
+
+
+def pool_status() -> Dict[str, Any]:
+    """
+    the state of the connection pool of the async engine as a json serializable dictionary.
+    """
+    pool = async_engine.sync_engine.pool
+    return {
+        "size": pool.size(),
+        "max_overflow": MAX_OVERFLOW,
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "connects": pool_metrics.connects,
+        "checkouts": pool_metrics.checkouts,
+        "invalidated": pool_metrics.invalidated
+    }
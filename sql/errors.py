@@ -12,3 +12,10 @@ class DuplicateEmail(IgnitionException):
             "email": email, "message": f"{email} is already in use."
         }
 
+
+class HasherBusy(IgnitionException):
+    def __init__(self) -> None:
+        super().__init__(2)
+        self.details = self.details | {
+            "message": "too many passwords are being hashed. try again later."
+        }
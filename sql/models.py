@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, String, Integer, TIMESTAMP
+from sqlalchemy import Column, ForeignKey, String, Integer, Boolean, TIMESTAMP
 from sqlalchemy.orm import relationship
 from .database import Base
 from sqlalchemy.dialects.postgresql import UUID
@@ -22,9 +22,17 @@ class Quota(Base):
     id = Column(Integer, autoincrement=True, primary_key=True)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, unique=True)
 
+    # requests per hour, enforced as a token bucket holding cap requests, see sql.rate_limit
     cap = Column(Integer, default=60, nullable=False)
+    # requests used of the cap when the bucket was last written
     current = Column(Integer, default=0, nullable=False)
-    next_refresh = Column(TIMESTAMP(), server_default=text("now() + interval '1h'"))
+    # max bytes of stdout and stderr kept per process
+    # databases created before the column existed get it from sql.raw.upgrade (main.py db upgrade)
+    output_limit = Column(Integer, default=1024 * 1024, server_default=text(str(1024 * 1024)), nullable=False)
+    # priority class of the users requests, higher tiers are started first when the server is busy
+    tier = Column(Integer, default=0, server_default=text("0"), nullable=False)
+    # next_refresh is when the bucket is full again, a new user starts with a full bucket
+    next_refresh = Column(TIMESTAMP(), server_default=text("now()"))
 
     user = relationship("User", back_populates="quota", uselist=False)
 
@@ -50,5 +58,7 @@ class Snippet(Base):
     language = Column(String(32), nullable=False)
     code = Column(String(10_000), nullable=False)
     args = Column(String(1_000), nullable=False)
+    # deterministic snippets always produce the same output so their results can be memoized
+    deterministic = Column(Boolean, default=False, server_default=text("false"), nullable=False)
 
     user = relationship("User", back_populates="snippets")
@@ -0,0 +1,146 @@
+from typing import *
+import os
+import asyncio
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+# noinspection PyPackageRequirements
+from argon2 import PasswordHasher
+# noinspection PyPackageRequirements
+from argon2.exceptions import VerificationError, InvalidHash
+from ignition.common.metrics import Histogram
+from . import errors
+from .database import cred
+
+
+def verify(hasher: PasswordHasher, password_hash: str, password: str) -> Tuple[bool, Optional[str]]:
+    """
+    verifies a password against its hash.
+
+    returns if the password matched and a new hash of the password if the hash
+    was made with other parameters than the hasher uses.
+    """
+    try:
+        hasher.verify(password_hash, password)
+    except (VerificationError, InvalidHash):
+        return False, None
+    return True, hasher.hash(password) if hasher.check_needs_rehash(password_hash) else None
+
+
+class Hasher:
+    """
+    hashes and verifies passwords without blocking the event loop.
+
+    argon2 is made to be expensive in both cpu time and memory so every hash runs in a bounded
+    thread pool of max_workers threads. argon2-cffi releases the gil while hashing so the threads
+    hash in parallel without the cost of sending the passwords to other processes.
+
+    at most max_pending hashes wait for a thread, more raise errors.HasherBusy.
+    the time hashes wait for a thread and the time they take are observed in histograms.
+
+    time_cost, memory_cost (kibibytes) and parallelism are the argon2 parameters of new hashes.
+    parameters that are not given are the defaults of PasswordHasher, the same as the hashes of sql.crud.
+    a password whose hash was made with other parameters is rehashed when it is verified.
+    """
+    parameters: PasswordHasher
+    max_workers: int
+    max_pending: int
+    executor: Optional[ThreadPoolExecutor]
+    semaphore: Optional[asyncio.Semaphore]
+
+    pending: int
+    running: int
+    rejected: int
+    waits: Histogram
+    durations: Histogram
+
+    def __init__(self, max_workers: Optional[int] = None,
+                 max_pending: int = 64,
+                 time_cost: Optional[int] = None,
+                 memory_cost: Optional[int] = None,
+                 parallelism: Optional[int] = None) -> None:
+        self.parameters = PasswordHasher(**{name: value for name, value in (
+            ("time_cost", time_cost), ("memory_cost", memory_cost), ("parallelism", parallelism)
+        ) if value is not None})
+        # every hash holds memory_cost of memory while it runs
+        self.max_workers = max_workers if max_workers else max(1, (os.cpu_count() or 1) // 2)
+        self.max_pending = max_pending
+        self.executor = None
+        self.semaphore = None
+
+        self.pending = 0
+        self.running = 0
+        self.rejected = 0
+        self.waits = Histogram((0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+        self.durations = Histogram((0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+
+    def __repr__(self) -> str:
+        return (
+            f"<Hasher running: {self.running} / {self.max_workers} "
+            f"pending: {self.pending} / {self.max_pending} rejected: {self.rejected}>"
+        )
+
+    async def hash(self, password: str) -> str:
+        """
+        hashes a password.
+        """
+        return await self._run(self.parameters.hash, password)
+
+    async def verify(self, password_hash: str, password: str) -> Tuple[bool, Optional[str]]:
+        """
+        verifies a password against its hash.
+
+        returns if the password matched and a new hash of the password to store
+        if its hash was made with outdated parameters.
+        """
+        return await self._run(verify, self.parameters, password_hash, password)
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        the state of the hasher as a json serializable dictionary.
+        """
+        return {
+            "running": self.running,
+            "max_workers": self.max_workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "wait": self.waits.snapshot(),
+            "duration": self.durations.snapshot()
+        }
+
+    def close(self) -> None:
+        """
+        shuts down the threads without waiting for running hashes.
+        """
+        if self.executor:
+            self.executor.shutdown(wait=False)
+
+    async def _run(self, function: Callable[..., Any], *args: Any) -> Any:
+        """
+        runs a hash in the thread pool once a thread is free.
+        """
+        if not self.executor:
+            # created on first use so the semaphore belongs to the running event loop
+            self.executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="ignition-hasher")
+            self.semaphore = asyncio.Semaphore(self.max_workers)
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise errors.HasherBusy()
+        enqueued = perf_counter()
+        self.pending += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.pending -= 1
+        started = perf_counter()
+        self.waits.observe(started - enqueued)
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        finally:
+            self.running -= 1
+            self.semaphore.release()
+            self.durations.observe(perf_counter() - started)
+
+
+hasher = Hasher(**cred.get("argon2", {}))
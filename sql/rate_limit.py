@@ -0,0 +1,222 @@
+from typing import *
+import uuid
+import asyncio
+import logging
+import datetime
+from time import monotonic
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.types import Integer
+from ignition.logger import get_logger
+from . import database
+from .tokens import Quota
+
+
+logger = get_logger(__name__, logging.WARNING, stdout=True)
+
+
+# consumes the requests of many users at once in a single statement.
+# next_refresh is the time the bucket of the user is full again so consuming a request
+# pushes it forward by the time it takes to refill one request.
+consume = text(
+    """
+    update quota set
+        next_refresh = greatest(quota.next_refresh, localtimestamp)
+            + consumed.used * interval '1 hour' / greatest(quota.cap, 1),
+        current = least(quota.cap, ceil(extract(epoch from
+            greatest(quota.next_refresh, localtimestamp)
+            + consumed.used * interval '1 hour' / greatest(quota.cap, 1)
+            - localtimestamp
+        ) * greatest(quota.cap, 1) / 3600))::integer
+    from (select unnest(:users) as user_id, unnest(:used) as used) as consumed
+    where quota.user_id = consumed.user_id
+    returning quota.user_id, quota.next_refresh;
+    """
+).bindparams(
+    bindparam("users", type_=ARRAY(UUID(as_uuid=True))),
+    bindparam("used", type_=ARRAY(Integer))
+)
+
+
+class Decision(NamedTuple):
+    """
+    the outcome of taking a request from a bucket.
+
+    remaining is the amount of whole requests left, reset the seconds until the bucket is full
+    and retry_after the seconds until the next request is allowed.
+    """
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: float
+    retry_after: float
+
+    def headers(self) -> Dict[str, str]:
+        """
+        the rate limit headers of a response.
+        """
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(int(self.reset + 0.999))
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(int(self.retry_after + 0.999))
+        return headers
+
+
+class Bucket:
+    """
+    the token bucket of a user.
+
+    holds up to cap requests and refills cap requests per hour.
+    used is the amount of requests taken since the bucket was last written to the database.
+    """
+    cap: int
+    tokens: float
+    updated: float
+    used: int
+
+    def __init__(self, cap: int, tokens: float) -> None:
+        self.cap = cap
+        self.tokens = tokens
+        self.updated = monotonic()
+        self.used = 0
+
+    def rate(self) -> float:
+        """
+        requests refilled per second.
+        """
+        return max(self.cap, 1) / 3600
+
+    def refill(self) -> None:
+        now = monotonic()
+        self.tokens = min(self.cap, self.tokens + (now - self.updated) * self.rate())
+        self.updated = now
+
+
+class RateLimiter:
+    """
+    limits the requests of every user to the cap of their quota per hour.
+
+    the limit is a token bucket per user kept in memory so a request is decided without the database.
+    a bucket is created from the quota read together with the access token.
+
+    every interval seconds the requests taken since the last time are written to the quota table
+    with a single atomic update for all users. the update returns the state of the buckets
+    including the requests of other http workers which the buckets here are lowered to.
+    across workers a user can therefore exceed the cap by what the other workers allowed in one interval.
+
+    full buckets without unwritten requests are forgotten.
+    users without a quota get default_cap requests per hour.
+    """
+    interval: float
+    default_cap: int
+    buckets: Dict[uuid.UUID, Bucket]
+    task: Optional["asyncio.Task[None]"]
+    allowed: int
+    limited: int
+
+    def __init__(self, interval: float = 1, default_cap: int = 60) -> None:
+        self.interval = interval
+        self.default_cap = default_cap
+        self.buckets = {}
+        self.task = None
+        self.allowed = 0
+        self.limited = 0
+
+    def __repr__(self) -> str:
+        return f"<RateLimiter buckets: {len(self.buckets)} allowed: {self.allowed} limited: {self.limited}>"
+
+    def take(self, user_id: uuid.UUID, quota: Optional[Quota], count: int = 1) -> Decision:
+        """
+        takes count requests from the bucket of a user, either all of them or none.
+        """
+        if not (bucket := self.buckets.get(user_id)):
+            bucket = self.buckets[user_id] = self._bucket(quota)
+            if not self.task:
+                self.task = asyncio.get_running_loop().create_task(self.run())
+        bucket.refill()
+        if bucket.tokens >= count:
+            bucket.tokens -= count
+            bucket.used += count
+            self.allowed += count
+            allowed = True
+        else:
+            self.limited += count
+            allowed = False
+        return Decision(
+            allowed, bucket.cap, int(bucket.tokens),
+            (bucket.cap - bucket.tokens) / bucket.rate(),
+            max(0.0, (count - bucket.tokens) / bucket.rate())
+        )
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        the state of the rate limiter as a json serializable dictionary.
+        """
+        return {
+            "buckets": len(self.buckets),
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "unwritten": sum(bucket.used for bucket in self.buckets.values())
+        }
+
+    async def run(self) -> None:
+        """
+        writes the taken requests to the database every interval seconds.
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"failed to write the rate limits to the database: {e!r}")
+
+    async def flush(self) -> None:
+        """
+        writes the requests taken since the last flush to the database and syncs the buckets with it.
+        """
+        used = {user_id: bucket.used for user_id, bucket in self.buckets.items() if bucket.used}
+        for user_id, bucket in list(self.buckets.items()):
+            bucket.refill()
+            if not bucket.used and bucket.tokens >= bucket.cap:
+                del self.buckets[user_id]
+            bucket.used = 0
+        if not used:
+            return
+        try:
+            async with database.AsyncSession() as session:
+                rows = (await session.execute(consume, {"users": list(used), "used": list(used.values())})).all()
+                await session.commit()
+        except BaseException:
+            # written again with the next flush
+            for user_id, count in used.items():
+                if bucket := self.buckets.get(user_id):
+                    bucket.used += count
+            raise
+        now = datetime.datetime.now()
+        for user_id, next_refresh in rows:
+            if bucket := self.buckets.get(user_id):
+                bucket.refill()
+                bucket.tokens = min(bucket.tokens, self._tokens(bucket.cap, next_refresh, now))
+
+    def _bucket(self, quota: Optional[Quota]) -> Bucket:
+        """
+        a bucket in the state of a quota.
+        """
+        if not quota or quota.cap is None:
+            return Bucket(self.default_cap, self.default_cap)
+        return Bucket(quota.cap, self._tokens(quota.cap, quota.next_refresh, datetime.datetime.now()))
+
+    @staticmethod
+    def _tokens(cap: int, next_refresh: Optional[datetime.datetime], now: datetime.datetime) -> float:
+        """
+        the requests left in a bucket that is full at next_refresh.
+        """
+        if not next_refresh or next_refresh <= now:
+            return cap
+        return max(0.0, cap - (next_refresh - now).total_seconds() * max(cap, 1) / 3600)
+
+
+limiter = RateLimiter()
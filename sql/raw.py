@@ -36,3 +36,13 @@ init = (
     alter table tokens alter column access_token set default gen_token();
     """
 )
+
+# adds the columns create_all does not add to the tables of an existing database.
+# every statement can be run again on a database that is already up to date.
+upgrade = (
+    f"""
+    alter table quota add column if not exists output_limit integer not null default {1024 * 1024};
+    alter table quota add column if not exists tier integer not null default 0;
+    alter table snippets add column if not exists deterministic boolean not null default false;
+    """
+)
@@ -0,0 +1,149 @@
+from typing import *
+import time
+import uuid
+import datetime
+from collections import OrderedDict
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import async_crud
+
+
+class Quota(NamedTuple):
+    """
+    the parts of a users quota the routers need to run a request.
+    """
+    output_limit: Optional[int]
+    tier: Optional[int]
+    cap: Optional[int]
+    next_refresh: Optional[datetime.datetime]
+
+
+class Identity(NamedTuple):
+    """
+    an authenticated access token.
+
+    cached is the monotonic time the token was read from the database.
+    """
+    token_id: int
+    user_id: uuid.UUID
+    expires: datetime.datetime
+    quota: Optional[Quota]
+    cached: float
+
+
+class TokenCache:
+    """
+    bounded lru cache of access tokens so an authenticated request does not need a database round trip.
+
+    a token is read from the database at most once every ttl seconds. a token that is logged out or deleted
+    through another http worker is therefore accepted by this worker for at most ttl seconds.
+
+    the expiration of a token slides on use. it is only written when less than refresh_below of its
+    lifetime remains so a user sending many requests causes a single write every few minutes.
+    concurrent requests of a token share that write.
+    """
+    max_size: int
+    ttl: float
+    refresh_below: datetime.timedelta
+
+    entries: "OrderedDict[str, Identity]"
+    refreshing: Set[str]
+    hits: int
+    misses: int
+    writes: int
+
+    def __init__(self, max_size: int = 10_000, ttl: float = 30,
+                 refresh_below: datetime.timedelta = datetime.timedelta(minutes=50)) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.refresh_below = refresh_below
+
+        self.entries = OrderedDict()
+        self.refreshing = set()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def __repr__(self) -> str:
+        return f"<TokenCache size: {len(self.entries)} / {self.max_size} hits: {self.hits} misses: {self.misses}>"
+
+    async def authenticate(self, session: AsyncSession, access_token: str) -> Optional[Identity]:
+        """
+        looks up the identity of a valid access token and slides its expiration.
+
+        returns None if the token does not exist or has expired.
+        """
+        identity = self._get(access_token)
+        if not identity:
+            self.misses += 1
+            async with async_crud.Token(session) as crud:
+                if not (token := await crud.get_by_access_token(access_token)):
+                    return None
+            quota = token.user.quota
+            identity = self._put(access_token, Identity(
+                token.id, token.user_id, token.expires,
+                Quota(quota.output_limit, quota.tier, quota.cap, quota.next_refresh) if quota else None,
+                time.monotonic()
+            ))
+        else:
+            self.hits += 1
+
+        now = datetime.datetime.now()
+        if identity.expires < now:
+            self.invalidate(access_token)
+            return None
+        if identity.expires - now < self.refresh_below and access_token not in self.refreshing:
+            self.refreshing.add(access_token)
+            try:
+                async with async_crud.Token(session) as crud:
+                    expires = await crud.extend(identity.token_id)
+                self.writes += 1
+            finally:
+                self.refreshing.discard(access_token)
+            if not expires:
+                self.invalidate(access_token)
+                return None
+            identity = self._put(access_token, identity._replace(expires=expires))
+        return identity
+
+    def invalidate(self, access_token: str) -> None:
+        """
+        forgets a token, for example after it was logged out.
+        """
+        self.entries.pop(access_token, None)
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        the state of the cache as a json serializable dictionary.
+        """
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes
+        }
+
+    def _get(self, access_token: str) -> Optional[Identity]:
+        """
+        the cached identity of a token if it has not outlived the ttl.
+        """
+        if not (identity := self.entries.get(access_token)):
+            return None
+        if time.monotonic() - identity.cached > self.ttl:
+            del self.entries[access_token]
+            return None
+        self.entries.move_to_end(access_token)
+        return identity
+
+    def _put(self, access_token: str, identity: Identity) -> Identity:
+        """
+        caches an identity and evicts the least recently used tokens beyond max_size.
+        """
+        self.entries[access_token] = identity
+        self.entries.move_to_end(access_token)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return identity
+
+
+cache = TokenCache()